@@ -2,6 +2,7 @@ import os
 import sys
 import logging
 import itertools
+import functools
 import numpy as np
 import argparse
 import math
@@ -746,6 +747,19 @@ class HaaLimits2D(HaaLimits):
         name = 'bg_{}_xy'.format(region)
         bg.build(workspace,name)
 
+    def initialValue(self,table,h,a,param,default):
+        '''The initial value of param for (h,a) from a GetInitial* table, default for points not in the table'''
+        return table.get('h{}a{}'.format(h,a),{}).get(param,default)
+
+    def warmStartScaled(self,param):
+        # the y parameters scale with h, which is the same along a chain, when y is the 4 body mass
+        if self.YRANGE[1]>100 and not param.endswith('_sigx'): return False
+        return super(HaaLimits2D,self).warmStartScaled(param)
+
+    def dcbFixMean(self,h,a):
+        '''The fixed mean of the DCB_Fix y model, where its y range (and integral) starts'''
+        return self.initialValue(self.GetInitialDCBMean(),h,a,'mean',0.8*h)
+
     def fitSignal(self,h,a,region,shift='',**kwargs):
         scale = kwargs.get('scale',1)
         if isinstance(scale,dict): scale = scale.get(self.SIGNAME.format(h=h,a=a),1)
@@ -758,7 +772,6 @@ class HaaLimits2D(HaaLimits):
         tag = kwargs.get('tag','{}{}'.format(region,'_'+shift if shift else ''))
 
         if self.YRANGE[1] > 100: 
-            if yFitFunc == "DCB_Fix": initialMeans = self.GetInitialDCBMean()
             if "DCB" in yFitFunc: initialValuesDCB = self.GetInitialValuesDCB(isKinFit=isKinFit)
             elif yFitFunc == "DG": initialValuesDG = self.GetInitialValuesDG(region=region)
         elif yFitFunc == "L": initialValuesL = self.GetInitialValuesDitau(isLandau=True)
@@ -767,6 +780,8 @@ class HaaLimits2D(HaaLimits):
         aval = self.aToFloat(a)
         thisxrange = [0.8*aval, 1.2*aval]
         thisyrange = [0.15*h, 1.2*h] if self.YRANGE[1]>100 else [self.YRANGE[0], 1.2*aval]
+        # the range of the integral, a local copy since this may run in a worker process (see fitSignals)
+        yrange = list(self.YRANGE)
         if self.YRANGE[1]>100:
             thisyrange = [0.15*h, 1.2*h]
         ws = ROOT.RooWorkspace('sig')
@@ -811,23 +826,23 @@ class HaaLimits2D(HaaLimits):
                 modely = Models.DoubleCrystalBall('sigy',
                     x = self.YVAR,
                     mean  = [h,0,1.25*h],
-                    sigma = [initialValuesDCB["h"+str(h)+"a"+str(a)]["sigma"],0.05*h,0.5*h],
-                    a1    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["a1"],0.1,10],
-                    n1    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["n1"],1,30],
-                    a2    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["a2"],0.1,10],
-                    n2    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["n2"],0.1,30],
+                    sigma = [self.initialValue(initialValuesDCB,h,a,'sigma',0.1*h),0.05*h,0.5*h],
+                    a1    = [self.initialValue(initialValuesDCB,h,a,'a1',2.0),0.1,10],
+                    n1    = [self.initialValue(initialValuesDCB,h,a,'n1',5.0),1,30],
+                    a2    = [self.initialValue(initialValuesDCB,h,a,'a2',1.2),0.1,10],
+                    n2    = [self.initialValue(initialValuesDCB,h,a,'n2',4.0),0.1,30],
                 )
             elif yFitFunc == "DCB_Fix":
-                MEAN = initialMeans["h"+str(h)+"a"+str(a)]["mean"]
-                self.YRANGE[0] = MEAN
+                MEAN = self.dcbFixMean(h,a)
+                yrange[0] = MEAN
                 modely = Models.DoubleCrystalBall('sigy',
                     x = self.YVAR,
                     mean  = [MEAN, MEAN-2, MEAN+2],
-                    sigma = [initialValuesDCB["h"+str(h)+"a"+str(a)]["sigma"],0.05*h,0.5*h],
-                    a1    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["a1"],0.1,10],
-                    n1    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["n1"],1,20],
-                    a2    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["a2"],0.1,10],
-                    n2    = [initialValuesDCB["h"+str(h)+"a"+str(a)]["n2"],0.1,5],
+                    sigma = [self.initialValue(initialValuesDCB,h,a,'sigma',0.1*h),0.05*h,0.5*h],
+                    a1    = [self.initialValue(initialValuesDCB,h,a,'a1',2.0),0.1,10],
+                    n1    = [self.initialValue(initialValuesDCB,h,a,'n1',5.0),1,20],
+                    a2    = [self.initialValue(initialValuesDCB,h,a,'a2',1.2),0.1,10],
+                    n2    = [self.initialValue(initialValuesDCB,h,a,'n2',4.0),0.1,5],
                 )
             elif yFitFunc == "DG":
                 modely = Models.DoubleSidedGaussian('sigy',
@@ -835,9 +850,9 @@ class HaaLimits2D(HaaLimits):
                     #mean  = [h,0,1.25*h],
                     #sigma1 = [0.1*h,0.05*h,0.5*h],
                     #sigma2 = [0.2*h,0.05*h,0.5*h],
-                    mean    = [initialValuesDG["h"+str(h)+"a"+str(a)]["mean"],0,1.1*h],
-                    sigma1  = [initialValuesDG["h"+str(h)+"a"+str(a)]["sigma1"],0.05*h,0.5*h],
-                    sigma2  = [initialValuesDG["h"+str(h)+"a"+str(a)]["sigma2"],0.05*h,0.5*h],
+                    mean    = [self.initialValue(initialValuesDG,h,a,'mean',0.75*h),0,1.1*h],
+                    sigma1  = [self.initialValue(initialValuesDG,h,a,'sigma1',0.12*h),0.05*h,0.5*h],
+                    sigma2  = [self.initialValue(initialValuesDG,h,a,'sigma2',0.1*h),0.05*h,0.5*h],
                     yMax = self.YRANGE[1],
                 )
             elif yFitFunc == "DV":
@@ -933,9 +948,9 @@ class HaaLimits2D(HaaLimits):
             elif yFitFunc == "V":
                 modely = Models.Voigtian('sigy',
                     x = self.YVAR,
-                    mean  = [initialValuesV["h"+str(h)+"a"+str(a)]["mean_sigy"],0.75,30],
-                    width = [initialValuesV["h"+str(h)+"a"+str(a)]["width_sigy"],0.01,5],
-                    sigma = [initialValuesV["h"+str(h)+"a"+str(a)]["sigma_sigy"],0.01,5],
+                    mean  = [self.initialValue(initialValuesV,h,a,'mean_sigy',0.5*aval),0.75,30],
+                    width = [self.initialValue(initialValuesV,h,a,'width_sigy',0.1),0.01,5],
+                    sigma = [self.initialValue(initialValuesV,h,a,'sigma_sigy',0.1*aval),0.01,5],
                 )
             elif yFitFunc == "CB":
                 modely = Models.CrystalBall('sigy',
@@ -1011,15 +1026,15 @@ class HaaLimits2D(HaaLimits):
                 #)
                 ttland = Models.Landau('ttland',
                     x = self.YVAR,
-                    mu  = [initialValuesL["h"+str(h)+"a"+str(a)]["mu_ttland"],0.1*aval,0.7*aval],
-                    sigma = [initialValuesL["h"+str(h)+"a"+str(a)]["sigma_ttland"],0.01,aval],
+                    mu  = [self.initialValue(initialValuesL,h,a,'mu_ttland',0.3*aval),0.1*aval,0.7*aval],
+                    sigma = [self.initialValue(initialValuesL,h,a,'sigma_ttland',0.1*aval),0.01,aval],
                 )
                 ttland.build(ws,'ttland')
                 ttgaus = Models.Gaussian('ttgaus',
                    x = self.YVAR,
-                   mean  = [initialValuesL["h"+str(h)+"a"+str(a)]["mean_ttgaus"],0.1*aval,0.7*aval],
+                   mean  = [self.initialValue(initialValuesL,h,a,'mean_ttgaus',0.45*aval),0.1*aval,0.7*aval],
                    #mean  = [initialValuesL["h"+str(h)+"a"+str(a)]["mean_ttgaus"],0.2*initialValuesL["h"+str(h)+"a"+str(a)]["mean_ttgaus"],30],
-                   sigma = [initialValuesL["h"+str(h)+"a"+str(a)]["sigma_ttgaus"],0.01,aval],
+                   sigma = [self.initialValue(initialValuesL,h,a,'sigma_ttgaus',0.2*aval),0.01,aval],
                 )
                 ttgaus.build(ws,"ttgaus")
                 modely = Models.Prod('sigy',
@@ -1091,19 +1106,21 @@ class HaaLimits2D(HaaLimits):
                 ws.var(param).setVal(results[param])
         hist = histMap[self.SIGNAME.format(h=h,a=a)]
         saveDir = '{}/{}'.format(self.plotDir,shift if shift else 'central')
-        results, errors = model.fit2D(ws, hist, name, saveDir=saveDir, save=True, doErrors=True, xRange=[0.9*aval,1.1*aval])
+        results, errors = self.cachedFit(
+            lambda: model.fit2D(ws, hist, name, saveDir=saveDir, save=not self.SKIPPLOTS, doErrors=True, xRange=[0.9*aval,1.1*aval]),
+            'fitSignal', model, ws.pdf(name), hist, shift,
+        )
         if self.binned:
             integral = histMap[self.SIGNAME.format(h=h,a=a)].Integral() * scale
             integralerr = getHistogram2DIntegralError(histMap[self.SIGNAME.format(h=h,a=a)]) * scale
         else:
-            integral = histMap[self.SIGNAME.format(h=h,a=a)].sumEntries('{0}>{2} && {0}<{3} && {1}>{4} && {1}<{5}'.format(self.XVAR,self.YVAR,*self.XRANGE+self.YRANGE)) * scale
-            integralerr = getDatasetIntegralError(histMap[self.SIGNAME.format(h=h,a=a)],'{0}>{2} && {0}<{3} && {1}>{4} && {1}<{5}'.format(self.XVAR,self.YVAR,*self.XRANGE+self.YRANGE)) * scale
+            integral = histMap[self.SIGNAME.format(h=h,a=a)].sumEntries('{0}>{2} && {0}<{3} && {1}>{4} && {1}<{5}'.format(self.XVAR,self.YVAR,*self.XRANGE+yrange)) * scale
+            integralerr = getDatasetIntegralError(histMap[self.SIGNAME.format(h=h,a=a)],'{0}>{2} && {0}<{3} && {1}>{4} && {1}<{5}'.format(self.XVAR,self.YVAR,*self.XRANGE+yrange)) * scale
             if integral!=integral:
                 logging.error('Integral for spline is invalid: h{h} a{a} {region} {shift}'.format(h=h,a=a,region=region,shift=shift))
                 raise
     
         savedir = '{}/{}'.format(self.fitsDir,shift if shift else 'central')
-        python_mkdir(savedir)
         savename = '{}/h{}_a{}_{}.json'.format(savedir,h,a,tag)
         jsonData = {'vals': results, 'errs': errors, 'integrals': integral, 'integralerrs': integralerr}
         self.dump(savename,jsonData)
@@ -1116,7 +1133,12 @@ class HaaLimits2D(HaaLimits):
         Fit the signal model for a given Higgs mass.
         Required arguments:
             h = higgs mass
+        Optional arguments:
+            nworkers = number of processes to spread the (h,a) fits over
+            skipParams = only do the (h,a) fits, skipping the parameter fits (returned as {})
         '''
+        nworkers = kwargs.pop('nworkers',1)
+        skipParams = kwargs.pop('skipParams',False)
         ygausOnly = kwargs.get('ygausOnly',False)
         isKinFit = kwargs.get('isKinFit',False)
         yFitFunc = kwargs.get('yFitFunc','G')
@@ -1139,6 +1161,7 @@ class HaaLimits2D(HaaLimits):
             errors = {}
             integrals = {}
             integralerrs = {}
+            points = []
 
             for h in self.HMASSES:
                 results[h] = {}
@@ -1149,19 +1172,40 @@ class HaaLimits2D(HaaLimits):
                 amasses = self.HAMAP[h]
                 avals = [self.aToFloat(x) for x in amasses]
 
+                if self.WARMSTART and not (load or shift):
+                    # the a masses of an h are fit in order, so one task per h
+                    points += [(h,None,functools.partial(self.fitSignalChain,h,amasses,region,shift,**kwargs))]
+                    continue
+
                 for a in amasses:
                     if load or (shift and not skipFit):
-                        results[h][a], errors[h][a], integrals[h][a], integralerrs[h][a] = self.fitSignal(h,a,region,shift,results=cresults[h][a],**kwargs)
+                        points += [(h,a,functools.partial(self.fitSignal,h,a,region,shift,results=cresults[h][a],**kwargs))]
                     elif not skipFit:
-                        results[h][a], errors[h][a], integrals[h][a], integralerrs[h][a] = self.fitSignal(h,a,region,shift,**kwargs)
+                        points += [(h,a,functools.partial(self.fitSignal,h,a,region,shift,**kwargs))]
+
+            # the points are independent, so they can be spread over a process pool
+            fits = runTasks([p[2] for p in points],nworkers)
+            for (h,a,task), fit in zip(points,fits):
+                chain = fit if a is None else {a: fit}
+                for a in chain:
+                    results[h][a], errors[h][a], integrals[h][a], integralerrs[h][a] = chain[a]
+
+            # the DCB_Fix y range starts at the mean of the last fit point, set here rather than
+            # in fitSignal so that it does not depend on the fits running in this process
+            if yFitFunc == "DCB_Fix" and self.YRANGE[1]>100 and points:
+                h, a = points[-1][:2]
+                if a is None: a = sorted(self.HAMAP[h],key=self.aToFloat)[-1]
+                self.YRANGE = [self.dcbFixMean(h,a), self.YRANGE[1]]
 
     
         savedir = '{}/{}'.format(self.fitsDir,shift if shift else 'central')
-        python_mkdir(savedir)
         savename = '{}/{}.json'.format(savedir,tag)
         jsonData = {'vals': results, 'errs': errors, 'integrals': integrals, 'integralerrs': integralerrs}
         self.dump(savename,jsonData)
 
+        if skipParams:
+            return results, errors, integrals, integralerrs, {}
+
         fitFuncs = self.fitSignalParams(results,errors,integrals, integralerrs,region,shift,yFitFunc=yFitFunc)
 
         return results, errors, integrals, integralerrs, fitFuncs
@@ -1355,7 +1399,7 @@ class HaaLimits2D(HaaLimits):
             mg.GetYaxis().SetTitle(param)
             if self.doParamFit: fmg.Draw('L')
             legend.Draw()
-            canvas.Print('{}.png'.format(savename))
+            self.savePlot(canvas,'{}.png'.format(savename))
 
             if self.do2D:
                 savename = '{}/{}_Fit_vsH'.format(savedir,name)
@@ -1405,7 +1449,7 @@ class HaaLimits2D(HaaLimits):
                 mg.GetYaxis().SetTitle(param)
                 if self.doParamFit: fmg.Draw('L')
                 legend.Draw()
-                canvas.Print('{}.png'.format(savename))
+                self.savePlot(canvas,'{}.png'.format(savename))
 
 
         return fitFuncs
@@ -1473,40 +1517,41 @@ class HaaLimits2D(HaaLimits):
 
 
         if self.doParamFit:
-            for param in xparams+yparams+['integral']:
-                if self.do2D:
-                    name = '{param}_{splinename}_{region}'.format(param=param,splinename=self.SPLINENAME,region=region)
-                    spline = Models.Spline(name,
-                        MH = ['MH','MA'],
-                        masses = None,
-                        values = fitFuncs[''][param],
-                        shifts = {shift: {'up': fitFuncs[shift+'Up'][param], 'down': fitFuncs[shift+'Down'][param],} for shift in shifts},
-                    )
-                    spline.build(workspace, name)
-                    splines[name] = spline
-                else:
-                    for h in self.HMASSES:
-                        name = '{param}_{splinename}_{region}'.format(param=param,splinename=self.SPLINENAME.format(h=h),region=region)
-                        # here is using TF1
-                        #spline = Models.Spline(name,
-                        #    MH = 'MA',
-                        #    masses = None,
-                        #    values = fitFuncs[''][h][param],
-                        #    shifts = {shift: {'up': fitFuncs[shift+'Up'][h][param], 'down': fitFuncs[shift+'Down'][h][param],} for shift in shifts},
-                        #)
-                        # here is converting to a spline first
+            with self.importBatch('signal splines {}'.format(region)):
+                for param in xparams+yparams+['integral']:
+                    if self.do2D:
+                        name = '{param}_{splinename}_{region}'.format(param=param,splinename=self.SPLINENAME,region=region)
                         spline = Models.Spline(name,
-                            MH = 'MA',
-                            masses = amasses,
-                            values = self.fitToList(fitFuncs[''][h][param],amasses),
-                            shifts = {shift: 
-                                {
-                                    'up'  : self.fitToList(fitFuncs[shift+'Up'][h][param],amasses), 
-                                    'down': self.fitToList(fitFuncs[shift+'Down'][h][param],amasses),
-                                } for shift in shifts},
+                            MH = ['MH','MA'],
+                            masses = None,
+                            values = fitFuncs[''][param],
+                            shifts = {shift: {'up': fitFuncs[shift+'Up'][param], 'down': fitFuncs[shift+'Down'][param],} for shift in shifts},
                         )
                         spline.build(workspace, name)
                         splines[name] = spline
+                    else:
+                        for h in self.HMASSES:
+                            name = '{param}_{splinename}_{region}'.format(param=param,splinename=self.SPLINENAME.format(h=h),region=region)
+                            # here is using TF1
+                            #spline = Models.Spline(name,
+                            #    MH = 'MA',
+                            #    masses = None,
+                            #    values = fitFuncs[''][h][param],
+                            #    shifts = {shift: {'up': fitFuncs[shift+'Up'][h][param], 'down': fitFuncs[shift+'Down'][h][param],} for shift in shifts},
+                            #)
+                            # here is converting to a spline first
+                            spline = Models.Spline(name,
+                                MH = 'MA',
+                                masses = amasses,
+                                values = self.fitToList(fitFuncs[''][h][param],amasses),
+                                shifts = {shift: 
+                                    {
+                                        'up'  : self.fitToList(fitFuncs[shift+'Up'][h][param],amasses), 
+                                        'down': self.fitToList(fitFuncs[shift+'Down'][h][param],amasses),
+                                    } for shift in shifts},
+                            )
+                            spline.build(workspace, name)
+                            splines[name] = spline
 
             # create model
             if self.do2D:
@@ -1590,10 +1635,56 @@ class HaaLimits2D(HaaLimits):
 
                 return models
 
-        # create parameter splines
-        for param in xparams+yparams:
+        with self.importBatch('signal splines {}'.format(region)):
+            # create parameter splines
+            for param in xparams+yparams:
+                if self.do2D:
+                    name = '{param}_{region}'.format(param=param,region=region)
+                    paramMasses = [[],[]]
+                    paramValues = []
+                    paramShifts = {}
+                    for h in sorted(vals['']):
+                        for a in self.aSorted(vals[''][h]):
+                            paramMasses[0] += [h]
+                            paramMasses[1] += [self.aToFloat(a)]
+                            paramValues += [vals[''][h][a]['{param}_h{h}_a{a}_{region}'.format(param=param,h=h,a=a,region=region)]]
+                            for shift in shifts:
+                                if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
+                                paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a][param]]
+                                paramShifts[shift]['down'] += [vals[shift+'Down'][h][a][param]]
+                    spline = Models.Spline(name,
+                        MH = ['MH','MA'],
+                        masses = paramMasses,
+                        values = paramValues,
+                        shifts = paramShifts,
+                    )
+                    spline.build(workspace, name)
+                    splines[name] = spline
+                else:
+                    for h in self.HMASSES:
+                        name = '{param}_h{h}_{region}'.format(param=param,region=region,h=h)
+                        paramMasses = []
+                        paramValues = []
+                        paramShifts = {}
+                        for a in self.aSorted(vals[''][h]):
+                            paramMasses += [self.aToFloat(a)]
+                            paramValues += [vals[''][h][a][param]]
+                            for shift in shifts:
+                                if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
+                                paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a][param]]
+                                paramShifts[shift]['down'] += [vals[shift+'Down'][h][a][param]]
+                        spline = Models.Spline(name,
+                            MH = 'MA',
+                            masses = paramMasses,
+                            values = paramValues,
+                            shifts = paramShifts,
+                        )
+                        spline.build(workspace, name)
+                        splines[name] = spline
+    
+            # integral spline
             if self.do2D:
-                name = '{param}_{region}'.format(param=param,region=region)
+                name = 'integral_{}_{}'.format(self.SPLINENAME,region)
                 paramMasses = [[],[]]
                 paramValues = []
                 paramShifts = {}
@@ -1601,11 +1692,11 @@ class HaaLimits2D(HaaLimits):
                     for a in self.aSorted(vals[''][h]):
                         paramMasses[0] += [h]
                         paramMasses[1] += [self.aToFloat(a)]
-                        paramValues += [vals[''][h][a]['{param}_h{h}_a{a}_{region}'.format(param=param,h=h,a=a,region=region)]]
+                        paramValues += [integrals[''][h][a]]
                         for shift in shifts:
                             if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                            paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a][param]]
-                            paramShifts[shift]['down'] += [vals[shift+'Down'][h][a][param]]
+                            paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
+                            paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
                 spline = Models.Spline(name,
                     MH = ['MH','MA'],
                     masses = paramMasses,
@@ -1616,17 +1707,17 @@ class HaaLimits2D(HaaLimits):
                 splines[name] = spline
             else:
                 for h in self.HMASSES:
-                    name = '{param}_h{h}_{region}'.format(param=param,region=region,h=h)
+                    name = 'integral_{}_{}'.format(self.SPLINENAME.format(h=h),region)
                     paramMasses = []
                     paramValues = []
                     paramShifts = {}
                     for a in self.aSorted(vals[''][h]):
                         paramMasses += [self.aToFloat(a)]
-                        paramValues += [vals[''][h][a][param]]
+                        paramValues += [integrals[''][h][a]]
                         for shift in shifts:
                             if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                            paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a][param]]
-                            paramShifts[shift]['down'] += [vals[shift+'Down'][h][a][param]]
+                            paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
+                            paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
                     spline = Models.Spline(name,
                         MH = 'MA',
                         masses = paramMasses,
@@ -1635,51 +1726,6 @@ class HaaLimits2D(HaaLimits):
                     )
                     spline.build(workspace, name)
                     splines[name] = spline
-    
-        # integral spline
-        if self.do2D:
-            name = 'integral_{}_{}'.format(self.SPLINENAME,region)
-            paramMasses = [[],[]]
-            paramValues = []
-            paramShifts = {}
-            for h in sorted(vals['']):
-                for a in self.aSorted(vals[''][h]):
-                    paramMasses[0] += [h]
-                    paramMasses[1] += [self.aToFloat(a)]
-                    paramValues += [integrals[''][h][a]]
-                    for shift in shifts:
-                        if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                        paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
-                        paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
-            spline = Models.Spline(name,
-                MH = ['MH','MA'],
-                masses = paramMasses,
-                values = paramValues,
-                shifts = paramShifts,
-            )
-            spline.build(workspace, name)
-            splines[name] = spline
-        else:
-            for h in self.HMASSES:
-                name = 'integral_{}_{}'.format(self.SPLINENAME.format(h=h),region)
-                paramMasses = []
-                paramValues = []
-                paramShifts = {}
-                for a in self.aSorted(vals[''][h]):
-                    paramMasses += [self.aToFloat(a)]
-                    paramValues += [integrals[''][h][a]]
-                    for shift in shifts:
-                        if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                        paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
-                        paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
-                spline = Models.Spline(name,
-                    MH = 'MA',
-                    masses = paramMasses,
-                    values = paramValues,
-                    shifts = paramShifts,
-                )
-                spline.build(workspace, name)
-                splines[name] = spline
 
         # create model
         if self.do2D:
@@ -1863,12 +1909,12 @@ class HaaLimits2D(HaaLimits):
                 continue
         canvas.cd()
         python_mkdir(self.plotDir)
-        canvas.Print('{}/model_fit_{}{}{}.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
+        self.savePlot(canvas,'{}/model_fit_{}{}{}.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
         if mi<0:
             yFrame.SetMinimum(0.1)
         #canvas.SetLogy(True)
         plotpad.SetLogy(True)
-        canvas.Print('{}/model_fit_{}{}{}_log.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
+        self.savePlot(canvas,'{}/model_fit_{}{}{}_log.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
 
     def fitBackground(self,region,shift='',**kwargs):
         scale = kwargs.pop('scale',1)
@@ -1892,26 +1938,21 @@ class HaaLimits2D(HaaLimits):
             integral = hist.sumEntries('{0}>{2} && {0}<{3} && {1}>{4} && {1}<{5}'.format(xVar,yVar,*self.XRANGE+self.YRANGE)) * scale
             integralerr = getDatasetIntegralError(hist,'{0}>{2} && {0}<{3} && {1}>{4} && {1}<{5}'.format(xVar,yVar,*self.XRANGE+self.YRANGE)) * scale
 
-        fr = model.fitTo(data,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True), ROOT.RooFit.PrintLevel(-1))
+        vals, errs = self.cachedFit(lambda: self.fitModel(model,data), 'fitBackground', model, hist, region, shift)
+        # a cached result still needs to be put in the workspace
+        self.setFitResults(workspace,vals,errs)
 
         workspace.var(xVar).setBins(self.XBINNING)
         workspace.var(yVar).setBins(self.YBINNING)
 
-        self.plotModelX(workspace,xVar,data,model,region,shift,postfix='xproj')
-        if region=='control':
-            self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[2.5,5],postfix='xproj_jpsi')
-            self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[8,12],postfix='xproj_upsilon')
-
-        self.plotModelY(workspace,yVar,data,model,region,shift,postfix='yproj')
+        if not self.SKIPPLOTS:
+            self.plotModelX(workspace,xVar,data,model,region,shift,postfix='xproj')
+            if region=='control':
+                self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[2.5,5],postfix='xproj_jpsi')
+                self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[8,12],postfix='xproj_upsilon')
 
-        pars = fr.floatParsFinal()
-        vals = {}
-        errs = {}
-        for p in range(pars.getSize()):
-            vals[pars.at(p).GetName()] = pars.at(p).getValV()
-            errs[pars.at(p).GetName()] = pars.at(p).getError()
+            self.plotModelY(workspace,yVar,data,model,region,shift,postfix='yproj')
 
-        python_mkdir(self.fitsDir)
         jfile = '{}/background_{}{}.json'.format(self.fitsDir,region,'_'+shift if shift else '')
         results = {'vals':vals, 'errs':errs, 'integral':integral, 'integralerr':integralerr}
         self.dump(jfile,results)
@@ -2052,9 +2093,9 @@ class HaaLimits2D(HaaLimits):
                 if mi<0:
                     xFrame.SetMinimum(0.1)
                 python_mkdir(self.plotDir)
-                canvas.Print('{}/data_obs_{}_xproj.png'.format(self.plotDir,region))
+                self.savePlot(canvas,'{}/data_obs_{}_xproj.png'.format(self.plotDir,region))
                 canvas.SetLogy(True)
-                canvas.Print('{}/data_obs_{}_xproj_log.png'.format(self.plotDir,region))
+                self.savePlot(canvas,'{}/data_obs_{}_xproj_log.png'.format(self.plotDir,region))
 
                 yFrame = self.workspace.var(yVar).frame()
                 data_obs.plotOn(yFrame)
@@ -2065,9 +2106,9 @@ class HaaLimits2D(HaaLimits):
                 if mi<0:
                     yFrame.SetMinimum(0.1)
                 python_mkdir(self.plotDir)
-                canvas.Print('{}/data_obs_{}_yproj.png'.format(self.plotDir,region))
+                self.savePlot(canvas,'{}/data_obs_{}_yproj.png'.format(self.plotDir,region))
                 canvas.SetLogy(True)
-                canvas.Print('{}/data_obs_{}_yproj_log.png'.format(self.plotDir,region))
+                self.savePlot(canvas,'{}/data_obs_{}_yproj_log.png'.format(self.plotDir,region))
 
 
 
@@ -2085,6 +2126,7 @@ class HaaLimits2D(HaaLimits):
 
 
     def addBackgroundModels(self, fixAfterControl=False, fixAfterFP=False, load=False, skipFit=False, **kwargs):
+        nworkers = kwargs.pop('nworkers',1)
         workspace = self.buildWorkspace('bg')
         self.initializeWorkspace(workspace=workspace)
         super(HaaLimits2D, self).buildModel(region='control', workspace=workspace)
@@ -2098,6 +2140,7 @@ class HaaLimits2D(HaaLimits):
         allintegrals = {}
         errors = {}
         allparams = {}
+        jobs = []
         for region in self.REGIONS:
             vals[region] = {}
             errs[region] = {}
@@ -2117,20 +2160,19 @@ class HaaLimits2D(HaaLimits):
                     integrals[region][shift] = i
                     integralerrs[region][shift] = ie
                 else:
-                    if load:
-                        vUp, eUp, iUp, ieUp = self.loadBackgroundFit(region,shift+'Up', workspace=workspace)
-                        vDown, eDown, iDown, ieDown = self.loadBackgroundFit(region,shift+'Down', workspace=workspace)
-                    if not skipFit:
-                        vUp, eUp, iUp, ieUp = self.fitBackground(region=region, shift=shift+'Up', workspace=workspace, **kwargs)
-                        vDown, eDown, iDown, ieDown = self.fitBackground(region=region, shift=shift+'Down', workspace=workspace, **kwargs)
-                    vals[region][shift+'Up'] = vUp
-                    errs[region][shift+'Up'] = eUp
-                    integrals[region][shift+'Up'] = iUp
-                    integralerrs[region][shift+'Up'] = ieUp
-                    vals[region][shift+'Down'] = vDown
-                    errs[region][shift+'Down'] = eDown
-                    integrals[region][shift+'Down'] = iDown
-                    integralerrs[region][shift+'Down'] = ieDown
+                    for s in [shift+'Up',shift+'Down']:
+                        if load:
+                            vals[region][s], errs[region][s], integrals[region][s], integralerrs[region][s] = self.loadBackgroundFit(region,s,workspace=workspace)
+                        if not skipFit:
+                            jobs += [(region,s)]
+
+        # the shifted fits only depend on the central fit of their region
+        fits = self.fitBackgroundShifts(jobs,vals,nworkers=nworkers,workspace=workspace,**kwargs)
+        for (region,shift), (v, e, i, ie) in fits.iteritems():
+            vals[region][shift] = v
+            errs[region][shift] = e
+            integrals[region][shift] = i
+            integralerrs[region][shift] = ie
 
         for region in reversed(self.REGIONS):
             if load:
@@ -2150,12 +2192,26 @@ class HaaLimits2D(HaaLimits):
         self.background_params = allparams
 
     def addSignalModels(self,yFitFuncFP="V", yFitFuncPP="V",isKinFit=False,**kwargs):
+        nworkers = kwargs.pop('nworkers',1)
         models = {}
         values = {}
         errors = {}
         integrals = {}
         integralerrs = {}
         fitFuncs = {}
+        # the central fits go first since the shifted fits are seeded from them,
+        # then all shifts of all regions are fit together
+        signalFits = {}
+        jobs = []
+        for region in self.REGIONS:
+            yFitFunc = yFitFuncPP if 'PP' in region else yFitFuncFP
+            signalFits[(region,'')] = self.fitSignals(region=region,shift='',yFitFunc=yFitFunc,isKinFit=isKinFit,nworkers=nworkers,**kwargs)
+            for shift in self.SIGNALSHIFTS+self.QCDSHIFTS:
+                if shift in self.QCDSHIFTS:
+                    jobs += [(region,shift,{'yFitFunc':yFitFunc})]
+                else:
+                    jobs += [(region,shift+'Up',{'yFitFunc':yFitFunc}), (region,shift+'Down',{'yFitFunc':yFitFunc})]
+        signalFits.update(self.fitSignalShifts(jobs,nworkers=nworkers,isKinFit=isKinFit,**kwargs))
         for region in self.REGIONS:
             models[region] = {}
             values[region] = {}
@@ -2167,22 +2223,22 @@ class HaaLimits2D(HaaLimits):
             else: yFitFunc = yFitFuncFP
             for shift in ['']+self.SIGNALSHIFTS+self.QCDSHIFTS:
                 if shift == '':
-                    vals, errs, ints, interrs, fits = self.fitSignals(region=region,shift=shift,yFitFunc=yFitFunc,isKinFit=isKinFit,**kwargs)
+                    vals, errs, ints, interrs, fits = signalFits[(region,shift)]
                     values[region][shift] = vals
                     errors[region][shift] = errs
                     integrals[region][shift] = ints
                     integralerrs[region][shift] = interrs
                     fitFuncs[region][shift] = fits
                 elif shift in self.QCDSHIFTS:
-                    vals, errs, ints, interrs, fits = self.fitSignals(region=region,shift=shift,yFitFunc=yFitFunc,isKinFit=isKinFit,**kwargs)
+                    vals, errs, ints, interrs, fits = signalFits[(region,shift)]
                     values[region][shift] = vals
                     errors[region][shift] = errs
                     integrals[region][shift] = ints
                     integralerrs[region][shift] = interrs
                     fitFuncs[region][shift] = fits
                 else:
-                    valsUp, errsUp, intsUp, interrsUp, fitsUp = self.fitSignals(region=region,shift=shift+'Up',yFitFunc=yFitFunc,isKinFit=isKinFit,**kwargs)
-                    valsDown, errsDown, intsDown, interrsDown, fitsDown = self.fitSignals(region=region,shift=shift+'Down',yFitFunc=yFitFunc,isKinFit=isKinFit,**kwargs)
+                    valsUp, errsUp, intsUp, interrsUp, fitsUp = signalFits[(region,shift+'Up')]
+                    valsDown, errsDown, intsDown, interrsDown, fitsDown = signalFits[(region,shift+'Down')]
                     values[region][shift+'Up'] = valsUp
                     errors[region][shift+'Up'] = errsUp
                     integrals[region][shift+'Up'] = intsUp
@@ -2231,7 +2287,6 @@ class HaaLimits2D(HaaLimits):
                             errors[region]['QCDscale_ggHDown'][h][a][val] = min([errors[region][shift][h][a][val] for shift in self.QCDSHIFTS])
                 for shift in ['QCDscale_ggHUp','QCDscale_ggHDown']:
                     savedir = '{}/{}'.format(self.fitsDir,shift)
-                    python_mkdir(savedir)
                     savename = '{}/{}_{}.json'.format(savedir,region,shift)
                     jsonData = {'vals': values[region][shift], 'errs': errors[region][shift], 'integrals': integrals[region][shift], 'integralerrs': integralerrs[region][shift]}
                     self.dump(savename,jsonData)
@@ -2241,6 +2296,7 @@ class HaaLimits2D(HaaLimits):
                 models[region] = self.buildSpline(values[region],errors[region],integrals[region],integralerrs[region],region,self.SIGNALSHIFTS+['QCDscale_ggH'],yFitFunc=yFitFunc,isKinFit=isKinFit,fitFuncs=fitFuncs[region],**kwargs)
             else:
                 models[region] = self.buildSpline(values[region],errors[region],integrals[region],integralerrs[region],region,self.SIGNALSHIFTS,yFitFunc=yFitFunc,isKinFit=isKinFit,fitFuncs=fitFuncs[region],**kwargs)
+            if self.NORMCACHE: self.cacheSignalNormalizations(region)
         self.fitted_models = models
 
     ######################
@@ -2,6 +2,7 @@ import os
 import sys
 import logging
 import itertools
+import functools
 import numpy as np
 import argparse
 import math
@@ -16,6 +17,9 @@ ROOT.gROOT.SetBatch()
 
 import CombineLimits.Limits.Models as Models
 from CombineLimits.Limits.Limits import Limits
+from CombineLimits.Limits.FitCache import FitCache, fitKey
+from CombineLimits.Limits.FitStore import FitStore
+from CombineLimits.Limits.PlotQueue import printCanvas
 from CombineLimits.Limits.utilities import *
 
 import CombineLimits.Plotter.CMS_lumi as CMS_lumi
@@ -48,6 +52,16 @@ class HaaLimits(Limits):
     SPLITBGS = True # False doesnt work!
     SKIPPLOTS = False
 
+    WRITEJSON = True # also write each fit result as json in fitsDir, as read by the plotting scripts
+    FITCACHE = False # reuse the fit results when the data and model did not change
+    FITCACHESIZE = 100*1024**2 # bytes
+    FITCACHEAGE = 30*24*3600 # seconds
+
+    FITCONFIG = Models.Model.FITCONFIG # fit settings, shared with the Models
+    WARMSTART = False # seed the central signal fits from the previous a mass of the same h (see fitSignalChain)
+    WARMSTARTSCALED = ['mean','width','sigma','sigma1','sigma2','width1','width2','mu','erfShift','scale'] # parameters scaled with the mass when seeding
+    NORMCACHE = {} # tabulate the signal normalizations on a grid of these variables, {name: grid points}
+
     XVAR = 'CMS_haa_x'
 
     SIGNAME = 'HToAAH{h}A{a}'
@@ -125,16 +139,72 @@ class HaaLimits(Limits):
         if obj.endswith(string): obj = obj[:-1*len(string)]
         return obj
 
+    def fitStore(self):
+        '''The indexed store of fit results for this tag, see FitStore.'''
+        return FitStore('{}.db'.format(self.fitsDir))
+
+    def _document(self,name):
+        # the documents keep the old json names, relative to fitsDir
+        name = os.path.relpath(name,self.fitsDir)
+        return name[:-len('.json')] if name.endswith('.json') else name
+
     def dump(self,name,results):
-        with open(name,'w') as f:
-            f.write(json.dumps(results, indent=4, sort_keys=True))
-        with open(name.replace('.json','.pkl'),'wb') as f:
-            pickle.dump(results,f)
-
-    def load(self,name):
-        with open(name.replace('.json','.pkl'),'rb') as f:
-            results = pickle.load(f)
-        return results
+        self.fitStore().put(self._document(name),results)
+        if self.WRITEJSON:
+            python_mkdir(os.path.dirname(name))
+            with open(name,'w') as f:
+                f.write(json.dumps(results, indent=4, sort_keys=True))
+
+    def load(self,name,*path):
+        '''
+        Load the results saved as name, or only those under path (for example h, a, param).
+        Results saved before the store (name as .pkl or .json) are read from the file
+        and added to the store.
+        '''
+        store = self.fitStore()
+        document = self._document(name)
+        try:
+            return store.get(document,*path)
+        except KeyError:
+            results = self._loadFile(name)
+            if results is None: raise
+        logging.info('Adding {} to the fit store'.format(name))
+        store.put(document,results)
+        return store.get(document,*path)
+
+    def _loadFile(self,name):
+        base = name[:-len('.json')] if name.endswith('.json') else name
+        if os.path.exists(base+'.pkl'):
+            with open(base+'.pkl','rb') as f:
+                return pickle.load(f)
+        if os.path.exists(base+'.json'):
+            with open(base+'.json') as f:
+                return json.load(f)
+        return None
+
+    def exportFits(self):
+        '''Write all stored fit results as json in fitsDir.'''
+        self.fitStore().export(self.fitsDir)
+
+    def cachedFit(self,fit,*keys):
+        '''
+        Return fit(), reusing a previous result if FITCACHE is set.
+        The keys are everything the fit depends on (data, model, pdf, shift, ...),
+        they are hashed with fitKey.
+        '''
+        if not self.FITCACHE: return fit()
+        cache = FitCache('{}/cache'.format(self.fitsDir),maxSize=self.FITCACHESIZE,maxAge=self.FITCACHEAGE)
+        key = fitKey(*(keys+self.FITCONFIG.key()))
+        result = cache.get(key)
+        if result is None:
+            result = fit()
+            cache.put(key,result)
+        return result
+
+    def savePlot(self,canvas,filename):
+        '''Print a canvas, queued if the plots are deferred (see PlotQueue), not at all with SKIPPLOTS'''
+        if self.SKIPPLOTS: return
+        printCanvas(canvas,filename)
 
     def aToFloat(self,a):
         return float(str(a).replace('p','.'))
@@ -434,11 +504,10 @@ class HaaLimits(Limits):
     def loadSignalFits(self, tag, region, shift=''):
         savedir = '{}/{}'.format(self.fitsDir,shift if shift else 'central')
         savename = '{}/{}.json'.format(savedir,tag)
-        results = self.load(savename)
-        vals = results['vals']
-        errs = results['errs']
-        ints = results['integrals']
-        interrs = results['integralerrs']
+        vals = self.load(savename,'vals')
+        errs = self.load(savename,'errs')
+        ints = self.load(savename,'integrals')
+        interrs = self.load(savename,'integralerrs')
         return vals, errs, ints, interrs
 
     def fitSignal(self,h,a,region,shift='',**kwargs):
@@ -467,7 +536,10 @@ class HaaLimits(Limits):
                 ws.var(param+'_{}'.format(shift) if shift else param).setVal(results[param])
         hist = histMap[self.SIGNAME.format(h=h,a=a)]
         saveDir = '{}/{}'.format(self.plotDir,shift if shift else 'central')
-        results, errors = model.fit(ws, hist, name, saveDir=saveDir, save=True, doErrors=True, xRange=[0.9*aval,1.1*aval])
+        results, errors = self.cachedFit(
+            lambda: model.fit(ws, hist, name, saveDir=saveDir, save=not self.SKIPPLOTS, doErrors=True, xRange=[0.9*aval,1.1*aval]),
+            'fitSignal', model, ws.pdf(name), hist, shift,
+        )
         if self.binned:
             integral = histMap[self.SIGNAME.format(h=h,a=a)].Integral() * scale
             integralerr = getHistogramIntegralError(histMap[self.SIGNAME.format(h=h,a=a)]) * scale
@@ -476,7 +548,6 @@ class HaaLimits(Limits):
             integralerr = getDatasetIntegralError(histMap[self.SIGNAME.format(h=h,a=a)],'{0}>{1} && {0}<{2}'.format(self.XVAR,*self.XRANGE)) * scale
 
         savedir = '{}/{}'.format(self.fitsDir,shift if shift else 'central')
-        python_mkdir(savedir)
         savename = '{}/h{}_a{}_{}.json'.format(savedir,h,a,tag)
         jsonData = {'vals': results, 'errs': errors, 'integrals': integral, 'integralerrs': integralerr}
         self.dump(savename,jsonData)
@@ -484,12 +555,66 @@ class HaaLimits(Limits):
         return results, errors, integral, integralerr
         
 
+    def warmStartScaled(self,param):
+        '''Whether a signal parameter scales with the a mass when seeding a fit'''
+        return param.split('_')[0] in self.WARMSTARTSCALED
+
+    def warmStartSeed(self,h,a,prevA,prevResults):
+        '''
+        Initial values for the fit of (h,a) from the fit of (h,prevA).
+        The parameter names are moved to the new point and the mass-like
+        parameters (see warmStartScaled) are scaled by a/prevA.
+        '''
+        ratio = self.aToFloat(a)/self.aToFloat(prevA)
+        prevLabel = '_h{}_a{}_'.format(h,prevA)
+        label = '_h{}_a{}_'.format(h,a)
+        seed = {}
+        for param, value in prevResults.iteritems():
+            if self.warmStartScaled(param): value *= ratio
+            seed[param.replace(prevLabel,label)] = value
+        return seed
+
+    def goodSignalFit(self,results,errors):
+        '''Whether a signal fit converged, judged by finite and non zero errors'''
+        return all([errors[param]>0 and not math.isinf(errors[param]) for param in errors])
+
+    def fitSignalChain(self,h,amasses,region,shift='',**kwargs):
+        '''
+        Fit the a masses of one h in increasing order, seeding each fit from
+        the converged parameters of the previous one (see warmStartSeed).
+        A fit that fails or does not converge is redone from the default
+        initial values. Returns {a: fitSignal output}.
+        '''
+        fits = {}
+        previous = None
+        for a in sorted(amasses,key=self.aToFloat):
+            fit = None
+            if previous:
+                prevA, prevResults = previous
+                try:
+                    fit = self.fitSignal(h,a,region,shift,results=self.warmStartSeed(h,a,prevA,prevResults),**kwargs)
+                except Exception as e:
+                    logging.warning('Seeded fit of h{} a{} {} failed ({}), refitting from the default initial values'.format(h,a,region,e))
+                if fit and not self.goodSignalFit(*fit[:2]):
+                    logging.warning('Seeded fit of h{} a{} {} did not converge, refitting from the default initial values'.format(h,a,region))
+                    fit = None
+            if fit is None:
+                fit = self.fitSignal(h,a,region,shift,**kwargs)
+            fits[a] = fit
+            if self.goodSignalFit(*fit[:2]): previous = (a, fit[0])
+        return fits
+
     def fitSignals(self,region,shift='',**kwargs):
         '''
         Fit the signal model for a given Higgs mass.
         Required arguments:
             h = higgs mass
+        Optional arguments:
+            nworkers = number of processes to spread the (h,a) fits over
+            skipParams = only do the (h,a) fits, skipping the parameter fits (returned as {})
         '''
+        nworkers = kwargs.pop('nworkers',1)
+        skipParams = kwargs.pop('skipParams',False)
         load = kwargs.get('load',False)
         skipFit = kwargs.get('skipFit',False)
         tag = kwargs.get('tag','{}{}'.format(region,'_'+shift if shift else ''))
@@ -508,6 +633,7 @@ class HaaLimits(Limits):
             errors = {}
             integrals = {}
             integralerrs = {}
+            points = []
 
             for h in self.HMASSES:
                 results[h] = {}
@@ -518,22 +644,60 @@ class HaaLimits(Limits):
                 amasses = self.HAMAP[h]
                 avals = [self.aToFloat(x) for x in amasses]
 
+                if self.WARMSTART and not (load or shift):
+                    # the a masses of an h are fit in order, so one task per h
+                    points += [(h,None,functools.partial(self.fitSignalChain,h,amasses,region,shift,**kwargs))]
+                    continue
+
                 for a in amasses:
                     if load or (shift and not skipFit):
-                        results[h][a], errors[h][a], integrals[h][a], integralerrs[h][a] = self.fitSignal(h,a,region,shift,results=cresults[h][a],**kwargs)
+                        points += [(h,a,functools.partial(self.fitSignal,h,a,region,shift,results=cresults[h][a],**kwargs))]
                     elif not skipFit:
-                        results[h][a], errors[h][a], integrals[h][a], integralerrs[h][a] = self.fitSignal(h,a,region,shift,**kwargs)
+                        points += [(h,a,functools.partial(self.fitSignal,h,a,region,shift,**kwargs))]
+
+            # the points are independent, so they can be spread over a process pool
+            fits = runTasks([p[2] for p in points],nworkers)
+            for (h,a,task), fit in zip(points,fits):
+                chain = fit if a is None else {a: fit}
+                for a in chain:
+                    results[h][a], errors[h][a], integrals[h][a], integralerrs[h][a] = chain[a]
     
         savedir = '{}/{}'.format(self.fitsDir,shift if shift else 'central')
-        python_mkdir(savedir)
         savename = '{}/{}.json'.format(savedir,tag)
         jsonData = {'vals': results, 'errs': errors, 'integrals': integrals, 'integralerrs': integralerrs}
         self.dump(savename,jsonData)
 
+        if skipParams:
+            return results, errors, integrals, integralerrs, {}
+
         fitFuncs = self.fitSignalParams(results,errors,integrals,integralerrs,region,shift)
 
         return results, errors, integrals, integralerrs, fitFuncs
 
+    def fitSignalShifts(self,jobs,nworkers=1,**kwargs):
+        '''
+        Fit the signal models for several regions/shifts.
+        Required arguments:
+            jobs = list of (region, shift, kwargs) passed on to fitSignals
+        The central fits the shifts are seeded from must already exist.
+        The jobs are then independent, so with nworkers>1 they are spread over a
+        process pool, each worker fitting its (h,a) points serially. The parameter
+        fits are redone here since the ROOT functions can't be sent back.
+        Returns a dict of the fitSignals output keyed by (region, shift).
+        '''
+        results = {}
+        if nworkers<=1 or len(jobs)<2:
+            for region, shift, kw in jobs:
+                results[(region,shift)] = self.fitSignals(region=region,shift=shift,nworkers=nworkers,**dict(kwargs,**kw))
+            return results
+        tasks = [functools.partial(self.fitSignals,region=region,shift=shift,skipParams=True,**dict(kwargs,**kw)) for region, shift, kw in jobs]
+        fits = runTasks(tasks,nworkers)
+        for (region, shift, kw), fit in zip(jobs,fits):
+            vals, errs, ints, interrs = fit[:4]
+            fitFuncs = self.fitSignalParams(vals,errs,ints,interrs,region,shift,**dict(kwargs,**kw))
+            results[(region,shift)] = (vals, errs, ints, interrs, fitFuncs)
+        return results
+
     def fitSignalParams(self,results,errors,integrals,integralerrs,region,shift='',**kwargs):
         tag = kwargs.get('tag','{}{}'.format(region,'_'+shift if shift else ''))
         # Fit using ROOT rather than RooFit for the splines
@@ -643,7 +807,7 @@ class HaaLimits(Limits):
             mg.GetYaxis().SetTitle(param)
             if self.doParamFit: fmg.Draw('L')
             legend.Draw()
-            canvas.Print('{}.png'.format(savename))
+            self.savePlot(canvas,'{}.png'.format(savename))
 
             if self.do2D:
                 savename = '{}/{}_Fit_vsH'.format(savedir,name)
@@ -693,7 +857,7 @@ class HaaLimits(Limits):
                 mg.GetYaxis().SetTitle(param)
                 if self.doParamFit: fmg.Draw('L')
                 legend.Draw()
-                canvas.Print('{}.png'.format(savename))
+                self.savePlot(canvas,'{}.png'.format(savename))
 
 
         return fitFuncs
@@ -748,40 +912,41 @@ class HaaLimits(Limits):
         splines = {}
         params = ['mean','width','sigma']
         if self.doParamFit:
-            for param in params+['integral']:
-                if self.do2D:
-                    name = '{param}_{splinename}_{region}'.format(param=param,region=region,splinename=self.SPLINENAME)
-                    spline = Models.Spline(name,
-                        MH = ['MH','MA'],
-                        masses = None,
-                        values = fitFuncs[''][param],
-                        shifts = {shift: {'up': fitFuncs[shift+'Up'][param], 'down': fitFuncs[shift+'Down'][param],} for shift in shifts},
-                    )
-                    spline.build(workspace, name)
-                    splines[name] = spline
-                else:
-                    for h in self.HMASSES:
-                        name = '{param}_{splinename}_{region}'.format(param=param,region=region,splinename=self.SPLINENAME.format(h=h))
-                        # here is using the TF1
-                        #spline = Models.Spline(name,
-                        #    MH = 'MA',
-                        #    masses = None,
-                        #    values = fitFuncs[''][h][param],
-                        #    shifts = {shift: {'up': fitFuncs[shift+'Up'][h][param], 'down': fitFuncs[shift+'Down'][h][param],} for shift in shifts},
-                        #)
-                        # here is converting to a spline first
+            with self.importBatch('signal splines {}'.format(region)):
+                for param in params+['integral']:
+                    if self.do2D:
+                        name = '{param}_{splinename}_{region}'.format(param=param,region=region,splinename=self.SPLINENAME)
                         spline = Models.Spline(name,
-                            MH = 'MA',
-                            masses = amasses,
-                            values = self.fitToList(fitFuncs[''][h][param],amasses),
-                            shifts = {shift: 
-                                {
-                                    'up'  : self.fitToList(fitFuncs[shift+'Up'][h][param],amasses), 
-                                    'down': self.fitToList(fitFuncs[shift+'Down'][h][param],amasses),
-                                } for shift in shifts},
+                            MH = ['MH','MA'],
+                            masses = None,
+                            values = fitFuncs[''][param],
+                            shifts = {shift: {'up': fitFuncs[shift+'Up'][param], 'down': fitFuncs[shift+'Down'][param],} for shift in shifts},
                         )
                         spline.build(workspace, name)
                         splines[name] = spline
+                    else:
+                        for h in self.HMASSES:
+                            name = '{param}_{splinename}_{region}'.format(param=param,region=region,splinename=self.SPLINENAME.format(h=h))
+                            # here is using the TF1
+                            #spline = Models.Spline(name,
+                            #    MH = 'MA',
+                            #    masses = None,
+                            #    values = fitFuncs[''][h][param],
+                            #    shifts = {shift: {'up': fitFuncs[shift+'Up'][h][param], 'down': fitFuncs[shift+'Down'][h][param],} for shift in shifts},
+                            #)
+                            # here is converting to a spline first
+                            spline = Models.Spline(name,
+                                MH = 'MA',
+                                masses = amasses,
+                                values = self.fitToList(fitFuncs[''][h][param],amasses),
+                                shifts = {shift: 
+                                    {
+                                        'up'  : self.fitToList(fitFuncs[shift+'Up'][h][param],amasses), 
+                                        'down': self.fitToList(fitFuncs[shift+'Down'][h][param],amasses),
+                                    } for shift in shifts},
+                            )
+                            spline.build(workspace, name)
+                            splines[name] = spline
 
             # create model
             if self.do2D:
@@ -806,10 +971,56 @@ class HaaLimits(Limits):
 
 
 
-        # create parameter splines
-        for param in params:
+        with self.importBatch('signal splines {}'.format(region)):
+            # create parameter splines
+            for param in params:
+                if self.do2D:
+                    name = '{param}_{region}'.format(param=param,region=region)
+                    paramMasses = [[],[]]
+                    paramValues = []
+                    paramShifts = {}
+                    for h in sorted(vals['']):
+                        for a in self.aSorted(vals[''][h]):
+                            paramMasses[0] += [h]
+                            paramMasses[1] += [self.aToFloat(a)]
+                            paramValues += [vals[''][h][a]['{param}_h{h}_a{a}_{region}'.format(param=param,h=h,a=a,region=region)]]
+                            for shift in shifts:
+                                if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
+                                paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a]['{param}_h{h}_a{a}_{region}_{shift}Up'.format(  param=param,h=h,a=a,region=region,shift=shift)]]
+                                paramShifts[shift]['down'] += [vals[shift+'Down'][h][a]['{param}_h{h}_a{a}_{region}_{shift}Down'.format(param=param,h=h,a=a,region=region,shift=shift)]]
+                    spline = Models.Spline(name,
+                        MH = ['MH','MA'],
+                        masses = paramMasses,
+                        values = paramValues,
+                        shifts = paramShifts,
+                    )
+                    spline.build(workspace, name)
+                    splines[name] = spline
+                else:
+                    for h in self.HMASSES:
+                        name = '{param}_h{h}_{region}'.format(param=param,region=region,h=h)
+                        paramMasses = []
+                        paramValues = []
+                        paramShifts = {}
+                        for a in self.aSorted(vals[''][h]):
+                            paramMasses += [self.aToFloat(a)]
+                            paramValues += [vals[''][h][a]['{param}_h{h}_a{a}_{region}'.format(param=param,h=h,a=a,region=region)]]
+                            for shift in shifts:
+                                if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
+                                paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a]['{param}_h{h}_a{a}_{region}_{shift}Up'.format(  param=param,h=h,a=a,region=region,shift=shift)]]
+                                paramShifts[shift]['down'] += [vals[shift+'Down'][h][a]['{param}_h{h}_a{a}_{region}_{shift}Down'.format(param=param,h=h,a=a,region=region,shift=shift)]]
+                        spline = Models.Spline(name,
+                            MH = 'MA',
+                            masses = paramMasses,
+                            values = paramValues,
+                            shifts = paramShifts,
+                        )
+                        spline.build(workspace, name)
+                        splines[name] = spline
+
+            # integral spline
             if self.do2D:
-                name = '{param}_{region}'.format(param=param,region=region)
+                name = 'integral_{}_{}'.format(self.SPLINENAME,region)
                 paramMasses = [[],[]]
                 paramValues = []
                 paramShifts = {}
@@ -817,11 +1028,11 @@ class HaaLimits(Limits):
                     for a in self.aSorted(vals[''][h]):
                         paramMasses[0] += [h]
                         paramMasses[1] += [self.aToFloat(a)]
-                        paramValues += [vals[''][h][a]['{param}_h{h}_a{a}_{region}'.format(param=param,h=h,a=a,region=region)]]
+                        paramValues += [integrals[''][h][a]]
                         for shift in shifts:
                             if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                            paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a]['{param}_h{h}_a{a}_{region}_{shift}Up'.format(  param=param,h=h,a=a,region=region,shift=shift)]]
-                            paramShifts[shift]['down'] += [vals[shift+'Down'][h][a]['{param}_h{h}_a{a}_{region}_{shift}Down'.format(param=param,h=h,a=a,region=region,shift=shift)]]
+                            paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
+                            paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
                 spline = Models.Spline(name,
                     MH = ['MH','MA'],
                     masses = paramMasses,
@@ -832,17 +1043,17 @@ class HaaLimits(Limits):
                 splines[name] = spline
             else:
                 for h in self.HMASSES:
-                    name = '{param}_h{h}_{region}'.format(param=param,region=region,h=h)
+                    name = 'integral_{}_{}'.format(self.SPLINENAME.format(h=h),region)
                     paramMasses = []
                     paramValues = []
                     paramShifts = {}
                     for a in self.aSorted(vals[''][h]):
                         paramMasses += [self.aToFloat(a)]
-                        paramValues += [vals[''][h][a]['{param}_h{h}_a{a}_{region}'.format(param=param,h=h,a=a,region=region)]]
+                        paramValues += [integrals[''][h][a]]
                         for shift in shifts:
                             if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                            paramShifts[shift]['up']   += [vals[shift+'Up'  ][h][a]['{param}_h{h}_a{a}_{region}_{shift}Up'.format(  param=param,h=h,a=a,region=region,shift=shift)]]
-                            paramShifts[shift]['down'] += [vals[shift+'Down'][h][a]['{param}_h{h}_a{a}_{region}_{shift}Down'.format(param=param,h=h,a=a,region=region,shift=shift)]]
+                            paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
+                            paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
                     spline = Models.Spline(name,
                         MH = 'MA',
                         masses = paramMasses,
@@ -852,51 +1063,6 @@ class HaaLimits(Limits):
                     spline.build(workspace, name)
                     splines[name] = spline
 
-        # integral spline
-        if self.do2D:
-            name = 'integral_{}_{}'.format(self.SPLINENAME,region)
-            paramMasses = [[],[]]
-            paramValues = []
-            paramShifts = {}
-            for h in sorted(vals['']):
-                for a in self.aSorted(vals[''][h]):
-                    paramMasses[0] += [h]
-                    paramMasses[1] += [self.aToFloat(a)]
-                    paramValues += [integrals[''][h][a]]
-                    for shift in shifts:
-                        if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                        paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
-                        paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
-            spline = Models.Spline(name,
-                MH = ['MH','MA'],
-                masses = paramMasses,
-                values = paramValues,
-                shifts = paramShifts,
-            )
-            spline.build(workspace, name)
-            splines[name] = spline
-        else:
-            for h in self.HMASSES:
-                name = 'integral_{}_{}'.format(self.SPLINENAME.format(h=h),region)
-                paramMasses = []
-                paramValues = []
-                paramShifts = {}
-                for a in self.aSorted(vals[''][h]):
-                    paramMasses += [self.aToFloat(a)]
-                    paramValues += [integrals[''][h][a]]
-                    for shift in shifts:
-                        if shift not in paramShifts: paramShifts[shift] = {'up': [], 'down': []}
-                        paramShifts[shift]['up']   += [integrals[shift+'Up'  ][h][a]]
-                        paramShifts[shift]['down'] += [integrals[shift+'Down'][h][a]]
-                spline = Models.Spline(name,
-                    MH = 'MA',
-                    masses = paramMasses,
-                    values = paramValues,
-                    shifts = paramShifts,
-                )
-                spline.build(workspace, name)
-                splines[name] = spline
-
         # create model
         if self.do2D:
             model = Models.Voigtian(self.SPLINENAME,
@@ -1010,10 +1176,28 @@ class HaaLimits(Limits):
                 continue
         canvas.cd()
         python_mkdir(self.plotDir)
-        canvas.Print('{}/model_fit_{}{}{}.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
+        self.savePlot(canvas,'{}/model_fit_{}{}{}.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
         #canvas.SetLogy(True)
         plotpad.SetLogy(True)
-        canvas.Print('{}/model_fit_{}{}{}_log.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
+        self.savePlot(canvas,'{}/model_fit_{}{}{}_log.png'.format(self.plotDir,region,'_'+shift if shift else '','_'+postfix if postfix else ''))
+
+    def fitModel(self,model,data):
+        '''Fit a model to data and return the values and errors of the floating parameters'''
+        fr = self.FITCONFIG.fitTo(model, data, ROOT.RooFit.Save(), ROOT.RooFit.SumW2Error(True), ROOT.RooFit.PrintLevel(-1))
+        pars = fr.floatParsFinal()
+        vals = {}
+        errs = {}
+        for p in range(pars.getSize()):
+            vals[pars.at(p).GetName()] = pars.at(p).getValV()
+            errs[pars.at(p).GetName()] = pars.at(p).getError()
+        return vals, errs
+
+    def setFitResults(self,workspace,vals,errs):
+        '''Set the fitted values and errors of the parameters in the workspace'''
+        for param in vals:
+            if not workspace.var(param): continue
+            workspace.var(param).setVal(vals[param])
+            workspace.var(param).setError(errs[param])
 
     def fitBackground(self,region,shift='', **kwargs):
         scale = kwargs.pop('scale',1)
@@ -1032,23 +1216,18 @@ class HaaLimits(Limits):
             # TODO add support for xVar
             data = hist.Clone(name)
 
-        fr = model.fitTo(data, ROOT.RooFit.Save(), ROOT.RooFit.SumW2Error(True), ROOT.RooFit.PrintLevel(-1))
+        vals, errs = self.cachedFit(lambda: self.fitModel(model,data), 'fitBackground', model, hist, region, shift)
+        # a cached result still needs to be put in the workspace
+        self.setFitResults(workspace,vals,errs)
 
         workspace.var(xVar).setBins(self.XBINNING)
 
-        self.plotModelX(workspace,xVar,data,model,region,shift)
-        if region=='control':
-            self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[2.5,5],postfix='jpsi')
-            self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[8,12],postfix='upsilon')
-
-        pars = fr.floatParsFinal()
-        vals = {}
-        errs = {}
-        for p in range(pars.getSize()):
-            vals[pars.at(p).GetName()] = pars.at(p).getValV()
-            errs[pars.at(p).GetName()] = pars.at(p).getError()
+        if not self.SKIPPLOTS:
+            self.plotModelX(workspace,xVar,data,model,region,shift)
+            if region=='control':
+                self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[2.5,5],postfix='jpsi')
+                self.plotModelX(workspace,xVar,data,model,region,shift,xRange=[8,12],postfix='upsilon')
 
-        python_mkdir(self.fitsDir)
         jfile = '{}/background_{}{}.json'.format(self.fitsDir,region,'_'+shift if shift else '')
         results = {'vals':vals, 'errs':errs, 'integral':integral, 'integralerr': integralerr}
         self.dump(jfile,results)
@@ -1056,6 +1235,29 @@ class HaaLimits(Limits):
         return vals, errs, integral, integralerr
 
 
+    def fitBackgroundShifts(self,jobs,seeds,nworkers=1,**kwargs):
+        '''
+        Fit the shifted backgrounds.
+        Required arguments:
+            jobs  = list of (region, shift) to fit
+            seeds = fitted values of the form seeds[region][shift], each fit starts from seeds[region]['']
+        Each fit starts from the central values of its region and they are restored afterwards,
+        so the fits are independent and with nworkers>1 are spread over a process pool.
+        Returns a dict of the fitBackground output keyed by (region, shift).
+        '''
+        tasks = [functools.partial(self._fitBackgroundShift,region,shift,seeds[region][''],**kwargs) for region, shift in jobs]
+        return dict(zip(jobs,runTasks(tasks,nworkers)))
+
+    def _fitBackgroundShift(self,region,shift,seed,**kwargs):
+        workspace = kwargs.get('workspace',self.workspace)
+        for param in seed:
+            if workspace.var(param): workspace.var(param).setVal(seed[param])
+        results = self.fitBackground(region=region,shift=shift,**kwargs)
+        for param in seed:
+            if workspace.var(param): workspace.var(param).setVal(seed[param])
+        return results
+
+
     ###############################
     ### Add things to workspace ###
     ###############################
@@ -1189,9 +1391,9 @@ class HaaLimits(Limits):
                 if mi<0:
                     xFrame.SetMinimum(0.1)
                 python_mkdir(self.plotDir)
-                canvas.Print('{}/data_obs_{}.png'.format(self.plotDir,region))
+                self.savePlot(canvas,'{}/data_obs_{}.png'.format(self.plotDir,region))
                 canvas.SetLogy(True)
-                canvas.Print('{}/data_obs_{}_log.png'.format(self.plotDir,region))
+                self.savePlot(canvas,'{}/data_obs_{}_log.png'.format(self.plotDir,region))
 
         if addControl:
             region = 'control'
@@ -1407,7 +1609,6 @@ class HaaLimits(Limits):
         )
         param.build(workspace,name)
 
-        python_mkdir(self.fitsDir)
         jfile = '{}/components_{}.json'.format(self.fitsDir,region)
         results = {'errs':allerrors, 'integrals':allintegrals}
         self.dump(jfile,results)
@@ -1423,11 +1624,10 @@ class HaaLimits(Limits):
         logging.debug(', '.join([region,shift,str(kwargs)]))
         workspace = kwargs.pop('workspace',self.workspace)
         jfile = '{}/background_{}{}.json'.format(self.fitsDir,region,shift)
-        results = self.load(jfile)
-        vals = results['vals']
-        errs = results['errs']
-        ints = results['integral']
-        interrs = results['integralerr']
+        vals = self.load(jfile,'vals')
+        errs = self.load(jfile,'errs')
+        ints = self.load(jfile,'integral')
+        interrs = self.load(jfile,'integralerr')
         for param in vals:
             try:
                 workspace.var(param).setVal(vals[param])
@@ -1446,9 +1646,8 @@ class HaaLimits(Limits):
         logging.debug('loadComponentIntegrals')
         logging.debug(region)
         jfile = '{}/components_{}.json'.format(self.fitsDir,region)
-        results = self.load(jfile)
-        allintegrals = results['integrals']
-        errors = results['errs']
+        allintegrals = self.load(jfile,'integrals')
+        errors = self.load(jfile,'errs')
         return allintegrals, errors
 
     def addControlModels(self, load=False, skipFit=False):
@@ -1502,6 +1701,7 @@ class HaaLimits(Limits):
         #if self.XRANGE[0]<3.3: workspace.arg('jpsi_frac').setConstant(fix) 
 
     def addBackgroundModels(self, fixAfterControl=False, fixAfterFP=False, load=False, skipFit=False, **kwargs):
+        nworkers = kwargs.pop('nworkers',1)
         workspace = self.buildWorkspace('bg')
         self.initializeWorkspace(workspace=workspace)
         self.buildModel(region='control', workspace=workspace)
@@ -1515,6 +1715,7 @@ class HaaLimits(Limits):
         errors = {}
         allintegrals = {}
         allparams = {}
+        jobs = []
         for region in self.REGIONS:
             vals[region] = {}
             errs[region] = {}
@@ -1533,21 +1734,19 @@ class HaaLimits(Limits):
                     integralerrs[region][shift] = ie
                     
                 else:
-                    if load:
-                        vUp, eUp, iUp, ieUp = self.loadBackgroundFit(region,shift+'Up',workspace=workspace)
-                        vDown, eDown, iDown, ieDown = self.loadBackgroundFit(region,shift+'Down',workspace=workspace)
-                    if not skipFit:
-                        vUp, eUp, iUp, ieUp = self.fitBackground(region=region, shift=shift+'Up', workspace=workspace, **kwargs)
-                        vDown, eDown, iDown, ieDown = self.fitBackground(region=region, shift=shift+'Down', workspace=workspace, **kwargs
-                        )
-                    vals[region][shift+'Up'] = vUp
-                    errs[region][shift+'Up'] = eUp
-                    integrals[region][shift+'Up'] = iUp
-                    integralerrs[region][shift+'Up'] = ieUp
-                    vals[region][shift+'Down'] = vDown
-                    errs[region][shift+'Down'] = eDown
-                    integrals[region][shift+'Down'] = iDown
-                    integralerrs[region][shift+'Down'] = ieDown
+                    for s in [shift+'Up',shift+'Down']:
+                        if load:
+                            vals[region][s], errs[region][s], integrals[region][s], integralerrs[region][s] = self.loadBackgroundFit(region,s,workspace=workspace)
+                        if not skipFit:
+                            jobs += [(region,s)]
+
+        # the shifted fits only depend on the central fit of their region
+        fits = self.fitBackgroundShifts(jobs,vals,nworkers=nworkers,workspace=workspace,**kwargs)
+        for (region,shift), (v, e, i, ie) in fits.iteritems():
+            vals[region][shift] = v
+            errs[region][shift] = e
+            integrals[region][shift] = i
+            integralerrs[region][shift] = ie
 
 
         for region in reversed(self.REGIONS):
@@ -1593,12 +1792,25 @@ class HaaLimits(Limits):
 
 
     def addSignalModels(self,**kwargs):
+        nworkers = kwargs.pop('nworkers',1)
         models = {}
         values = {}
         errors = {}
         integrals = {}
         integralerrs = {}
         fitFuncs = {}
+        # the central fits go first since the shifted fits are seeded from them,
+        # then all shifts of all regions are fit together
+        signalFits = {}
+        jobs = []
+        for region in self.REGIONS:
+            signalFits[(region,'')] = self.fitSignals(region=region,shift='',nworkers=nworkers,**kwargs)
+            for shift in self.SIGNALSHIFTS+self.QCDSHIFTS:
+                if shift in self.QCDSHIFTS:
+                    jobs += [(region,shift,{})]
+                else:
+                    jobs += [(region,shift+'Up',{}), (region,shift+'Down',{})]
+        signalFits.update(self.fitSignalShifts(jobs,nworkers=nworkers,**kwargs))
         for region in self.REGIONS:
             models[region] = {}
             values[region] = {}
@@ -1613,22 +1825,22 @@ class HaaLimits(Limits):
                 integralerrs[region][shift] = {}
                 fitFuncs[region][shift] = {}
                 if shift == '':
-                    vals, errs, ints, interrs, fits = self.fitSignals(region=region,shift=shift,**kwargs)
+                    vals, errs, ints, interrs, fits = signalFits[(region,shift)]
                     values[region][shift] = vals
                     errors[region][shift] = errs
                     integrals[region][shift] = ints
                     integralerrs[region][shift] = interrs
                     fitFuncs[region][shift] = fits
                 elif shift in self.QCDSHIFTS:
-                    vals, errs, ints, interrs, fits = self.fitSignals(region=region,shift=shift,**kwargs)
+                    vals, errs, ints, interrs, fits = signalFits[(region,shift)]
                     values[region][shift] = vals
                     errors[region][shift] = errs
                     integrals[region][shift] = ints
                     integralerrs[region][shift] = interrs
                     fitFuncs[region][shift] = fits
                 else:
-                    valsUp, errsUp, intsUp, interrsUp, fitsUp = self.fitSignals(region=region,shift=shift+'Up',**kwargs)
-                    valsDown, errsDown, intsDown, interrsDown, fitsDown = self.fitSignals(region=region,shift=shift+'Down',**kwargs)
+                    valsUp, errsUp, intsUp, interrsUp, fitsUp = signalFits[(region,shift+'Up')]
+                    valsDown, errsDown, intsDown, interrsDown, fitsDown = signalFits[(region,shift+'Down')]
                     values[region][shift+'Up'] = valsUp
                     errors[region][shift+'Up'] = errsUp
                     integrals[region][shift+'Up'] = intsUp
@@ -1674,7 +1886,6 @@ class HaaLimits(Limits):
                             errors[region]['QCDscale_ggHDown'][h][a][val+'_QCDscale_ggHDown'] = min([errors[region][shift][h][a][val+'_'+shift] for shift in self.QCDSHIFTS])
                 for shift in ['QCDscale_ggHUp','QCDscale_ggHDown']:
                     savedir = '{}/{}'.format(self.fitsDir,shift)
-                    python_mkdir(savedir)
                     savename = '{}/{}_{}.json'.format(savedir,region,shift)
                     jsonData = {'vals': values[region][shift], 'errs': errors[region][shift], 'integrals': integrals[region][shift], 'integralerrs': integralerrs[region][shift]}
                     self.dump(savename,jsonData)
@@ -1685,8 +1896,18 @@ class HaaLimits(Limits):
                 models[region] = self.buildSpline(values[region],errors[region],integrals[region],integralerrs[region],region,self.SIGNALSHIFTS+['QCDscale_ggH'],fitFuncs=fitFuncs[region],**kwargs)
             else:
                 models[region] = self.buildSpline(values[region],errors[region],integrals[region],integralerrs[region],region,self.SIGNALSHIFTS,fitFuncs=fitFuncs[region],**kwargs)
+            if self.NORMCACHE: self.cacheSignalNormalizations(region)
         self.fitted_models = models
 
+    def cacheSignalNormalizations(self,region,**kwargs):
+        '''Tabulate the normalization of the signal models of a region on the NORMCACHE grid'''
+        workspace = kwargs.pop('workspace',self.workspace)
+        splinenames = [self.SPLINENAME] if self.do2D else [self.SPLINENAME.format(h=h) for h in self.HMASSES]
+        # the 2D models (HaaLimits2D) have a second observable
+        observables = [self.XVAR]+([self.YVAR] if hasattr(self,'YVAR') else [])
+        for splinename in splinenames:
+            Models.cacheNormalization(workspace,'{}_{}'.format(splinename,region),self.NORMCACHE,observables)
+
     ######################
     ### Setup datacard ###
     ######################
@@ -1,27 +1,136 @@
-###### Utility to get Roodatasets ########################
-def getRooDataset(f,selection='1',weight='w',xRange=[],yRange=[],project='',xVar='invMassMuMu',yVar='visFourbodyMass'):
-    '''Get a RooDataset'''
-    file=ROOT.TFile.Open(f)
-    ds=file.Get('dataColl')
-    args=ds.get()
-    if xRange: args.find('invMassMuMu').setRange(*xRange)
-    if yRange: args.find('visFourbodyMass').setRange(*yRange)
-    if xVar!='invMassMuMu': args.find('invMassMuMu').SetName(xVar)
-    if yVar!='visFourbodyMass':args.find('visFourbodyMass').SetName(yVar)
-    ds = ROOT.RooDataSet(ds.GetName(),ds.GetTitle(),ds,args,selection,weight)
-    if project: ds = getattr(ds,'reduce')(ROOT.RooArgSet(ds.get().find(project)))
-    return ds
+import os
+import logging
+import contextlib
+import collections
 
-def getRooDatasetFake(f,selection='1',weight='fakeRateEfficiency',xRange=[],yRange=[],project='',xVar='invMassMuMu',yVar='visFourbodyMass'):
-    '''Get a DataDriven RooDataset'''
-    file=ROOT.TFile.Open(f)
+import ROOT
+
+class FilePool(object):
+    '''
+    FilePool
+
+    Keep up to maxFiles ROOT files open, closing the least recently used
+    one when another is needed. The files belong to the process that
+    opened them: a forked worker (see runTasks) opens its own instead of
+    reading through the parent's handles and offsets.
+    '''
+
+    def __init__(self,maxFiles=20):
+        self.maxFiles = maxFiles
+        self.files = collections.OrderedDict()
+        self.pid = os.getpid()
+
+    def _checkProcess(self):
+        if self.pid==os.getpid(): return
+        # forget the parent's files without touching them, the parent still uses them
+        self.files = collections.OrderedDict()
+        self.pid = os.getpid()
+
+    def get(self,f):
+        '''Return the open TFile for f.'''
+        self._checkProcess()
+        if f in self.files:
+            tfile = self.files.pop(f)
+        else:
+            logging.debug('Opening {}'.format(f))
+            tfile = ROOT.TFile.Open(f)
+            if not tfile or tfile.IsZombie():
+                raise IOError('Failed to open {}'.format(f))
+        self.files[f] = tfile
+        while len(self.files)>self.maxFiles:
+            self._close(*self.files.popitem(last=False))
+        return tfile
+
+    def close(self):
+        '''Close all the files.'''
+        self._checkProcess()
+        while self.files:
+            self._close(*self.files.popitem(last=False))
+
+    def _close(self,f,tfile):
+        logging.debug('Closing {}'.format(f))
+        tfile.Close()
+
+FILEPOOL = FilePool()
+
+# the columnar cache of the inputs, see useEventCache
+EVENTCACHE = None
+
+# reduced datasets by (file, selection, weight, ranges, projection, variable names)
+_datasets = {}
+
+def useEventCache(directory):
+    '''Build the datasets from the columnar cache in directory (see RunIIEventCache), None to read the files directly.'''
+    global EVENTCACHE
+    if directory:
+        from CombineLimits.HaaLimits.RunIIEventCache import EventCache
+        EVENTCACHE = EventCache(directory)
+    else:
+        EVENTCACHE = None
+
+@contextlib.contextmanager
+def _inMemory():
+    '''Create the objects in memory (gROOT), the current directory is restored after.'''
+    context = ROOT.TDirectory.TContext(ROOT.gROOT)
+    try:
+        yield
+    finally:
+        del context
+
+def _getDataset(f,selection,weight,xRange,yRange,project,xVar,yVar):
+    '''
+    Read dataColl from a file and reduce it, once per set of arguments.
+    The dataset is shared between callers, clone it before changing it.
+    '''
+    key = (f,selection,weight,tuple(xRange),tuple(yRange),project,xVar,yVar)
+    if key in _datasets: return _datasets[key]
+    if EVENTCACHE:
+        with _inMemory():
+            ds = EVENTCACHE.dataset(f,selection,weight,xRange,yRange,project,xVar,yVar)
+        if ds is not None:
+            _datasets[key] = ds
+            return ds
+        logging.debug('Selection "{}" not supported by the event cache, reading {}'.format(selection,f))
+    file=FILEPOOL.get(f)
     ds=file.Get('dataColl')
     args=ds.get()
     if xRange: args.find('invMassMuMu').setRange(*xRange)
     if yRange: args.find('visFourbodyMass').setRange(*yRange)
     if xVar!='invMassMuMu': args.find('invMassMuMu').SetName(xVar)
     if yVar!='visFourbodyMass':args.find('visFourbodyMass').SetName(yVar)
-    ds = ROOT.RooDataSet(ds.GetName(),ds.GetTitle(),ds,args,selection,weight)
-    if project: ds = getattr(ds,'reduce')(ROOT.RooArgSet(ds.get().find(project)))
+    # keep the reduced dataset in memory, the pool may close its file
+    with _inMemory():
+        ds = ROOT.RooDataSet(ds.GetName(),ds.GetTitle(),ds,args,selection,weight)
+        if project: ds = getattr(ds,'reduce')(ROOT.RooArgSet(ds.get().find(project)))
+    _datasets[key] = ds
     return ds
 
+def closeFiles():
+    '''Close the files opened by getRooDataset and getRooDatasetFake.'''
+    FILEPOOL.close()
+
+def clearDatasets():
+    '''Drop the cached reduced datasets.'''
+    _datasets.clear()
+
+def mergeDatasets(name,*datasets):
+    '''
+    Concatenate datasets with the same variables (and weight) into a new dataset.
+    The storage is reserved once for all entries and the inputs are not copied
+    or changed, so the shared datasets from getRooDataset can be passed directly.
+    '''
+    merged = datasets[0].emptyClone(name,name)
+    store = merged.store()
+    if hasattr(store,'reserve'): store.reserve(sum([d.numEntries() for d in datasets]))
+    for d in datasets:
+        merged.append(d)
+    return merged
+
+###### Utility to get Roodatasets ########################
+def getRooDataset(f,selection='1',weight='w',xRange=[],yRange=[],project='',xVar='invMassMuMu',yVar='visFourbodyMass'):
+    '''Get a RooDataset (shared, clone before modifying)'''
+    return _getDataset(f,selection,weight,xRange,yRange,project,xVar,yVar)
+
+def getRooDatasetFake(f,selection='1',weight='fakeRateEfficiency',xRange=[],yRange=[],project='',xVar='invMassMuMu',yVar='visFourbodyMass'):
+    '''Get a DataDriven RooDataset (shared, clone before modifying)'''
+    return _getDataset(f,selection,weight,xRange,yRange,project,xVar,yVar)
@@ -0,0 +1,268 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+from CombineLimits.Limits.utilities import python_mkdir
+
+class EventCache(object):
+    '''
+    EventCache
+
+    A local columnar copy of the dataColl RooDataSets of the sample files.
+    Each file is read once and stored as one .npy array per variable in
+    directory/<hash of the file name>/, with a meta.json of the variable
+    ranges and of the mtime and size of the file, which is ingested again
+    when they change. directory/manifest.json lists the ingested files.
+    The arrays are memory mapped, the selections and range cuts are done
+    with NumPy and the RooDataSet/RooDataHist is built from the selected
+    events only.
+    '''
+
+    def __init__(self,directory):
+        self.directory = directory
+
+    def _path(self,f):
+        return os.path.join(self.directory,hashlib.sha1(f).hexdigest())
+
+    def isIngested(self,f):
+        '''True if f is in the cache and has not changed since (by mtime and size).'''
+        name = os.path.join(self._path(f),'meta.json')
+        if not os.path.exists(name): return False
+        with open(name) as mf:
+            meta = json.load(mf)
+        source = sourceStat(f)
+        if source is not None and meta.get('source')!=source:
+            logging.info('{} changed since it was ingested'.format(f))
+            return False
+        return True
+
+    def ingest(self,f,force=False):
+        '''Convert dataColl in file f to arrays, unless already done.'''
+        if self.isIngested(f) and not force: return
+        logging.info('Ingesting {}'.format(f))
+        start = time.time()
+        source = sourceStat(f)
+        tfile = ROOT.TFile.Open(f)
+        if not tfile or tfile.IsZombie():
+            raise IOError('Failed to open {}'.format(f))
+        ds = tfile.Get('dataColl')
+        args = ds.get()
+        variables = []
+        it = args.createIterator()
+        v = it.Next()
+        while v:
+            if v.InheritsFrom('RooRealVar'): variables += [v]
+            v = it.Next()
+        n = ds.numEntries()
+        columns = [np.empty(n) for v in variables]
+        for i in xrange(n):
+            ds.get(i)
+            for v, column in zip(variables,columns):
+                column[i] = v.getVal()
+        meta = {
+            'file'     : f,
+            'name'     : ds.GetName(),
+            'title'    : ds.GetTitle(),
+            'entries'  : n,
+            'source'   : source,
+            'variables': dict([(v.GetName(),[v.getMin(),v.getMax()]) for v in variables]),
+        }
+        tfile.Close()
+
+        # write to a temporary directory and move it in place, so that a reader never sees a partial entry
+        python_mkdir(self.directory)
+        tmp = tempfile.mkdtemp(dir=self.directory)
+        for v, column in zip(variables,columns):
+            np.save(os.path.join(tmp,'{}.npy'.format(v.GetName())),column)
+        with open(os.path.join(tmp,'meta.json'),'w') as mf:
+            mf.write(json.dumps(meta, indent=4, sort_keys=True))
+        path = self._path(f)
+        if os.path.exists(path): shutil.rmtree(path)
+        os.rename(tmp,path)
+        self._updateManifest(f,meta)
+        logging.info('Ingested {} events of {} in {:.1f} s'.format(n,f,time.time()-start))
+
+    def _updateManifest(self,f,meta):
+        name = os.path.join(self.directory,'manifest.json')
+        manifest = {}
+        if os.path.exists(name):
+            with open(name) as mf:
+                manifest = json.load(mf)
+        manifest[f] = {
+            'path'     : os.path.basename(self._path(f)),
+            'entries'  : meta['entries'],
+            'variables': sorted(meta['variables']),
+            'ingested' : time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+        with os.fdopen(fd,'w') as mf:
+            mf.write(json.dumps(manifest, indent=4, sort_keys=True))
+        os.rename(tmp,name)
+
+    def load(self,f):
+        '''Return the meta data and the (memory mapped) columns of file f, ingesting it if needed.'''
+        self.ingest(f)
+        path = self._path(f)
+        with open(os.path.join(path,'meta.json')) as mf:
+            meta = json.load(mf)
+        columns = dict([(str(v),np.load(os.path.join(path,'{}.npy'.format(v)),mmap_mode='r')) for v in meta['variables']])
+        return meta, columns
+
+    def select(self,f,selection='1',ranges={},rename={}):
+        '''
+        Return the selected columns of file f and their ranges.
+        The variables are renamed with rename before the ranges and the selection are applied,
+        events outside the range of any variable are dropped (as RooFit does).
+        Returns None if the selection is not understood (see parseSelection).
+        '''
+        cuts = parseSelection(selection)
+        if cuts is None: return None
+        meta, columns = self.load(f)
+        columns = dict([(rename.get(v,v),c) for v,c in columns.iteritems()])
+        varRanges = dict([(rename.get(v,v),r) for v,r in meta['variables'].iteritems()])
+        varRanges.update(ranges)
+        mask = np.ones(meta['entries'],dtype=bool)
+        for v, (low, high) in varRanges.iteritems():
+            mask &= (columns[v]>=low) & (columns[v]<=high)
+        for v, op, value in cuts:
+            if v not in columns: return None
+            mask &= OPERATORS[op](columns[v],value)
+        return dict([(v,np.asarray(c[mask])) for v,c in columns.iteritems()]), varRanges, meta
+
+    def dataset(self,f,selection='1',weight='w',xRange=[],yRange=[],project='',xVar='invMassMuMu',yVar='visFourbodyMass'):
+        '''Equivalent of RunIIDatasetUtils.getRooDataset built from the cache, None if the selection is not understood.'''
+        ranges = {}
+        if xRange: ranges[xVar] = xRange
+        if yRange: ranges[yVar] = yRange
+        result = self.select(f,selection,ranges=ranges,rename={'invMassMuMu':xVar,'visFourbodyMass':yVar})
+        if result is None: return None
+        columns, varRanges, meta = result
+        names = [project] if project else sorted(columns)
+        if weight and weight not in names: names += [weight]
+        if any([v not in columns for v in names]): return None
+        return buildDataset(meta['name'],meta['title'],columns,names,varRanges,weight)
+
+OPERATORS = {
+    '>' : np.greater,
+    '<' : np.less,
+    '>=': np.greater_equal,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+_cutRegex = re.compile(r'^\(?\s*([A-Za-z_]\w*)\s*(>=|<=|==|!=|>|<)\s*([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)\s*\)?$')
+
+def sourceStat(f):
+    '''[mtime, size] of file f, None if it is not a local (or mounted) file.'''
+    try:
+        stat = os.stat(f)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+def parseSelection(selection):
+    '''
+    Split a selection of the form "x>1 && x<2 && y>=0" into [(variable,operator,value)].
+    Returns None for anything else (||, functions, ...), the caller should then use RooFit.
+    '''
+    cuts = []
+    for term in selection.split('&&'):
+        term = term.strip()
+        if term in ['1','']: continue
+        match = _cutRegex.match(term)
+        if not match: return None
+        cuts += [(match.group(1),match.group(2),float(match.group(3)))]
+    return cuts
+
+_fillCode = '''
+#include "RooArgSet.h"
+#include "RooArgList.h"
+#include "RooRealVar.h"
+#include "RooDataSet.h"
+namespace EventCacheHelpers {
+// add the n events of the (nvars x n) values to ds, vars in the order of the rows
+void fillDataSet(RooDataSet& ds, const RooArgSet& args, const RooArgList& vars, const double* values, const double* weights, bool weighted, Long64_t n) {
+  std::vector<RooRealVar*> reals;
+  for (int j=0; j<vars.getSize(); ++j) reals.push_back(static_cast<RooRealVar*>(vars.at(j)));
+  for (Long64_t i=0; i<n; ++i) {
+    for (size_t j=0; j<reals.size(); ++j) reals[j]->setVal(values[j*n+i]);
+    if (weighted) ds.add(args,weights[i]);
+    else ds.add(args);
+  }
+}
+}
+'''
+
+def _fillDataSet(ds,args,variables,values,weights):
+    '''ds.add the events of the columns values (and weights) in compiled code, declared on the first call.'''
+    if not hasattr(ROOT,'EventCacheHelpers'):
+        ROOT.gInterpreter.Declare(_fillCode)
+    n = len(weights) if weights is not None else (len(values[0]) if values else 0)
+    varList = ROOT.RooArgList()
+    for var in variables:
+        varList.add(var)
+    values = np.ascontiguousarray(np.array(values,dtype=np.float64).reshape((len(variables),n)))
+    weighted = weights is not None
+    weights = np.ascontiguousarray(weights if weighted else np.ones(1),dtype=np.float64)
+    ROOT.EventCacheHelpers.fillDataSet(ds,args,varList,values,weights,weighted,n)
+
+def buildDataset(name,title,columns,names,ranges,weight=''):
+    '''Build a RooDataSet of the variables names from the columns.'''
+    variables = dict([(v,ROOT.RooRealVar(v,v,*ranges[v])) for v in names])
+    args = ROOT.RooArgSet()
+    for v in names:
+        args.add(variables[v])
+    if hasattr(ROOT.RooDataSet,'from_numpy'):
+        ds = ROOT.RooDataSet.from_numpy(dict([(v,columns[v]) for v in names]),args,name=name,title=title,weight_name=weight or None)
+    else:
+        if weight:
+            ds = ROOT.RooDataSet(name,title,args,ROOT.RooFit.WeightVar(weight))
+        else:
+            ds = ROOT.RooDataSet(name,title,args)
+        values = [v for v in names if v!=weight]
+        _fillDataSet(ds,args,[variables[v] for v in values],[columns[v] for v in values],columns[weight] if weight else None)
+    return ds
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Convert the RunII sample files to a columnar cache')
+
+    parser.add_argument('directory', type=str, help='Cache directory')
+    parser.add_argument('--samples', type=str, nargs='*', default=[], help='SampleMap2017 keys to ingest (default all)')
+    parser.add_argument('--force', action='store_true', help='Convert again even if already in the cache')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    from RunIISampleMaps import SampleMap2017
+
+    cache = EventCache(args.directory)
+    files = []
+    for sample in args.samples or sorted(SampleMap2017):
+        files += [f for f in SampleMap2017[sample] if f not in files]
+    for f in files:
+        cache.ingest(f,force=args.force)
+
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -5,6 +5,7 @@ import itertools
 import numpy as np
 import argparse
 import math
+import functools
 
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
@@ -23,6 +24,8 @@ ROOT.gROOT.SetBatch()
 #from CombineLimits.HaaLimits.HaaLimits2D import HaaLimits2D
 from CombineLimits.HaaLimits.HaaLimitsNew import HaaLimits
 from CombineLimits.HaaLimits.HaaLimits2DNew import HaaLimits2D
+from CombineLimits.Limits.utilities import LazyDict
+from CombineLimits.Limits.PlotQueue import deferPlots
 
 import CombineLimits.Plotter.CMS_lumi as CMS_lumi
 import CombineLimits.Plotter.tdrstyle as tdrstyle
@@ -219,9 +222,8 @@ def getDataset(File,type):
         dataset =getRooDataset(File,selection=' && '.join([selDatasets['invMassMuMu'],selDatasets['visFourbodyMass']]),xRange=thisxrange,weight='',yRange=thisyrange,project='xVar',xVar=xVar,yVar=yVar)
     else:
          dataset =getRooDataset(File,selection=selDatasets['invMassMuMu'],xRange=thisxrange,weight='w',xVar=xVar)  
-    global j
-    j+=1
-    return dataset.Clone('hist'+str(j))
+    # shared with other calls reading the same file and selection, clone before modifying
+    return dataset
 
 def getControlHist(proc,**kwargs):
     wrappers = kwargs.pop('wrappers',{})
@@ -279,7 +281,7 @@ def getHist(proc,**kwargs):
         if len(hists)>1:
             hist = sumDatasets(name,*hists) 
         else:
-            hist = hists[0].Clone(name)
+            hist = hists[0]
 
     else:
         hists = []
@@ -354,9 +356,7 @@ def sumHists(name,*hists):
 def sumDatasets(name,*datasets):
     global j
     j += 1
-    dataset = datasets[0].Clone(name+str(j))
-    for d in datasets[1:]:
-        dataset.append(d)
+    dataset = mergeDatasets(name+str(j),*datasets)
     #tempPlot('temp_{}'.format(name),dataset)
     return dataset
 
@@ -392,6 +392,9 @@ def create_datacard(args):
         logging.error('Unbinned only supported with parametric option')
         raise
 
+    if args.eventCache: useEventCache(args.eventCache)
+    if args.deferPlots: deferPlots(args.deferPlots)
+
     if chi2Mass and 'hkf' not in var:
         logging.error('Trying to use non-kinematic fit with chi2 cut')
         raise
@@ -450,6 +453,7 @@ def create_datacard(args):
     ### Create/read histograms ###
     ##############################
     
+    # histMap[mode][shift][proc] is lazy, the datasets are only read the first time they are used
     histMap = {}
     # The definitons of which regions match to which arguments
     # PP can take a fake rate datadriven estimate from FP, but FP can only take the observed values
@@ -460,112 +464,81 @@ def create_datacard(args):
     modes = ['PP','FP']
     thesesamples = backgrounds
     if not skipSignal: thesesamples = backgrounds + signals
+
+    def loadHist(mode,shift,proc):
+        global xRange
+        logging.info('Getting {} {} {}'.format(mode,proc,shift))
+        if proc=='datadriven':
+            if 'PP' in mode:
+                #if doMatrix:
+                #    return getMatrixDatadrivenHist(doUnbinned=True,var=var,wrappers=wrappers,shift=shift,do2D=do2D,chi2Mass=chi2Mass,**regionArgs[mode])
+                return getDatadrivenHist(doUnbinned=True,var=var,shift=shift,**regionArgs[mode])
+            else:
+                # if doMatrix:
+                #     return getMatrixHist('data',doUnbinned=True,var=var,wrappers=wrappers,shift=shift,do2D=do2D,chi2Mass=chi2Mass,**regionArgs[mode])
+                return getHist('data',doUnbinned=True,var=var,wrappers=wrappers,shift=shift,chi2Mass=chi2Mass,**regionArgs[mode])
+        # override xRange for signal only
+        oldXRange = xRange
+        if proc in signals: xRange = [0,30]
+        try:
+            return getHist(proc,doUnbinned=True,var=var,shift=shift,**regionArgs[mode])
+        finally:
+            xRange = oldXRange
+
+    def loadObserved(mode,shift,key):
+        logging.info('Getting observed {} {}'.format(mode,shift))
+        if not blind:
+            # the observed data, nothing is injected
+            hist = getHist('data',doUnbinned=True,var=var,shift=shift,**regionArgs[mode])
+            histMap[mode][shift]['data'] = hist
+            histMap[mode][shift]['dataNoSig'] = hist
+            return histMap[mode][shift][key]
+        samples = backgrounds
+        if addSignal: samples = backgrounds + [signalToAdd]
+        # the process datasets are only read by the merge, no need to clone them
+        histsNoSig = [histMap[mode][shift][proc] for proc in samples if proc!=signalToAdd]
+        hists = [histMap[mode][shift][proc] for proc in samples]
+        #if doUnbinned:
+        hist = sumDatasets('obs{}{}'.format(mode,shift),*hists)
+        if len(histsNoSig)==len(hists):
+            # no signal injected, data and dataNoSig are the same
+            histNoSig = hist
+        else:
+            histNoSig = sumDatasets('obsNoSig{}{}'.format(mode,shift),*histsNoSig)
+        #else:
+        #    hist = sumHists('obs{}{}'.format(mode,shift),*hists)
+        #    histNoSig = sumHists('obsNoSig{}{}'.format(mode,shift),*histsNoSig)
+        # both are built together, keep the other one too
+        histMap[mode][shift]['data'] = hist
+        histMap[mode][shift]['dataNoSig'] = histNoSig
+        return histMap[mode][shift][key]
+
     for mode in modes:
         histMap[mode] = {}
         for shift in ['']+shifts:
             #shiftLabel = systLabels.get(shift,shift)
-            histMap[mode][shift] = {}
+            histMap[mode][shift] = LazyDict()
             for proc in thesesamples:
-                logging.info('Getting {} {} {}'.format(mode,proc,shift))
-                if proc=='datadriven':
-                    if 'PP' in mode:
-                        #if doMatrix:
-                           # histMap[mode][shiftLabel][proc] = getMatrixDatadrivenHist(doUnbinned=True,var=var,wrappers=wrappers,shift=shift,do2D=do2D,chi2Mass=chi2Mass,**regionArgs[mode])
-                        #else:
-                        histMap[mode][shift][proc] = getDatadrivenHist(doUnbinned=True,var=var,shift=shift,**regionArgs[mode])
-                    else:
-                        # if doMatrix:
-                        #     histMap[mode][shiftLabel][proc] = getMatrixHist('data',doUnbinned=True,var=var,wrappers=wrappers,shift=shift,do2D=do2D,chi2Mass=chi2Mass,**regionArgs[mode]
-                                                                            
-                                                                            
-                        histMap[mode][shift][proc] = getHist('data',doUnbinned=True,var=var,wrappers=wrappers,shift=shift,chi2Mass=chi2Mass,**regionArgs[mode])
-                else:
-                    if proc in signals:
-                    #     newproc = 'gg'+proc
-                    # else:
-                    #     newproc = proc
-                    # override xRange for signal only
-                        oldXRange = xRange
-                        xRange = [0,30]
-                    # if doMatrix:
-                    #     histMap[mode][shiftLabel][proc] = getMatrixHist(newproc,doUnbinned=True,var=var,wrappers=wrappers,shift=shift,do2D=do2D,chi2Mass=chi2Mass,**regionArgs[mode])
-                    # else:
-                        histMap[mode][shift][proc] = getHist(proc,doUnbinned=True,var=var,shift=shift,**regionArgs[mode])
-                    xRange = oldXRange
-                #if do2D or doUnbinned:
-                #    pass # TODO, figure out how to rebin 2D
-                #else:
-                #    histMap[mode][shiftLabel][proc].Rebin(rebinning[var[0]])
-            #if shift: continue
-            logging.info('Getting observed')
-            samples = backgrounds
-            if addSignal: samples = backgrounds + [signalToAdd]
-            hists = []
-            histsNoSig = []
-            for proc in samples:
-                j+=1
-                hists += [histMap[mode][shift][proc].Clone('hist'+str(j))]
-                j+=1
-                if proc!=signalToAdd: histsNoSig += [histMap[mode][shift][proc].Clone('hist'+str(j))]
-            #if doUnbinned:
-            hist = sumDatasets('obs{}{}'.format(mode,shift),*hists)
-            histNoSig = sumDatasets('obsNoSig{}{}'.format(mode,shift),*histsNoSig)
-            #else:
-            #    hist = sumHists('obs{}{}'.format(mode,shift),*hists)
-            #    histNoSig = sumHists('obsNoSig{}{}'.format(mode,shift),*histsNoSig)
-            #for b in range(hist.GetNbinsX()+1):
-            #    val = int(hist.GetBinContent(b))
-            #    if val<0: val = 0
-            #    err = val**0.5
-            #    hist.SetBinContent(b,val)
-            #    #hist.SetBinError(b,err)
-            if blind:
-                j+=1
-                histMap[mode][shift]['data'] = hist.Clone('hist'+str(j))
-                j+=1
-                histMap[mode][shift]['dataNoSig'] = histNoSig.Clone('hist'+str(j))
-            else:
-                #hist = getHist('data',doUnbinned=True,var=var,wrappers=wrappers,do2D=do2D,chi2Mass=chi2Mass,**regionArgs[mode])
-                histMap[mode][shift][proc] = getHist(proc,doUnbinned=True,var=var,shift=shift,**regionArgs[mode])
-                j+=1
-                histMap[mode][shiftLabel]['data'] = hist.Clone('hist'+str(j))
-                j+=1
-                histMap[mode][shiftLabel]['dataNoSig'] = histNoSig.Clone('hist'+str(j))
-                #if do2D or doUnbinned:
-                #    pass
-                #else:
-                #    histMap[mode][shiftLabel]['data'].Rebin(rebinning[var[0]])
-                #    histMap[mode][shiftLabel]['dataNoSig'].Rebin(rebinning[var[0]])
-
-    for mode in ['control']:
-        histMap[mode] = {}
-        for shift in ['']:
-            #shiftLabel = systLabels.get(shift,shift)
-            histMap[mode][shift] = {}
-            for proc in backgrounds:
-                logging.info('Getting {} {}'.format(proc,shift))
-                if proc=='datadriven':
-                    hist = getControlHist('datadriven-control',doUnbinned=True,var=var)
-                    # if subtractSR:
-                    #     # subtract off the signal region and sideband from the control region
-                    #     for mode2 in modes:
-                    #         histsub = getHist('data',doUnbinned=False,var=var,wrappers=wrappers,do2D=False,chi2Mass=chi2Mass,**regionArgs[mode2])
-                    #         histsub.Rebin(histsub.GetNbinsX()/hist.GetNbinsX())
-                    #         hist.Add(histsub,-1)
-                    # histMap[mode][shiftLabel][proc] = hist
-            if shift: continue
-            logging.info('Getting observed')
-            hist = getControlHist('datadriven-control',doUnbinned=True,var=var,wrappers=wrappers_mm)
-            # if subtractSR:
-            #     # subtract off the signal region and sideband from the control region
-            #     for mode2 in modes:
-            #         histsub = getHist('data',doUnbinned=False,var=var,wrappers=wrappers,do2D=False,chi2Mass=chi2Mass,**regionArgs[mode2])
-            #         histsub.Rebin(histsub.GetNbinsX()/hist.GetNbinsX())
-            #         hist.Add(histsub,-1)
-            j+=1
-            histMap[mode][shift]['data'] = hist.Clone('hist'+str(j))
-            j+=1
-            histMap[mode][shift]['dataNoSig'] = hist.Clone('hist'+str(j))
+                histMap[mode][shift].setLoader(proc,functools.partial(loadHist,mode,shift,proc))
+            for key in ['data','dataNoSig']:
+                histMap[mode][shift].setLoader(key,functools.partial(loadObserved,mode,shift,key))
+
+    def loadControlObserved(key):
+        logging.info('Getting observed control')
+        hist = getControlHist('datadriven-control',doUnbinned=True,var=var,wrappers=wrappers_mm)
+        # if subtractSR:
+        #     # subtract off the signal region and sideband from the control region
+        #     for mode2 in modes:
+        #         histsub = getHist('data',doUnbinned=False,var=var,wrappers=wrappers,do2D=False,chi2Mass=chi2Mass,**regionArgs[mode2])
+        #         histsub.Rebin(histsub.GetNbinsX()/hist.GetNbinsX())
+        #         hist.Add(histsub,-1)
+        histMap['control']['']['data'] = hist
+        histMap['control']['']['dataNoSig'] = hist
+        return histMap['control'][''][key]
+
+    histMap['control'] = {'': LazyDict()}
+    for key in ['data','dataNoSig']:
+        histMap['control'][''].setLoader(key,functools.partial(loadControlObserved,key))
 
     # rescale signal
     scales = {}
@@ -616,6 +589,21 @@ def create_datacard(args):
     if 'h' in var:
         haaLimits.YCORRELATION = correlation
     haaLimits.SKIPPLOTS = skipPlots
+    haaLimits.WRITEJSON = not args.noJson
+    haaLimits.FITCACHE = args.fitCache
+    haaLimits.WARMSTART = args.warmStart
+    haaLimits.NORMCACHE = dict([(v.split(':')[0],int(v.split(':')[1])) for v in args.normCache])
+    haaLimits.FITCONFIG.update(
+        numCPU = args.numCPU,
+        numCPUStrategy = args.numCPUStrategy,
+        batchMode = args.batchMode,
+        offset = args.offset,
+        strategy = args.strategy,
+        tolerance = args.tolerance,
+        binnedThreshold = args.binnedFit,
+        binnedWidth = args.binnedFitWidth,
+        validateBinned = args.validateBinnedFit,
+    )
     haaLimits.SHIFTS = [systLabels.get(shift,shift) for shift in shiftTypes]
     haaLimits.SIGNALSHIFTS = [systLabels.get(shift,shift) for shift in signalShiftTypes]
     haaLimits.BACKGROUNDSHIFTS = [systLabels.get(shift,shift) for shift in backgroundShiftTypes]
@@ -635,24 +623,25 @@ def create_datacard(args):
     if 'h' in var or 'hkf' in var: haaLimits.YLABEL = 'm_{#mu#mu#tau_{#mu}#tau_{h}}'
     haaLimits.initializeWorkspace()
     haaLimits.addControlModels()
-    haaLimits.addBackgroundModels(fixAfterControl=True)
+    haaLimits.addBackgroundModels(fixAfterControl=True,nworkers=args.nworkers)
     if not skipSignal:
         haaLimits.XRANGE = [0,30] # override for signal splines
         if project:
-            haaLimits.addSignalModels(scale=scales)
+            haaLimits.addSignalModels(scale=scales,nworkers=args.nworkers)
         elif 'tt' in var:
             if args.yFitFunc:
-                haaLimits.addSignalModels(scale=scales,yFitFuncFP=args.yFitFunc,yFitFuncPP=args.yFitFunc)#,cutOffFP=0.0,cutOffPP=0.0)
+                haaLimits.addSignalModels(scale=scales,nworkers=args.nworkers,yFitFuncFP=args.yFitFunc,yFitFuncPP=args.yFitFunc)#,cutOffFP=0.0,cutOffPP=0.0)
             else:
-                haaLimits.addSignalModels(scale=scales,yFitFuncFP='V',yFitFuncPP='L')#,cutOffFP=0.75,cutOffPP=0.75)
+                haaLimits.addSignalModels(scale=scales,nworkers=args.nworkers,yFitFuncFP='V',yFitFuncPP='L')#,cutOffFP=0.75,cutOffPP=0.75)
         elif 'h' in var or 'hkf' in var:
             if args.yFitFunc:
-                haaLimits.addSignalModels(scale=scales,yFitFuncFP=args.yFitFunc,yFitFuncPP=args.yFitFunc)#,cutOffFP=0.0,cutOffPP=0.0)
+                haaLimits.addSignalModels(scale=scales,nworkers=args.nworkers,yFitFuncFP=args.yFitFunc,yFitFuncPP=args.yFitFunc)#,cutOffFP=0.0,cutOffPP=0.0)
             else:
-                haaLimits.addSignalModels(scale=scales,yFitFuncFP='DG',yFitFuncPP='DG')#,cutOffFP=0.0,cutOffPP=0.0)
+                haaLimits.addSignalModels(scale=scales,nworkers=args.nworkers,yFitFuncFP='DG',yFitFuncPP='DG')#,cutOffFP=0.0,cutOffPP=0.0)
         else:
-            haaLimits.addSignalModels(scale=scales)
+            haaLimits.addSignalModels(scale=scales,nworkers=args.nworkers)
         haaLimits.XRANGE = xRange
+    if args.exportFits: haaLimits.exportFits()
     if args.addControl: haaLimits.addControlData()
     haaLimits.addData(blind=blind,asimov=args.asimov,addSignal=args.addSignal,doBinned=not doUnbinned,**signalParams) # this will generate a dataset based on the fitted model
     haaLimits.setupDatacard(addControl=args.addControl,doBinned=not doUnbinned)
@@ -661,7 +650,9 @@ def create_datacard(args):
     if args.unbinned: name += '_unbinned'
     if args.tag: name += '_{}'.format(args.tag)
     if args.addSignal: name += '_wSig'
+    haaLimits.logImportStats()
     haaLimits.save(name=name)
+    closeFiles()
 
 
 def parse_command_line(argv):
@@ -688,6 +679,23 @@ def parse_command_line(argv):
     parser.add_argument('--tag', type=str, default='')
     parser.add_argument('--chi2Mass', type=int, default=0)
     parser.add_argument('--selection', type=str, default='')
+    parser.add_argument('--nworkers', type=int, default=1, help='Number of processes to use for the fits')
+    parser.add_argument('--fitCache', action='store_true', help='Reuse fit results whose inputs did not change')
+    parser.add_argument('--warmStart', action='store_true', help='Seed each central signal fit from the previous a mass of the same h')
+    parser.add_argument('--deferPlots', type=str, default='', help='Queue the plots in this directory instead of printing them (render with renderPlots.py)')
+    parser.add_argument('--exportFits', action='store_true', help='Write all the stored fit results as json after the signal fits')
+    parser.add_argument('--noJson', action='store_true', help='Only keep the fit results in the fit store, not as json')
+    parser.add_argument('--normCache', type=str, nargs='*', default=[], help='Tabulate the signal normalizations on a grid, VAR:POINTS (e.g. MA:100 CMS_haa_shift:20), every floating shape parameter must be listed or the pdf is not cached')
+    parser.add_argument('--numCPU', type=int, default=1, help='Processes per likelihood evaluation (RooFit NumCPU)')
+    parser.add_argument('--numCPUStrategy', type=int, default=0, choices=[0,1,2,3], help='NumCPU strategy (0 bulk, 1 interleave, 2 by component, 3 hybrid)')
+    parser.add_argument('--batchMode', action='store_true', help='Vectorized likelihood evaluation, if supported by ROOT')
+    parser.add_argument('--offset', action='store_true', help='Offset the likelihood')
+    parser.add_argument('--strategy', type=int, default=1, choices=[0,1,2], help='Minuit strategy')
+    parser.add_argument('--tolerance', type=float, default=None, help='Minuit tolerance, the fits are then done with createNLL and a RooMinimizer')
+    parser.add_argument('--binnedFit', type=int, default=0, help='Fit datasets with more entries than this binned (0: always unbinned)')
+    parser.add_argument('--binnedFitWidth', type=float, default=0.01, help='Bin width of the binned fits')
+    parser.add_argument('--validateBinnedFit', action='store_true', help='Also do the unbinned fits and log the parameter differences')
+    parser.add_argument('--eventCache', type=str, default='', help='Build the datasets from the columnar cache in this directory (see RunIIEventCache.py)')
 
     return parser.parse_args(argv)
 
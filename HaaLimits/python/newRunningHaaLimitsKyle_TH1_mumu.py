@@ -14,6 +14,7 @@ ROOT.gROOT.SetBatch()
 import CombineLimits.Limits.Models as Models
 from CombineLimits.Limits.Limits import Limits
 from CombineLimits.Limits.utilities import *
+import CombineLimits.Limits.HistArrays as HistArrays
 
 from HaaLimitsNew import *
 
@@ -34,20 +35,8 @@ def getDataset(ds,weight='w',selection='1',xRange=[],yRange=[]):
 
 def getTH1F(hist, dic, xMin=0, xMax=30, shift='', name='', region='PP'):
    print type(hist), name, shift
-   width = hist.GetBinWidth(3)
-   binedge = 0
-   newHist = ROOT.TH1F(hist.GetName(), hist.GetTitle(), hist.GetNbinsX(), hist.GetXaxis().GetXmin(), hist.GetXaxis().GetXmax())
+   newHist = HistArrays.maskRange(hist, xMin, xMax)
    newHist.SetDirectory(0)
-   newHist.AddDirectory(False)
-   for i in range(hist.GetNbinsX() ):
-      upperEdge = hist.GetBinCenter(i) + width/2
-      lowerEdge = hist.GetBinCenter(i) - width/2
-      if upperEdge > xMin and lowerEdge < xMax: 
-         newHist.SetBinContent(i, hist.GetBinContent(i) )
-         newHist.SetBinError(i,   hist.GetBinError(i) )
-      else:
-         newHist.SetBinContent(i,0)
-         newHist.SetBinError(i, 0)
    dic[region][shift][name] = newHist
      	
 
@@ -1,6 +1,7 @@
 import os
 import logging
 import random
+import math
 import errno
 import subprocess
 import argparse
@@ -9,6 +10,9 @@ import ROOT
 
 ROOT.gROOT.SetBatch()
 
+from CombineLimits.Limits.LimitTable import readLimits
+from CombineLimits.HaaLimits.runCombine import massString
+
 
 # helper functions
 def python_mkdir(dir):
@@ -35,10 +39,17 @@ parser.add_argument('--hmasses',type=int,default=[125,300,750],nargs='+',help='H
 parser.add_argument('--moderanges',type=str,default=['lowmass','upsilon','highmass'],choices=['lowmass','upsilon','highmass'],nargs='+',help='A mass ranges to run')
 parser.add_argument('--toys',type=int,default=2000,help='Number of toys')
 parser.add_argument('--toysPerJob',type=int,default=100,help='Number of toys per job')
+parser.add_argument('--pointsPerJob',type=int,default=1,help='(MA, r) points evaluated one after the other in each job, more than 1 packs all the A masses of an H mass into one submission, written to {mode}/{h}/packed; when the jobs are done, "python runCombine.py --split {dir}/{mode}/{h} {dir}/{mode}/{h}/packed/*.root" gives the per A mass directories of the unpacked submissions')
 parser.add_argument('--testing',action='store_true',help='Test does one point per mode')
 parser.add_argument('--verbose',action='store_true',help='Run combine with verbose')
 parser.add_argument('--convert',action='store_true',help='Only convert')
 parser.add_argument('--reduced',action='store_true',help='Reduced h/a grid for large statistics')
+parser.add_argument('--asymptotic',type=str,default='',help='Directory with the AsymptoticLimits results of runCombine (--outputDir, with --setMA), used to place the r points and toys')
+parser.add_argument('--asymptoticPattern',type=str,default='{dir}/{mode}/higgsCombineHToAAH{h}A{a}_{mode}.AsymptoticLimits.mH{h}.root',help='Path of the AsymptoticLimits result of a point, formatted with dir, mode, h and a (as runCombine writes it, 10.0 -> 10)')
+parser.add_argument('--minToys',type=int,default=200,help='Toys for the r points far from the CLs=0.05 crossings (with --asymptotic)')
+parser.add_argument('--coarsePoints',type=int,default=6,help='r points spread over the full range (with --asymptotic)')
+parser.add_argument('--finePoints',type=int,default=3,help='r points around each expected/observed crossing (with --asymptotic)')
+parser.add_argument('--fineWidth',type=float,default=0.1,help='Relative half width of the dense region around each crossing (with --asymptotic)')
 
 args = parser.parse_args()
 
@@ -113,13 +124,75 @@ altDRMap = {
     750: 0.5,
 }
 
+def readAsymptotic(path):
+    '''
+    The limits (2.5, 16, 50, 84, 97.5% expected and observed, nan if missing) from an AsymptoticLimits
+    output, matched by quantileExpected, [] if the file is missing or any expected limit is.
+    '''
+    if not os.path.exists(path): return []
+    qs = readLimits(path)
+    if qs is None or any([q!=q for q in qs[:5]]): return []
+    return qs
+
+def uniformRGrid(h,a):
+    '''The fixed grid of r points, all with the same number of toys'''
+    rmin = rMap[h][0] if a<8 else altRMap[h][0]
+    rmax = rMap[h][1] if a<8 else altRMap[h][1]
+    dr = drMap[h] if a<8 else altDRMap[h]
+    num_points = int((rmax-rmin)/dr)
+    return [(r*(rmax-rmin)/num_points + rmin, toys) for r in range(num_points)]
+
+def toysForR(r,crossings):
+    '''
+    Toys for a point at r.
+    Asymptotically log(CLs) goes as r^2, so for a crossing at c, CLs(r) ~ 0.05^((r/c)^2)
+    and d = |(r/c)^2-1| measures how far CLs(r) is from 0.05 (in units of log 0.05).
+    The toys fall off as a gaussian in d from toys at a crossing to minToys.
+    '''
+    d = min([abs((r/c)**2-1) for c in crossings])
+    weight = math.exp(-0.5*(d/(2*args.fineWidth))**2)
+    return int(round(args.minToys + (toys-args.minToys)*weight))
+
+def adaptiveRGrid(quartiles):
+    '''
+    r points placed densely around the CLs=0.05 crossings (the expected quantiles and
+    the observed limit) and sparsely over the rest of the range, with the toys per point
+    from toysForR. Returns [(r, toys)].
+    '''
+    crossings = [q for q in quartiles[:6] if q>0] # the observed limit is nan for blind results
+    rmin = 0.5*min(crossings)
+    rmax = 1.2*max(crossings)
+    rs = [rmin + i*(rmax-rmin)/max(args.coarsePoints-1,1) for i in range(args.coarsePoints)]
+    for c in crossings:
+        lo = c*(1-args.fineWidth)
+        hi = c*(1+args.fineWidth)
+        rs += [lo + i*(hi-lo)/max(args.finePoints-1,1) for i in range(args.finePoints)]
+    # merge points closer than 1% of the smallest crossing
+    minsep = 0.01*min(crossings)
+    merged = []
+    for r in sorted(rs):
+        if merged and r-merged[-1]<minsep: continue
+        merged += [r]
+    return [(r,toysForR(r,crossings)) for r in merged]
+
+def planRGrid(quartiles,h,a):
+    '''The r points and toys for (h,a), adaptive if there are asymptotic results'''
+    if quartiles: return adaptiveRGrid(quartiles)
+    return uniformRGrid(h,a)
+
 if doCrab:
     #scratchdir = '/nfs_scratch/{}/crab_projects'.format(user)
     scratchdir = 'crab_projects'
 else:
     scratchdir = '/nfs_scratch/{}/condor_projects'.format(user)
 
-def submit_condor(ws,quartiles,mode,h,a):
+def submit_condor(ws,grid,mode,h,a):
+    '''
+    Condor submission of grid, [(a, r, toys)], for the H mass h.
+    Each job evaluates pointsPerJob points (of toysPerJob toys each) one after the other,
+    with MA set by --setParameters, and merges the outputs in process (see runCombine.mergeJobOutputs).
+    a labels the submission, 'packed' for a grid with several A masses.
+    '''
     sample_dir = '{}/{}/{}/{}/{}'.format(scratchdir,jobname,mode,h,a)
     full_path = os.path.abspath(os.path.join(os.environ['CMSSW_BASE'],'src',ws))
     dsplit = full_path.split('/')
@@ -134,18 +207,8 @@ def submit_condor(ws,quartiles,mode,h,a):
         return
 
     # setup the job parameters
-    if quartiles:
-        rmin = 0.5*min(quartiles)
-        rmax = 1.2*max(quartiles)
-    else:
-        rmin = rMap[h][0] if a<8 else altRMap[h][0]
-        rmax = rMap[h][1] if a<8 else altRMap[h][1]
-    dr = drMap[h] if a<8 else altDRMap[h]
-    num_points = int((rmax-rmin)/dr)
-    points_per_job = 1
+    points_per_job = args.pointsPerJob
     toys_per_job = args.toysPerJob
-    jobs_per_point = int(toys/toys_per_job)
-    if jobs_per_point<1: jobs_per_point = 1
 
     # create dag dir
     dag_dir = '{}/dags/dag'.format(sample_dir)
@@ -156,26 +219,33 @@ def submit_condor(ws,quartiles,mode,h,a):
     output_dir = '/store/user/{}/{}/{}/{}/{}'.format(user, jobname, mode, h, a)
 
     # create file list
-    rlist = [r*(rmax-rmin)/num_points + rmin for r in range(int(num_points/points_per_job))]
     input_name = '{}/rvalues.txt'.format(dag_dir+'inputs')
+    units = []
+    for pa, r, rtoys in grid:
+        jobs_per_point = max(int(round(float(rtoys)/toys_per_job)),1)
+        units += ['{}_{:.4g}_{}'.format(pa,r,i) for i in range(jobs_per_point)]
+    # one line per job, farmout passes each line as a single input, so the points are joined without spaces
     with open(input_name,'w') as file:
-        for r in rlist:
-            for i in range(jobs_per_point):
-                file.write('{}_{}\n'.format(r,i))
+        for i in range(0,len(units),points_per_job):
+            file.write(','.join(units[i:i+points_per_job])+'\n')
 
     # create bash script
     bash_name = '{}/{}.sh'.format(dag_dir+'inputs', jobname)
     bashScript = '#!/bin/bash\n'
     #bashScript += 'printenv\n'
-    bashScript += 'read -d "_" -r RVAL < $INPUT\n'
-    for i in range(points_per_job):
-        dr = i*(rmax-rmin)/points_per_job
-        bashScript += 'combine -M HybridNew -v {verbosity} -d $CMSSW_BASE/{ws} -m {h} --setParameters MA={a} --freezeParameters=MA --LHCmode LHC-limits --singlePoint $(bc -l <<< "$RVAL+{points}") --rMax 30 --saveToys --saveHybridResult -T {toys} -s -1 --clsAcc 0\n'.format(ws=drel,h=h,a=a,points=dr,toys=toys_per_job,jobname=jobname,verbosity=2 if verbose else -1)
+    # one line of comma separated MA_r_index points per job, evaluated in turn on a single local copy of the workspace
+    bashScript += 'read -r POINTS < $INPUT\n'
+    bashScript += 'cp $CMSSW_BASE/{ws} workspace.root\n'.format(ws=drel)
+    bashScript += 'for POINT in ${POINTS//,/ }; do\n'
+    bashScript += '    IFS=_ read -r MA RVAL INDEX <<< "$POINT"\n'
+    bashScript += '    combine -M HybridNew -v {verbosity} -d workspace.root -m {h} --setParameters MA=$MA --freezeParameters=MA --LHCmode LHC-limits --singlePoint $RVAL --rMax 30 --saveToys --saveHybridResult -T {toys} -s -1 --clsAcc 0 -n _MA${{MA}}_r${{RVAL}}_${{INDEX}}\n'.format(h=h,toys=toys_per_job,verbosity=2 if verbose else -1)
+    bashScript += 'done\n'
     if points_per_job>1:
-        bashScript += 'hadd $OUTPUT higgsCombine*HybridNew.mH{}*.root\n'.format(h)
-        bashScript += 'rm higgsCombine*.root\n'.format(h)
+        bashScript += "python -c 'import sys; from CombineLimits.HaaLimits.runCombine import mergeJobOutputs; mergeJobOutputs(sys.argv[1])' $OUTPUT\n"
+        bashScript += 'rm higgsCombine*.root workspace.root\n'
     else:
-        bashScript += 'mv higgsCombine*.root $OUTPUT\n'.format(h)
+        bashScript += 'mv higgsCombine*.root $OUTPUT\n'
+        bashScript += 'rm workspace.root\n'
     with open(bash_name,'w') as file:
         file.write(bashScript)
     os.system('chmod +x {}'.format(bash_name))
@@ -186,30 +256,20 @@ def submit_condor(ws,quartiles,mode,h,a):
     farmoutString += ' --extra-usercode-files="{}" {} {}'.format(dreldir, jobname, bash_name)
 
     print farmoutString
+    if points_per_job>1 and a=='packed':
+        print '# when the jobs are done: python $CMSSW_BASE/src/CombineLimits/HaaLimits/python/runCombine.py --split /hdfs{0} /hdfs{1}/*.root'.format(os.path.dirname(output_dir),output_dir)
 
-def submit_crab(ws,quartiles,mode,h,a):
-    if quartiles:
-        rmin = min(quartiles[:5])*0.5
-        rmax = max(quartiles[:5])*1.2
-    else:
-        rmin = rMap[h][0] if a<8 else altRMap[h][0]
-        rmax = rMap[h][1] if a<8 else altRMap[h][1]
-    dr = drMap[h] if a<8 else altDRMap[h]
-    num_points = int((rmax-rmin)/dr)
-    points_per_job = 1
+def submit_crab(ws,grid,mode,h,a):
+    '''Crab submission of grid, [(r, toys)], for (h,a), combineTool packs pointsPerJob points into each job'''
     toys_per_job = args.toysPerJob
-    jobs_per_point = int(toys/toys_per_job)
-    if jobs_per_point<1: jobs_per_point = 1
 
-    # this will do multiple r values in a regular grid
-    pointsString = '{:.3}:{:.3}:{:.3}'.format(rmin,rmax,dr)
+    # points with the same number of jobs share one task, seeded per job
+    groups = {}
+    for r, rtoys in grid:
+        groups.setdefault(max(int(round(float(rtoys)/toys_per_job)),1),[]).append(r)
 
     crab = 'custom_crab_{mode}_{h}_{a}.py'.format(mode=mode,h=h,a=a)
 
-    # this will create multiple jobs for each point with the specified seed
-    seedint = random.randint(1,123456)
-    seeds = '{}:{}:{}'.format(seedint,seedint+jobs_per_point-1,1) if jobs_per_point>1 else str(seedint)
-
     # note: blacklist set Oct 31, 2019
     crabString = '''
 def custom_crab(config):
@@ -224,10 +284,17 @@ def custom_crab(config):
     with open('{temp}/{crab}'.format(temp=temp,crab=crab),'w') as f:
         f.write(crabString)
 
-    command = 'combineTool.py -M HybridNew -v {verbosity} -d {ws} -m {h} --setParameters MA={a} --freezeParameters=MA --LHCmode LHC-limits --singlePoint {points} --rMax 30 --saveToys --saveHybridResult -T {toys} -s {seeds} --clsAcc 0 --job-mode crab3 --task-name {jobname} --custom-crab {crab}'.format(ws=ws,h=h,a=a,points=pointsString,toys=toys_per_job,jobname=jobname,seeds=seeds,crab=crab,verbosity=2 if verbose else -1)
-    #command += ' --fullBToys'
-    #command += ' --dry-run'
-    print command
+    for jobs_per_point in sorted(groups):
+        # this will do the r values of the group, creating multiple jobs for each point with the specified seed
+        pointsString = ','.join(['{:.4g}'.format(r) for r in groups[jobs_per_point]])
+        seedint = random.randint(1,123456)
+        seeds = '{}:{}:{}'.format(seedint,seedint+jobs_per_point-1,1) if jobs_per_point>1 else str(seedint)
+        taskname = '{}_{}'.format(jobname,jobs_per_point) if len(groups)>1 else jobname
+        command = 'combineTool.py -M HybridNew -v {verbosity} -d {ws} -m {h} --setParameters MA={a} --freezeParameters=MA --LHCmode LHC-limits --singlePoint {points} --rMax 30 --saveToys --saveHybridResult -T {toys} -s {seeds} --clsAcc 0 --job-mode crab3 --task-name {jobname} --custom-crab {crab}'.format(ws=ws,h=h,a=a,points=pointsString,toys=toys_per_job,jobname=taskname,seeds=seeds,crab=crab,verbosity=2 if verbose else -1)
+        if args.pointsPerJob>1: command += ' --merge {}'.format(args.pointsPerJob)
+        #command += ' --fullBToys'
+        #command += ' --dry-run'
+        print command
 
 
 
@@ -242,6 +309,7 @@ for moderange in moderanges:
         print 'text2workspace.py {datacard} -m {h} -o {temp}/{ws}'.format(datacard=datacard,h=h,temp=temp,ws=ws)
         if doCrab: print 'pushd {temp}'.format(temp=temp)
         prev_qs = []
+        packed = []
         thisamasses = amasses
         if moderange=='lowmass':
             thisamasses = lowmass_amasses
@@ -259,34 +327,29 @@ for moderange in moderanges:
             else: astr = 'HELP'
 
             qs = []
-            # turn off for now
-            #tfile = ROOT.TFile.Open('{hdfs}/{m}/{h}/higgsCombineHToAAH{h}A{a:.1f}_{m}.AsymptoticLimits.mH{h}.root'.format(hdfs=hdfs,h=h,a=a,m=thismode,astr=astr))
-            #try:
-            #    tree = tfile.Get("limit")
-            #except:
-            #    logging.error('Failed to open {} {} {}'.format(thismode,h,a))
-            #    continue
-            #for i, row in enumerate(tree):
-            #    qs += [row.limit]
-            #outline = ' '.join([str(x) for x in qs])
-            #logging.info('{0}:{1}: Limits: {2}'.format(h,a,outline))
-
-            #if not prev_qs: prev_qs = qs
-
-            #if abs(qs[2]-prev_qs[2])/qs[2]>0.3:
-            #    logging.info('{}:{}: Large jump in AsymptoticLimit, will use previous a mass limits for bounds'.format(h,a))
-            #    qs = prev_qs
-
-            #prev_qs = qs
-
-            #if len(qs)<6:
-            #    logging.info('{}:{}: Too few limits, will not sumbit'.format(h,a))
-            #    continue
-
+            if args.asymptotic:
+                path = args.asymptoticPattern.format(dir=args.asymptotic,mode=thismode,h=h,a=massString(a))
+                qs = readAsymptotic(path)
+                if not qs:
+                    logging.error('{}:{}: No AsymptoticLimits result in {}, will use the fixed r grid'.format(h,a,path))
+                    qs = []
+                else:
+                    logging.info('{0}:{1}: Limits: {2}'.format(h,a,' '.join([str(x) for x in qs])))
+                    if prev_qs and abs(qs[2]-prev_qs[2])/qs[2]>0.3:
+                        logging.info('{}:{}: Large jump in AsymptoticLimit, will use previous a mass limits for bounds'.format(h,a))
+                        qs = prev_qs
+                    prev_qs = qs
+
+            grid = planRGrid(qs,h,a)
             if doCrab:
-                submit_crab(ws,qs,thismode,h,a)
+                submit_crab(ws,grid,thismode,h,a)
+            elif args.pointsPerJob>1:
+                packed += [(astr,r,rtoys) for r, rtoys in grid]
             else:
-                submit_condor('{temp}/{ws}'.format(temp=temp,ws=ws),qs,thismode,h,a)
+                submit_condor('{temp}/{ws}'.format(temp=temp,ws=ws),[(astr,r,rtoys) for r, rtoys in grid],thismode,h,a)
+
+        if packed:
+            submit_condor('{temp}/{ws}'.format(temp=temp,ws=ws),packed,thismode,h,'packed')
 
         if doCrab: print 'popd'
 
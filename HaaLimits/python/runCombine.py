@@ -0,0 +1,367 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+from CombineLimits.Limits.utilities import python_mkdir
+
+logging.basicConfig(format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+
+class Manifest(object):
+    '''
+    Manifest
+
+    The status of every point of a run, one json file per point in
+    directory, recording its status (done or failed), output file, log,
+    run time and number of attempts. Each file is written atomically, so
+    an interrupted run can be resumed and separate batch jobs never
+    overwrite each other's entries.
+    '''
+
+    def __init__(self,directory):
+        self.directory = directory
+
+    def _path(self,name):
+        return os.path.join(self.directory,'{}.json'.format(name))
+
+    def get(self,name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def update(self,name,**kwargs):
+        entry = self.get(name)
+        entry.update(kwargs)
+        python_mkdir(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+        with os.fdopen(fd,'w') as f:
+            f.write(json.dumps(entry, indent=4, sort_keys=True))
+        os.rename(tmp,self._path(name))
+
+    def isDone(self,name):
+        entry = self.get(name)
+        return entry.get('status')=='done' and isComplete(entry.get('output',''))
+
+    def summary(self,names):
+        '''Split names into the done, failed and not yet run points'''
+        done = [n for n in names if self.isDone(n)]
+        failed = [n for n in names if n not in done and self.get(n).get('status')=='failed']
+        missing = [n for n in names if n not in done and n not in failed]
+        return done, failed, missing
+
+def isComplete(output):
+    '''Whether a combine output exists and has entries in its limit tree'''
+    if not output or not os.path.exists(output): return False
+    tfile = ROOT.TFile.Open(output)
+    if not tfile or tfile.IsZombie(): return False
+    tree = tfile.Get('limit')
+    n = tree.GetEntries() if tree else 0
+    tfile.Close()
+    return n>0
+
+def massString(m):
+    '''3.6 -> "3.6", 10.0 -> "10", as combine writes the mass in its output names'''
+    return '{:g}'.format(round(m,3))
+
+def massGrid(start,stop,step):
+    '''Masses from start to stop (inclusive) in steps of step, without the float drift of repeated addition'''
+    n = int(round((stop-start)/step))
+    return [round(start+i*step,6) for i in range(n+1)]
+
+def datacardTag(datacard,h):
+    '''
+    The tag of a datacard, its name without _HToAAH{h}AX.txt (lowmass_HToAAH125AX.txt -> lowmass),
+    which names its points and its directory of outputDir. The cards of a directory differ only by this.
+    '''
+    name = os.path.basename(datacard)
+    suffix = '_HToAAH{}AX.txt'.format(h)
+    if name.endswith(suffix): return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+def buildWorkspace(datacard,workspace,h,force=False):
+    '''Run text2workspace once, the workspace is reused while it is newer than the datacard'''
+    if not force and os.path.exists(workspace) and os.path.getmtime(workspace)>=os.path.getmtime(datacard):
+        logging.info('Reusing {}'.format(workspace))
+        return
+    python_mkdir(os.path.dirname(workspace) or '.')
+    command = ['text2workspace.py',datacard,'-m',str(h),'-o',workspace]
+    logging.info(' '.join(command))
+    subprocess.check_call(command)
+
+def asymptoticPoint(workspace,h,a,tag,setMA=False,extra=[]):
+    '''
+    The combine AsymptoticLimits command for one a mass, and the name of its output.
+    With setMA the Higgs mass is passed with -m and MA is set and frozen
+    (the 2D datacards), otherwise the a mass is passed with -m (the 1D datacards).
+    '''
+    astr = massString(a)
+    name = 'HToAAH{}A{}{}'.format(h,astr,'_'+tag if tag else '')
+    mass = str(h) if setMA else astr
+    command = ['combine','-M','AsymptoticLimits','-d',workspace,'-m',mass,'-n',name]
+    if setMA: command += ['--setParameters','MA={}'.format(astr),'--freezeParameters','MA']
+    command += list(extra)
+    output = 'higgsCombine{}.AsymptoticLimits.mH{}.root'.format(name,mass)
+    return {'name': name, 'command': command, 'output': output}
+
+def runPoint(point,outputDir):
+    '''
+    Run one combine command in its own scratch directory (combine writes temporary
+    files to the working directory) and move the output to outputDir.
+    Returns the point name, whether it succeeded, the output path and the run time.
+    '''
+    start = time.time()
+    scratch = tempfile.mkdtemp(prefix='combine_')
+    log = os.path.join(outputDir,'logs','{}.log'.format(point['name']))
+    output = os.path.join(outputDir,point['output'])
+    try:
+        with open(log,'w') as f:
+            f.write(' '.join(point['command'])+'\n')
+            f.flush()
+            status = subprocess.call(point['command'],cwd=scratch,stdout=f,stderr=subprocess.STDOUT)
+        produced = os.path.join(scratch,point['output'])
+        if os.path.exists(produced): shutil.move(produced,output)
+    finally:
+        shutil.rmtree(scratch,ignore_errors=True)
+    ok = status==0 and isComplete(output)
+    return point['name'], ok, output, log, time.time()-start
+
+def runJob(args):
+    '''Run a group of points sequentially in one worker.'''
+    points, outputDir = args
+    return [runPoint(point,outputDir) for point in points]
+
+def runPoints(points,outputDir,nworkers=1,pointsPerJob=1,retries=0):
+    '''
+    Run the points not yet done according to the manifest in outputDir.
+    The points are grouped pointsPerJob at a time and the groups are spread over
+    nworkers processes. Failed points are rerun up to retries times.
+    Returns the manifest.
+    '''
+    python_mkdir(os.path.join(outputDir,'logs'))
+    manifest = Manifest(os.path.join(outputDir,'manifest'))
+    for attempt in range(retries+1):
+        todo = [p for p in points if not manifest.isDone(p['name'])]
+        if not todo: break
+        logging.info('Running {} of {} points{}'.format(len(todo),len(points),' (retry {})'.format(attempt) if attempt else ''))
+        jobs = [(todo[i:i+pointsPerJob],outputDir) for i in range(0,len(todo),pointsPerJob)]
+        if nworkers>1 and len(jobs)>1:
+            pool = multiprocessing.Pool(min(nworkers,len(jobs)))
+            results = pool.imap_unordered(runJob,jobs)
+        else:
+            pool = None
+            results = (runJob(job) for job in jobs)
+        try:
+            for job in results:
+                for name, ok, output, log, runtime in job:
+                    attempts = manifest.get(name).get('attempts',0)+1
+                    manifest.update(name,status='done' if ok else 'failed',output=output,log=log,time=runtime,attempts=attempts)
+                    if not ok: logging.warning('{} failed, see {}'.format(name,log))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+    done, failed, missing = manifest.summary([p['name'] for p in points])
+    logging.info('{} done, {} failed, {} not run'.format(len(done),len(failed),len(missing)))
+    return manifest
+
+def _copyResults(inputs,directory):
+    '''Merge the limit trees of inputs into directory and copy their toys directories'''
+    chain = ROOT.TChain('limit')
+    toysDir = None
+    for f in inputs:
+        chain.Add(f)
+        tfile = ROOT.TFile.Open(f)
+        if not tfile or tfile.IsZombie():
+            logging.warning('Failed to open {}'.format(f))
+            continue
+        toys = tfile.Get('toys')
+        if toys:
+            if not toysDir: toysDir = directory.mkdir('toys')
+            for key in toys.GetListOfKeys():
+                toysDir.WriteTObject(key.ReadObj(),key.GetName())
+        tfile.Close()
+    directory.cd()
+    if chain.GetEntries():
+        tree = chain.CloneTree(-1,'fast')
+        tree.Write()
+
+def mergeOutputs(target,inputs,groups=None):
+    '''
+    Merge combine outputs (the limit trees and the HybridNew toys) into target, in
+    process instead of with hadd. With groups, {name: inputs}, each group goes to its
+    own directory of target, so that points of different MA (whose toys are named by
+    mh and r only) are kept apart; see splitOutputs.
+    '''
+    out = ROOT.TFile.Open(target,'RECREATE')
+    if groups:
+        for name in sorted(groups):
+            _copyResults(groups[name],out.mkdir(name))
+    else:
+        _copyResults(inputs,out)
+    out.Close()
+
+def splitOutputs(merged,outputDir,name='higgsCombine{group}.HybridNew.root'):
+    '''
+    Write each directory of a grouped merged output (see mergeOutputs) to its own file, as combine reads them.
+    name is formatted with the group and, for the MA groups of mergeJobOutputs, a (MA7 -> 7.0).
+    '''
+    tfile = ROOT.TFile.Open(merged)
+    outputs = []
+    for key in tfile.GetListOfKeys():
+        if not key.IsFolder() or key.GetName()=='toys': continue
+        group = tfile.Get(key.GetName())
+        a = str(float(key.GetName()[2:])) if key.GetName().startswith('MA') else key.GetName()
+        output = os.path.join(outputDir,name.format(group=key.GetName(),a=a))
+        python_mkdir(os.path.dirname(output) or '.')
+        out = ROOT.TFile.Open(output,'RECREATE')
+        toys = group.Get('toys')
+        if toys:
+            toysDir = out.mkdir('toys')
+            for tkey in toys.GetListOfKeys():
+                toysDir.WriteTObject(tkey.ReadObj(),tkey.GetName())
+        out.cd()
+        tree = group.Get('limit')
+        if tree: tree.CloneTree(-1,'fast').Write()
+        out.Close()
+        outputs += [output]
+    tfile.Close()
+    return outputs
+
+def mergeJobOutputs(target,pattern='higgsCombine_MA*.root'):
+    '''
+    Merge the outputs of a packed HybridNew job (see prepareGridSubmission), grouped by MA.
+    The output always has one directory per MA, even for a single MA, so that the outputs
+    of all the jobs can be added with hadd and split with splitOutputs.
+    '''
+    groups = {}
+    for f in sorted(glob.glob(pattern)):
+        ma = os.path.basename(f).split('_')[1]
+        groups.setdefault(ma,[]).append(f)
+    mergeOutputs(target,[],groups=groups)
+
+def splitJobOutputs(inputs,outputDir):
+    '''
+    Add the outputs of the packed HybridNew jobs (see mergeJobOutputs) with hadd and split
+    them by MA into outputDir/{a}/higgsCombine_MA{a}.HybridNew.root, the layout of the
+    unpacked submissions (one directory per a mass) read with --readHybridResults.
+    '''
+    python_mkdir(outputDir)
+    merged = os.path.join(outputDir,'merged_{}.root'.format(os.getpid()))
+    command = ['hadd','-f',merged]+list(inputs)
+    logging.info(' '.join(command[:3]+['({} files)'.format(len(inputs))]))
+    subprocess.check_call(command)
+    try:
+        outputs = splitOutputs(merged,outputDir,name='{a}/higgsCombine_{group}.HybridNew.root')
+    finally:
+        os.remove(merged)
+    logging.info('Split {} files into {} a masses in {}'.format(len(inputs),len(outputs),outputDir))
+    return outputs
+
+def writeJobScripts(jobDir,argv,masses,pointsPerJob):
+    '''
+    Write one batch script per group of pointsPerJob a masses, each calling this
+    script for its masses only, so the environment and workspace are set up once
+    per group. Returns the script names.
+    '''
+    python_mkdir(jobDir)
+    scripts = []
+    for i in range(0,len(masses),pointsPerJob):
+        script = os.path.join(jobDir,'job_{}.sh'.format(i//pointsPerJob))
+        with open(script,'w') as f:
+            f.write('#!/bin/bash\n')
+            f.write('cd {}\n'.format(os.path.join(os.environ.get('CMSSW_BASE','.'),'src')))
+            f.write('eval `scramv1 runtime -sh`\n')
+            f.write('cd -\n')
+            f.write('python {} {} --retries 0 --points {}\n'.format(os.path.abspath(__file__),' '.join(argv),' '.join([massString(a) for a in masses[i:i+pointsPerJob]])))
+        os.chmod(script,0o755)
+        scripts += [script]
+    return scripts
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Run combine AsymptoticLimits over an a mass grid')
+
+    parser.add_argument('datacards', type=str, nargs='+', help='Datacards, or directories with *_HToAAH{h}AX.txt datacards (the packed job outputs with --split)')
+    parser.add_argument('--higgs', type=int, default=125, help='Higgs mass')
+    parser.add_argument('--amasses', type=float, nargs=3, default=[3.6,21,0.1], metavar=('START','STOP','STEP'), help='a mass grid')
+    parser.add_argument('--points', type=float, nargs='*', default=[], help='Explicit a masses (instead of --amasses)')
+    parser.add_argument('--setMA', action='store_true', help='Pass -m HIGGS and set MA instead of -m A (2D datacards)')
+    parser.add_argument('--outputDir', type=str, default='combine', help='Where the workspaces, outputs, logs and manifest go, in one directory per datacard (see datacardTag)')
+    parser.add_argument('--nworkers', type=int, default=1, help='Number of local processes')
+    parser.add_argument('--pointsPerJob', type=int, default=1, help='Points run one after the other by a worker or batch job')
+    parser.add_argument('--retries', type=int, default=1, help='Reruns of failed points')
+    parser.add_argument('--forceWorkspace', action='store_true', help='Rerun text2workspace even if the workspace is up to date')
+    parser.add_argument('--writeJobs', type=str, default='', help='Write batch scripts in this directory instead of running')
+    parser.add_argument('--status', action='store_true', help='Only print the done/failed/missing points')
+    parser.add_argument('--extra', type=str, default='', help='Extra combine options')
+    parser.add_argument('--split', type=str, default='', metavar='OUTDIR', help='Instead of running, hadd the packed HybridNew job outputs (prepareGridSubmission --pointsPerJob) and split them into OUTDIR/{a}/')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    if args.split:
+        splitJobOutputs(args.datacards,args.split)
+        return 0
+
+    amasses = args.points or massGrid(*args.amasses)
+
+    datacards = []
+    for d in args.datacards:
+        if os.path.isdir(d):
+            datacards += sorted(glob.glob(os.path.join(d,'*_HToAAH{}AX.txt'.format(args.higgs))))
+        else:
+            datacards += [d]
+
+    status = 0
+    for datacard in datacards:
+        tag = datacardTag(datacard,args.higgs)
+        outputDir = os.path.join(args.outputDir,tag)
+        workspace = os.path.abspath(os.path.join(outputDir,os.path.basename(datacard).replace('.txt','.root')))
+        points = [asymptoticPoint(workspace,args.higgs,a,tag,setMA=args.setMA,extra=args.extra.split()) for a in amasses]
+
+        if args.status:
+            manifest = Manifest(os.path.join(outputDir,'manifest'))
+            done, failed, missing = manifest.summary([p['name'] for p in points])
+            print '{}: {} done, {} failed, {} missing'.format(datacard,len(done),len(failed),len(missing))
+            for name in failed: print '    failed  {}'.format(name)
+            for name in missing: print '    missing {}'.format(name)
+            continue
+
+        if args.writeJobs:
+            buildWorkspace(datacard,workspace,args.higgs,force=args.forceWorkspace)
+            manifest = Manifest(os.path.join(outputDir,'manifest'))
+            masses = [a for a, p in zip(amasses,points) if not manifest.isDone(p['name'])]
+            jobArgv = [os.path.abspath(datacard),'--higgs',str(args.higgs),'--outputDir',os.path.abspath(args.outputDir)]
+            if args.setMA: jobArgv += ['--setMA']
+            if args.extra: jobArgv += ['--extra',"'{}'".format(args.extra)]
+            scripts = writeJobScripts(os.path.join(args.writeJobs,tag),jobArgv,masses,args.pointsPerJob)
+            logging.info('Wrote {} job scripts for {} points to {}'.format(len(scripts),len(masses),os.path.join(args.writeJobs,tag)))
+            continue
+
+        buildWorkspace(datacard,workspace,args.higgs,force=args.forceWorkspace)
+        manifest = runPoints(points,outputDir,nworkers=args.nworkers,pointsPerJob=args.pointsPerJob,retries=args.retries)
+        done, failed, missing = manifest.summary([p['name'] for p in points])
+        if failed or missing: status = 1
+
+    return status
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
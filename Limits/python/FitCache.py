@@ -0,0 +1,187 @@
+import os
+import time
+import hashlib
+import pickle
+import logging
+import tempfile
+
+import numpy as np
+
+import ROOT
+
+from CombineLimits.Limits.Models import Model
+from CombineLimits.Limits.HistArrays import _view
+from CombineLimits.Limits.utilities import python_mkdir
+
+class FitCache(object):
+    '''
+    FitCache
+
+    A content-addressed store of fit results.
+    Each entry is keyed on a hash of everything the fit depends on
+    (see fitKey) and pickled to its own file in the cache directory.
+    Entries unused for maxAge seconds are evicted, as are the least
+    recently used ones once the cache grows beyond maxSize bytes.
+    '''
+
+    def __init__(self,directory,maxSize=100*1024**2,maxAge=30*24*3600):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+
+    def _path(self,key):
+        return os.path.join(self.directory,'{}.pkl'.format(key))
+
+    def get(self,key):
+        '''Return the cached result for a key, None if there is none.'''
+        path = self._path(key)
+        try:
+            with open(path,'rb') as f:
+                result = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            logging.debug('Fit cache miss {}'.format(key))
+            return None
+        os.utime(path,None) # mark as recently used
+        logging.debug('Fit cache hit {}'.format(key))
+        return result
+
+    def put(self,key,result):
+        '''
+        Store the result for a key.
+        The entry is written to a temporary file and renamed so that
+        concurrent fit workers never read a partial entry.
+        '''
+        python_mkdir(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            pickle.dump(result,f,pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp,self._path(key))
+        self.evict()
+
+    def evict(self):
+        '''Remove entries older than maxAge, then the least recently used ones beyond maxSize.'''
+        now = time.time()
+        entries = []
+        for fname in os.listdir(self.directory):
+            if not fname.endswith('.pkl'): continue
+            path = os.path.join(self.directory,fname)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # already removed by another worker
+            if self.maxAge and now-stat.st_mtime>self.maxAge:
+                self._remove(path)
+            else:
+                entries += [(stat.st_mtime,stat.st_size,path)]
+        if not self.maxSize: return
+        total = sum([size for mtime,size,path in entries])
+        for mtime, size, path in sorted(entries):
+            if total<=self.maxSize: break
+            self._remove(path)
+            total -= size
+
+    def _remove(self,path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def fitKey(*objects):
+    '''
+    Hash the inputs of a fit.
+    The supported objects are:
+        TH1        : binning, contents and errors
+        RooAbsData : every entry and its weight (read into one buffer in compiled
+                     code), and the ranges of the variables
+        RooAbsArg  : class and name of every component, and the value, range
+                     and constness of every variable (including the observables,
+                     so the fit range is part of the key)
+        Model      : the model class and the kwargs it was built with
+        dict, list, tuple : their contents
+    anything else is hashed by its repr.
+    '''
+    h = hashlib.sha1()
+    for obj in objects:
+        _update(h,obj)
+    return h.hexdigest()
+
+def _iterate(argset):
+    it = argset.createIterator()
+    arg = it.Next()
+    while arg:
+        yield arg
+        arg = it.Next()
+
+_valuesCode = '''
+#include <vector>
+#include "RooAbsData.h"
+#include "RooAbsReal.h"
+#include "RooAbsCategory.h"
+#include "RooArgList.h"
+namespace FitCacheHelpers {
+// the values of vars and the weight of every entry of data, entry by entry
+std::vector<double> dataValues(const RooAbsData& data, const RooArgList& vars) {
+  std::vector<double> values;
+  const RooArgSet* row = data.get();
+  std::vector<RooAbsReal*> reals;
+  std::vector<RooAbsCategory*> cats;
+  for (int j=0; j<vars.getSize(); ++j) {
+    RooAbsArg* arg = row->find(vars.at(j)->GetName());
+    reals.push_back(dynamic_cast<RooAbsReal*>(arg));
+    cats.push_back(dynamic_cast<RooAbsCategory*>(arg));
+  }
+  values.reserve(data.numEntries()*(reals.size()+1));
+  for (Int_t i=0; i<data.numEntries(); ++i) {
+    data.get(i);
+    for (size_t j=0; j<reals.size(); ++j) {
+      if (reals[j]) values.push_back(reals[j]->getVal());
+      else values.push_back(cats[j] ? cats[j]->getIndex() : 0.);
+    }
+    values.push_back(data.weight());
+  }
+  return values;
+}
+}
+'''
+
+def _dataValues(data,variables):
+    '''The (entries x variables+weight) values of data as an array, filled in compiled code declared on the first call.'''
+    if not hasattr(ROOT,'FitCacheHelpers'):
+        ROOT.gInterpreter.Declare(_valuesCode)
+    varList = ROOT.RooArgList()
+    for v in variables:
+        varList.add(v)
+    values = ROOT.FitCacheHelpers.dataValues(data,varList)
+    if not values.size(): return np.zeros(0)
+    return np.array(_view(values.data(),values.size(),np.float64))
+
+def _variables(argset):
+    return sorted(_iterate(argset),key=lambda v: v.GetName())
+
+def _update(h,obj):
+    if isinstance(obj,ROOT.TH1):
+        h.update(obj.ClassName())
+        for axis in [obj.GetXaxis(),obj.GetYaxis(),obj.GetZaxis()]:
+            h.update(repr([axis.GetBinLowEdge(b) for b in range(1,axis.GetNbins()+2)]))
+        h.update(repr([(obj.GetBinContent(b),obj.GetBinError(b)) for b in range(obj.GetNcells())]))
+    elif isinstance(obj,ROOT.RooAbsData):
+        h.update(obj.ClassName())
+        variables = _variables(obj.get())
+        _update(h,variables)
+        h.update(repr(obj.numEntries()))
+        h.update(_dataValues(obj,variables).tostring())
+    elif isinstance(obj,ROOT.RooRealVar):
+        h.update(repr((obj.GetName(),obj.getVal(),obj.getMin(),obj.getMax(),obj.isConstant())))
+    elif isinstance(obj,ROOT.RooAbsArg):
+        h.update(repr([(c.ClassName(),c.GetName(),c.GetTitle()) for c in _variables(obj.getComponents())]))
+        _update(h,[v for v in _variables(obj.getVariables()) if isinstance(v,ROOT.RooRealVar)])
+    elif isinstance(obj,Model):
+        _update(h,[obj.__class__.__name__,obj.x,obj.y,obj.z,obj.kwargs])
+    elif isinstance(obj,dict):
+        _update(h,sorted(obj.items()))
+    elif isinstance(obj,(list,tuple)):
+        h.update(obj.__class__.__name__)
+        for o in obj:
+            _update(h,o)
+    else:
+        h.update(repr(obj))
@@ -0,0 +1,183 @@
+import time
+import logging
+
+import ROOT
+
+def _iterate(argset):
+    it = argset.createIterator()
+    arg = it.Next()
+    while arg:
+        yield arg
+        arg = it.Next()
+
+def binData(data,observables,binWidth):
+    '''
+    Return a RooDataHist of data in observables with bins of binWidth,
+    None if that would not have fewer bins than data has entries.
+    The binnings of the observables are left untouched.
+    '''
+    observables = [obs for obs in _iterate(observables) if obs.InheritsFrom('RooRealVar')]
+    nbins = [max(1,int(round((obs.getMax()-obs.getMin())/binWidth))) for obs in observables]
+    if reduce(lambda a,b: a*b, nbins, 1)>=data.numEntries(): return None
+    binnings = [ROOT.RooUniformBinning(obs.getMin(),obs.getMax(),n) for obs, n in zip(observables,nbins)]
+    oldBinnings = [obs.getBinning().clone() for obs in observables]
+    for obs, binning in zip(observables,binnings):
+        obs.setBinning(binning)
+    name = '{}_binned'.format(data.GetName())
+    try:
+        binned = ROOT.RooDataHist(name,name,ROOT.RooArgSet(*observables),data)
+    finally:
+        for obs, binning in zip(observables,oldBinnings):
+            obs.setBinning(binning)
+            ROOT.SetOwnership(binning,True)
+    return binned
+
+# the fitTo options that are not options of the likelihood (createNLL)
+_FITARGS = ['Save','Strategy','PrintLevel','Minimizer','Hesse','Minos','SumW2Error','Timer','Warnings','Optimize','Verbose','InitialHesse','PrintEvalErrors']
+
+def _cmdList(args):
+    # a RooLinkedList since fitTo and createNLL take at most 8 RooCmdArgs
+    cmdList = ROOT.RooLinkedList()
+    for arg in args:
+        cmdList.Add(arg)
+    return cmdList
+
+class FitConfig(object):
+    '''
+    FitConfig
+
+    The settings of the likelihood fits, shared by Model and HaaLimits.
+    fitTo adds them to the fit options, times the fit and logs it.
+
+    numCPU            : processes evaluating the likelihood (RooFit NumCPU), 1 for none
+    numCPUStrategy    : how the events are split between them (0 bulk, 1 interleave, 2 by component, 3 hybrid)
+    batchMode         : vectorized likelihood evaluation, if this ROOT version supports it
+    offset            : offset the likelihood (always done for the binned fits)
+    strategy          : Minuit strategy
+    tolerance         : Minuit tolerance (RooMinimizer setEps), None for the fitTo default
+    binnedThreshold   : fit datasets with more entries than this to a RooDataHist instead, 0 to always fit unbinned
+    binnedWidth       : bin width of the binned fits, 10 MeV for the mass observables
+    validateBinned    : also do the unbinned fit and log the differences of the fitted parameters
+    '''
+
+    def __init__(self,**kwargs):
+        self.numCPU = 1
+        self.numCPUStrategy = 0
+        self.batchMode = False
+        self.offset = False
+        self.strategy = 1
+        self.tolerance = None
+        self.binnedThreshold = 0
+        self.binnedWidth = 0.01
+        self.validateBinned = False
+        self.update(**kwargs)
+
+    def update(self,**kwargs):
+        '''Change settings, the objects sharing this configuration see the change'''
+        for key, value in kwargs.iteritems():
+            if not hasattr(self,key): raise AttributeError('Unknown fit setting {}'.format(key))
+            setattr(self,key,value)
+
+    def key(self):
+        '''The settings that change the fit result, for the fit cache key'''
+        return (self.batchMode,self.offset,self.strategy,self.tolerance,self.binnedThreshold,self.binnedWidth)
+
+    def args(self,binned=False):
+        '''The RooCmdArgs for these settings'''
+        args = [ROOT.RooFit.Strategy(self.strategy)]
+        if self.numCPU>1: args += [ROOT.RooFit.NumCPU(self.numCPU,self.numCPUStrategy)]
+        if self.offset or binned: args += [ROOT.RooFit.Offset(True)]
+        if self.batchMode:
+            if hasattr(ROOT.RooFit,'EvalBackend'):
+                args += [ROOT.RooFit.EvalBackend('cpu')]
+            elif hasattr(ROOT.RooFit,'BatchMode'):
+                args += [ROOT.RooFit.BatchMode(True)]
+            else:
+                logging.warning('BatchMode is not supported in ROOT {}, ignored'.format(ROOT.gROOT.GetVersion()))
+        return args
+
+    def _fitTo(self,model,data,args,binned=False):
+        cmdArgs = list(args)+self.args(binned)
+        start = time.time()
+        if self.tolerance is None:
+            fr = model.fitTo(data,_cmdList(cmdArgs))
+        else:
+            fr = self._minimize(model,data,cmdArgs)
+        logging.info('Fit of {} to {} ({} entries{}) took {:.2f} s'.format(
+            model.GetName(),data.GetName(),data.numEntries(),', binned' if binned else '',time.time()-start))
+        return fr
+
+    def _minimize(self,model,data,cmdArgs):
+        '''
+        The fit of fitTo, done with createNLL and a RooMinimizer, since fitTo always
+        resets the Minuit tolerance (setEps) and ignores the default one.
+        Handles the fit options Strategy, PrintLevel, Minimizer, Hesse, Minos and
+        SumW2Error, the others are passed to createNLL.
+        '''
+        fitArgs = dict([(arg.GetName(),arg) for arg in cmdArgs if arg.GetName() in _FITARGS])
+        nllArgs = [arg for arg in cmdArgs if arg.GetName() not in _FITARGS]
+        nll = model.createNLL(data,_cmdList(nllArgs))
+        ROOT.SetOwnership(nll,True)
+        minimizer = ROOT.RooMinimizer(nll)
+        minimizer.setEps(self.tolerance)
+        minimizer.setStrategy(fitArgs['Strategy'].getInt(0) if 'Strategy' in fitArgs else self.strategy)
+        minimizer.setPrintLevel(fitArgs['PrintLevel'].getInt(0) if 'PrintLevel' in fitArgs else 1)
+        if 'Minimizer' in fitArgs:
+            minimizerType = fitArgs['Minimizer'].getString(0)
+            algorithm = fitArgs['Minimizer'].getString(1) or 'migrad'
+        else:
+            minimizerType = ROOT.Math.MinimizerOptions.DefaultMinimizerType()
+            algorithm = ROOT.Math.MinimizerOptions.DefaultMinimizerAlgo()
+        minimizer.minimize(minimizerType,algorithm)
+        if 'Hesse' not in fitArgs or fitArgs['Hesse'].getInt(0):
+            minimizer.hesse()
+        if 'Minos' in fitArgs and fitArgs['Minos'].getInt(0):
+            minimizer.minos()
+        if 'SumW2Error' in fitArgs and fitArgs['SumW2Error'].getInt(0) and data.isWeighted():
+            # correct the covariance as fitTo does, V C^-1 V with C from the squared weights
+            fr = minimizer.save()
+            nll2 = model.createNLL(data,_cmdList(nllArgs))
+            ROOT.SetOwnership(nll2,True)
+            if hasattr(nll2,'applyWeightSquared'):
+                nll2.applyWeightSquared(True)
+                minimizer2 = ROOT.RooMinimizer(nll2)
+                minimizer2.setPrintLevel(-1)
+                minimizer2.hesse()
+                matC = ROOT.TMatrixDSym(minimizer2.save().covarianceMatrix())
+                matC.Invert()
+                matC.Similarity(fr.covarianceMatrix())
+                minimizer.applyCovarianceMatrix(matC)
+            else:
+                logging.warning('SumW2Error is not supported with a tolerance in ROOT {}, the errors are not corrected'.format(ROOT.gROOT.GetVersion()))
+        return minimizer.save()
+
+    def fitTo(self,model,data,*args):
+        '''
+        model.fitTo(data,*args) with these settings.
+        A RooDataSet with more than binnedThreshold entries is binned first (see binData),
+        with validateBinned the unbinned fit is done as well and the differences of the
+        parameters are logged.
+        '''
+        if not self.binnedThreshold or data.InheritsFrom('RooDataHist') or data.numEntries()<=self.binnedThreshold:
+            return self._fitTo(model,data,args)
+        binned = binData(data,model.getObservables(data),self.binnedWidth)
+        if binned is None:
+            return self._fitTo(model,data,args)
+        params = model.getParameters(data)
+        ROOT.SetOwnership(params,True)
+        start = params.snapshot()
+        ROOT.SetOwnership(start,True)
+        fr = self._fitTo(model,binned,args,binned=True)
+        if self.validateBinned:
+            binnedValues = params.snapshot()
+            ROOT.SetOwnership(binnedValues,True)
+            params.assignValueOnly(start)
+            self._fitTo(model,data,args)
+            for param in _iterate(params):
+                if param.isConstant() or not param.InheritsFrom('RooRealVar'): continue
+                binnedValue = binnedValues.find(param.GetName()).getVal()
+                err = param.getError()
+                logging.info('Binned fit of {}: {} = {:.6g} binned, {:.6g} +/- {:.3g} unbinned ({:+.3f} sigma)'.format(
+                    model.GetName(),param.GetName(),binnedValue,param.getVal(),err,(binnedValue-param.getVal())/err if err else 0.))
+            params.assignValueOnly(binnedValues)
+        return fr
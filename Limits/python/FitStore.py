@@ -0,0 +1,97 @@
+import os
+import json
+import logging
+import sqlite3
+
+from CombineLimits.Limits.utilities import python_mkdir
+
+class FitStore(object):
+    '''
+    FitStore
+
+    An indexed store of fit results, one sqlite file per tag.
+    A document (for example "central/PP" or "background_control") is a
+    nested dict of results. It is flattened to one row per leaf, keyed on
+    the path to that leaf (for example ["vals", 125, "7", "mean_h125_a7_PP"]),
+    so a single entry can be read without deserializing the rest.
+    Documents are replaced in a single transaction, so concurrent fit
+    workers can write to the same store.
+    '''
+
+    def __init__(self,path,timeout=600):
+        self.path = path
+        self.timeout = timeout
+
+    def _connect(self):
+        # a new connection per call, a connection can not be shared across a fork
+        if os.path.dirname(self.path): python_mkdir(os.path.dirname(self.path))
+        conn = sqlite3.connect(self.path,timeout=self.timeout)
+        conn.execute('CREATE TABLE IF NOT EXISTS fits (document TEXT, key TEXT, value TEXT, PRIMARY KEY (document, key))')
+        return conn
+
+    def put(self,document,results):
+        '''Replace a document with the (nested dict) results.'''
+        rows = [(document,json.dumps(path),json.dumps(value)) for path, value in _flatten(results)]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM fits WHERE document=?',(document,))
+                conn.executemany('INSERT INTO fits VALUES (?,?,?)',rows)
+        finally:
+            conn.close()
+
+    def get(self,document,*path):
+        '''
+        Return the results stored under path in a document.
+        For example get('central/PP','vals',125,'7') only reads the fit of one mass point.
+        Raises KeyError if there is nothing stored there.
+        '''
+        conn = self._connect()
+        try:
+            if path:
+                prefix = json.dumps(list(path))[:-1]
+                rows = conn.execute(
+                    'SELECT key, value FROM fits WHERE document=? AND (key=? OR substr(key,1,?)=?)',
+                    (document,prefix+']',len(prefix)+2,prefix+', '),
+                ).fetchall()
+            else:
+                rows = conn.execute('SELECT key, value FROM fits WHERE document=?',(document,)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            raise KeyError('{} not found in {}'.format('/'.join([document]+[str(p) for p in path]),self.path))
+        results = {}
+        for key, value in rows:
+            key = json.loads(key)[len(path):]
+            value = json.loads(value)
+            if not key: return value
+            d = results
+            for k in key[:-1]:
+                d = d.setdefault(k,{})
+            d[key[-1]] = value
+        return results
+
+    def documents(self):
+        '''Return the names of all stored documents.'''
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute('SELECT DISTINCT document FROM fits ORDER BY document')]
+        finally:
+            conn.close()
+
+    def export(self,directory):
+        '''Write every document to directory/document.json for humans.'''
+        for document in self.documents():
+            name = os.path.join(directory,'{}.json'.format(document))
+            python_mkdir(os.path.dirname(name))
+            with open(name,'w') as f:
+                f.write(json.dumps(self.get(document), indent=4, sort_keys=True))
+            logging.debug('Exported {}'.format(name))
+
+def _flatten(results,path=()):
+    if isinstance(results,dict) and results:
+        for key, value in results.iteritems():
+            for leaf in _flatten(value,path+(key,)):
+                yield leaf
+    else:
+        yield list(path), results
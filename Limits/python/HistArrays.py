@@ -0,0 +1,110 @@
+'''
+NumPy views of ROOT histograms.
+
+contents and sumw2 return arrays sharing the memory of a TH1/TH2
+(including the under/overflow bins, indexed [x] for a TH1 and [y][x]
+for a TH2, as the global bin number), so the operations below work on
+whole histograms at once and write back a new histogram in one copy.
+'''
+import numpy as np
+
+import ROOT
+
+_arrayTypes = [
+    ('TArrayD', np.float64),
+    ('TArrayF', np.float32),
+    ('TArrayI', np.int32),
+    ('TArrayS', np.int16),
+    ('TArrayC', np.int8),
+]
+
+def _view(buf,n,dtype):
+    '''Wrap a C array of n entries as a NumPy array without copying.'''
+    if hasattr(buf,'reshape'):
+        buf.reshape((n,))
+    else:
+        buf.SetSize(n)
+    return np.frombuffer(buf,dtype=dtype,count=n)
+
+def _shape(hist):
+    if hist.GetDimension()==1: return (hist.GetNbinsX()+2,)
+    if hist.GetDimension()==2: return (hist.GetNbinsY()+2,hist.GetNbinsX()+2)
+    raise ValueError('Only 1D and 2D histograms are supported, {} is {}D'.format(hist.GetName(),hist.GetDimension()))
+
+def contents(hist):
+    '''Bin contents of hist as a view, changing it changes hist.'''
+    for cls, dtype in _arrayTypes:
+        if hist.InheritsFrom(cls):
+            return _view(hist.GetArray(),hist.GetNcells(),dtype).reshape(_shape(hist))
+    raise TypeError('Unsupported histogram type {}'.format(hist.ClassName()))
+
+def sumw2(hist):
+    '''
+    Sum of squared weights of hist.
+    A view if hist has Sumw2, otherwise a copy of abs(contents) as ROOT uses for the errors.
+    '''
+    if hist.GetSumw2N():
+        return _view(hist.GetSumw2().GetArray(),hist.GetNcells(),np.float64).reshape(_shape(hist))
+    return np.abs(contents(hist)).astype(np.float64)
+
+def edges(axis):
+    '''Bin edges of an axis.'''
+    return np.array([axis.GetBinLowEdge(b) for b in range(1,axis.GetNbins()+2)])
+
+def fromArrays(name,title,values,errors2,xEdges,yEdges=None,cls=ROOT.TH1F):
+    '''Build a histogram of class cls from contents and sumw2 arrays shaped as returned by contents.'''
+    if yEdges is None:
+        hist = cls(name,title,len(xEdges)-1,np.asarray(xEdges,dtype=np.float64))
+    else:
+        hist = cls(name,title,len(xEdges)-1,np.asarray(xEdges,dtype=np.float64),len(yEdges)-1,np.asarray(yEdges,dtype=np.float64))
+    hist.Sumw2()
+    contents(hist)[...] = values
+    sumw2(hist)[...] = errors2
+    hist.ResetStats()
+    return hist
+
+def unwrap(hist,name=None):
+    '''
+    Convert a 2D histogram to 1D, x is the inner index.
+    The under/overflow bins are dropped.
+    '''
+    nbins = hist.GetNbinsX()*hist.GetNbinsY()
+    values = np.zeros(nbins+2)
+    errors2 = np.zeros(nbins+2)
+    values[1:-1] = contents(hist)[1:-1,1:-1].ravel()
+    errors2[1:-1] = sumw2(hist)[1:-1,1:-1].ravel()
+    return fromArrays(name or hist.GetName(),hist.GetTitle(),values,errors2,np.arange(nbins+1))
+
+def maskRange(hist,xMin,xMax,name=None):
+    '''Copy of a 1D histogram with the bins not overlapping [xMin,xMax] (and the under/overflow) set to 0.'''
+    xEdges = edges(hist.GetXaxis())
+    keep = np.zeros(len(xEdges)+1,dtype=bool)
+    keep[1:-1] = (xEdges[1:]>xMin) & (xEdges[:-1]<xMax)
+    values = np.where(keep,contents(hist),0)
+    errors2 = np.where(keep,sumw2(hist),0)
+    return fromArrays(name or hist.GetName(),hist.GetTitle(),values,errors2,xEdges)
+
+def rebin(hist,ngroup,name=None):
+    '''Merge groups of ngroup bins of a 1D histogram, the remaining bins go to the overflow (as TH1::Rebin).'''
+    xEdges = edges(hist.GetXaxis())
+    nbins = (len(xEdges)-1)//ngroup
+    newEdges = xEdges[:nbins*ngroup+1:ngroup]
+    def merge(a):
+        result = np.zeros(nbins+2)
+        result[0] = a[0]
+        result[1:-1] = a[1:nbins*ngroup+1].reshape(nbins,ngroup).sum(axis=1)
+        result[-1] = a[nbins*ngroup+1:].sum()
+        return result
+    return fromArrays(name or hist.GetName(),hist.GetTitle(),merge(contents(hist)),merge(sumw2(hist)),newEdges)
+
+def integralAndError(hist,binxlow=1,binxhigh=-1,binylow=1,binyhigh=-1):
+    '''Sum of the contents and its error over an inclusive range of bins (of a TH1 or TH2).'''
+    if binxhigh<0: binxhigh = hist.GetNbinsX()
+    values = contents(hist)
+    errors2 = sumw2(hist)
+    if hist.GetDimension()==1:
+        sel = slice(binxlow,binxhigh+1)
+    else:
+        if binyhigh<0: binyhigh = hist.GetNbinsY()
+        sel = (slice(binylow,binyhigh+1),slice(binxlow,binxhigh+1))
+    return float(values[sel].sum(dtype=np.float64)), float(errors2[sel].sum())**0.5
@@ -0,0 +1,188 @@
+import os
+import re
+import logging
+import functools
+
+import numpy as np
+
+import ROOT
+
+from CombineLimits.Limits.utilities import python_mkdir, runTasks
+from CombineLimits.Limits.HistArrays import _view
+
+# quantileExpected of the rows of a limit tree, in the order used by LimitPlotter (-1 is the observed limit)
+QUANTILES = [0.025, 0.16, 0.5, 0.84, 0.975, -1.]
+QUANTILENAMES = ['exp0.025', 'exp0.16', 'exp0.5', 'exp0.84', 'exp0.975', 'obs']
+
+# higgsCombineHToAAH{h}A{a}[_{mode}].{method}.mH{h}[.{seed}].root, as written by runCombine and prepareGridSubmission
+FILEPATTERN = r'higgsCombine.*HToAAH(?P<h>\d+)A(?P<a>\d+(?:[.p]\d+)?)(?:_(?P<mode>[^.]+))?\.(?P<method>\w+)\.mH.*\.root$'
+
+STATUSES = ['ok', 'incomplete', 'bad']
+
+def readLimits(path):
+    '''
+    The six limits of a combine output in the order of QUANTILES (nan if missing),
+    None if the file or its limit tree cannot be read.
+    The rows are matched to the quantiles by quantileExpected, not by their order.
+    '''
+    tfile = ROOT.TFile.Open(path)
+    if not tfile or tfile.IsZombie():
+        logging.warning('Failed to open {}'.format(path))
+        return None
+    tree = tfile.Get('limit')
+    if not tree:
+        logging.warning('No limit tree in {}'.format(path))
+        tfile.Close()
+        return None
+    limits = [float('nan')]*len(QUANTILES)
+    # read both columns at once rather than looping over the entries
+    tree.SetEstimate(tree.GetEntries()+1)
+    n = tree.Draw('quantileExpected:limit','','goff')
+    if n>0:
+        quantiles = np.array(_view(tree.GetV1(),n,np.float64))
+        values = np.array(_view(tree.GetV2(),n,np.float64))
+        for i, q in enumerate(QUANTILES):
+            found = np.nonzero(np.abs(quantiles-q)<1e-3)[0]
+            if len(found): limits[i] = values[found[-1]]
+    tfile.Close()
+    return limits
+
+def readLimitFile(path,pattern=FILEPATTERN,mode=''):
+    '''
+    Read the limits of one combine output.
+    Returns a dict with the mode, h, a, method, the six limits (nan if missing), the
+    status and the file mtime and size, None if the file name does not match pattern.
+    '''
+    match = re.search(pattern,os.path.basename(path))
+    if not match: return None
+    groups = match.groupdict()
+    stat = os.stat(path)
+    row = {
+        'path'  : path,
+        'mode'  : groups.get('mode') or mode,
+        'h'     : float(groups['h']) if groups.get('h') else 0.,
+        'a'     : float(groups['a'].replace('p','.')),
+        'method': groups.get('method') or '',
+        'mtime' : stat.st_mtime,
+        'size'  : stat.st_size,
+        'limits': [float('nan')]*len(QUANTILES),
+        'status': 'bad',
+    }
+    limits = readLimits(path)
+    if limits is None: return row
+    row['limits'] = limits
+    row['status'] = 'ok' if all([np.isfinite(l) for l in row['limits']]) else 'incomplete'
+    return row
+
+class LimitTable(object):
+    '''
+    LimitTable
+
+    The limits of many combine outputs in one table, one row per file,
+    keyed by (mode, h, a). The table is written to directory as
+    limits.npz (columns as arrays, for loading) and limits.csv (for
+    reading). update only opens the files that are new or changed
+    since the last update (by mtime and size) and drops the rows of
+    files that are gone, so it can be rerun as jobs finish.
+    '''
+
+    COLUMNS = ['path', 'mode', 'method', 'status', 'h', 'a', 'mtime', 'size']
+
+    def __init__(self,directory):
+        self.directory = directory
+        self.rows = {}
+        self.load()
+
+    def _npz(self):
+        return os.path.join(self.directory,'limits.npz')
+
+    def _csv(self):
+        return os.path.join(self.directory,'limits.csv')
+
+    def load(self):
+        '''Read the stored table, if there is one.'''
+        self.rows = {}
+        if not os.path.exists(self._npz()): return
+        arrays = np.load(self._npz())
+        limits = arrays['limits']
+        for i in range(len(arrays['path'])):
+            row = dict([(col,arrays[col][i].item()) for col in self.COLUMNS])
+            row['limits'] = list(limits[i])
+            self.rows[row['path']] = row
+
+    def save(self):
+        '''Write limits.npz and limits.csv.'''
+        python_mkdir(self.directory)
+        rows = [self.rows[path] for path in sorted(self.rows)]
+        arrays = dict([(col,np.array([row[col] for row in rows])) for col in self.COLUMNS])
+        arrays['limits'] = np.array([row['limits'] for row in rows],dtype=np.float64).reshape((len(rows),len(QUANTILES)))
+        # write to a temporary file and rename so that a reader never sees a partial table
+        tmp = '{}.{}.tmp.npz'.format(self._npz(),os.getpid())
+        np.savez(tmp,**arrays)
+        os.rename(tmp,self._npz())
+        tmp = '{}.{}.tmp'.format(self._csv(),os.getpid())
+        with open(tmp,'w') as f:
+            f.write(','.join(['mode','h','a','method']+QUANTILENAMES+['status','path'])+'\n')
+            for row in sorted(rows,key=lambda row: (row['mode'],row['h'],row['a'])):
+                f.write(','.join([row['mode'],'{:g}'.format(row['h']),'{:g}'.format(row['a']),row['method']]
+                    +['{:.6g}'.format(l) for l in row['limits']]+[row['status'],row['path']])+'\n')
+        os.rename(tmp,self._csv())
+
+    def update(self,directories,pattern=FILEPATTERN,mode='',nworkers=1):
+        '''
+        Add the combine outputs in directories (searched recursively) matching pattern.
+        mode is used for the files whose name has none.
+        Returns the number of files read.
+        '''
+        paths = []
+        for directory in directories:
+            for root, dirs, files in os.walk(directory):
+                paths += [os.path.join(root,f) for f in files if re.search(pattern,f)]
+        paths = set(paths)
+
+        for path in [path for path in self.rows if path not in paths]:
+            logging.info('Removing {}, the file is gone'.format(path))
+            del self.rows[path]
+
+        todo = []
+        for path in sorted(paths):
+            row = self.rows.get(path)
+            if row:
+                stat = os.stat(path)
+                if row['mtime']==stat.st_mtime and row['size']==stat.st_size: continue
+            todo += [path]
+        logging.info('Reading {} of {} files'.format(len(todo),len(paths)))
+
+        results = runTasks([functools.partial(readLimitFile,path,pattern,mode) for path in todo],nworkers)
+        for row in results:
+            if row is None: continue
+            if row['status']!='ok': logging.warning('{} file {}'.format(row['status'].capitalize(),row['path']))
+            self.rows[row['path']] = row
+        return len(todo)
+
+    def bad(self):
+        '''The files that could not be read or do not have all the quantiles.'''
+        return sorted([path for path, row in self.rows.iteritems() if row['status']!='ok'])
+
+    def points(self,mode=None,h=None):
+        '''
+        The complete points, {(mode, h, a): limits}.
+        If several files have the same point the newest one is used.
+        '''
+        points = {}
+        newest = {}
+        for row in self.rows.itervalues():
+            if row['status']!='ok': continue
+            if mode is not None and row['mode']!=mode: continue
+            if h is not None and row['h']!=h: continue
+            key = (row['mode'],row['h'],row['a'])
+            if key in newest and newest[key]>=row['mtime']: continue
+            newest[key] = row['mtime']
+            points[key] = row['limits']
+        return points
+
+    def quartiles(self,mode,h):
+        '''The sorted a masses and {a: limits} of (mode, h), as LimitPlotter.plotLimit takes them.'''
+        points = self.points(mode,h)
+        quartiles = dict([(a,limits) for (m, hm, a), limits in points.iteritems()])
+        return sorted(quartiles), quartiles
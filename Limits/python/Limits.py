@@ -5,7 +5,9 @@ import numbers
 
 import ROOT
 
-from CombineLimits.Limits.Models import Model, ModelSpline
+from CombineLimits.Limits.Models import Model, ModelSpline, ImportBatch
+import CombineLimits.Limits.Models as Models
+import CombineLimits.Limits.HistArrays as HistArrays
 from utilities import *
 
 class Limits(object):
@@ -26,6 +28,7 @@ class Limits(object):
         self.models = {}      # models to add
         self.expected = {}    # expected yield, one per process/era/analysis/chanel combination
         self.systematics = {} # systematic uncertainties
+        self.systematicIndex = {} # systematic values by full name and (bin,process)
         self.param_systematics = {}
         self.rates = []
         #self.rates = {}
@@ -37,27 +40,23 @@ class Limits(object):
         return ROOT.RooWorkspace(name)
 
     def wsimport(self, *args) :
-        # getattr since import is special in python
-        # NB RooWorkspace clones object
-        if len(args) < 2 :
-            # Useless RooCmdArg: https://sft.its.cern.ch/jira/browse/ROOT-6785
-            args += (ROOT.RooCmdArg(),)
-        return getattr(self.workspace, 'import')(*args)
+        return Models.wsimport(self.workspace, *args)
+
+    def importBatch(self,stage=''):
+        '''
+        Defer the spline and parameter imports of the models until the end
+        of a with block, and count the imports under the name stage.
+        See Models.ImportBatch.
+        '''
+        return ImportBatch(stage)
+
+    def logImportStats(self):
+        '''Log the number of workspace imports and cloned nodes per stage.'''
+        Models.logImportStats()
 
     def __unwrap(self,hist):
         '''Convert 2D histogram to 1D'''
-        nbins = hist.GetNbinsX()*hist.GetNbinsY()
-        result = ROOT.TH1F(hist.GetName(),hist.GetTitle(),nbins,0,nbins)
-        result.SetBinContent(0,hist.GetBinContent(0))
-        result.SetBinError(0,hist.GetBinError(0))
-        result.SetBinContent(nbins+1,hist.GetBinContent(nbins+1))
-        result.SetBinError(nbins+1,hist.GetBinError(nbins+1))
-        for nx in range(hist.GetNbinsX()):
-            for ny in range(hist.GetNbinsY()):
-                b = hist.GetBin(nx+1,ny+1)
-                result.SetBinContent(b,hist.GetBinContent(b))
-                result.SetBinError(b,hist.GetBinError(b))
-        return result
+        return HistArrays.unwrap(hist)
 
     def addVar(self, var, varMin, varMax, unit='', label='', **kwargs):
         workspace = kwargs.pop('workspace',self.workspace)
@@ -100,6 +99,7 @@ class Limits(object):
         else:
             logging.debug('Adding bin {}'.format(b))
             self.bins += [b]
+            if self.systematics: self.__indexSystematics()
 
     def addProcess(self,proc,signal=False):
         '''
@@ -118,6 +118,7 @@ class Limits(object):
                 self.signals += [proc]
             else:
                 self.backgrounds += [proc]
+            if self.systematics: self.__indexSystematics()
 
     def addSystematic(self,systname,mode,systematics={}):
         '''
@@ -163,6 +164,33 @@ class Limits(object):
                         'mode'  : mode,
                         'values': systematics,
                     }
+                    self.__indexSystematic(systname)
+
+    def __indexSystematic(self,systname):
+        '''
+        Expand a systematic into systematicIndex, of the form:
+            systematicIndex = {
+                fullSystName : {
+                    (bin,process) : value,
+                },
+            }
+        where fullSystName has the {process} and {bin} replacements done
+        and 'all' is expanded to the current bins and processes.
+        '''
+        for syst_vals, value in self.systematics[systname]['values'].iteritems():
+            s_processes, s_bins = syst_vals
+            if 'all' in s_processes: s_processes = self.processes.keys()
+            if 'all' in s_bins: s_bins = self.bins
+            for process in s_processes:
+                for bin in s_bins:
+                    fullSystName = systname.format(process=process,bin=bin)
+                    self.systematicIndex.setdefault(fullSystName,{})[(bin,process)] = value
+
+    def __indexSystematics(self):
+        '''Rebuild systematicIndex, needed when bins or processes are added after a systematic covering 'all'.'''
+        self.systematicIndex = {}
+        for systname in self.systematics:
+            self.__indexSystematic(systname)
 
     def addGroup(self,groupname,*systnames):
         '''Add a group name for a list of systematics'''
@@ -200,18 +228,7 @@ class Limits(object):
 
     def getSystematic(self,systname,process,bin):
         '''Return the systematic value for a given systematic/process/bin combination.'''
-        # make sure it exists:
-        result = 1.
-        for syst in self.systematics:
-            fullSystName = syst.format(process=process,bin=bin)
-            if fullSystName != systname: continue
-            # check if there is a systematic value for this combination
-            for syst_vals in self.systematics[syst]['values']:
-                s_processes, s_bins = syst_vals
-                if process not in s_processes and 'all' not in s_processes: continue
-                if bin not in s_bins and 'all' not in s_bins: continue
-                # return the value
-                result = self.systematics[syst]['values'][syst_vals]
+        result = self.systematicIndex.get(systname,{}).get((bin,process),1.)
         if isinstance(result,ROOT.TH2):
             result = self.__unwrap(result)
         if isinstance(result,tuple) or isinstance(result,list):
@@ -399,23 +416,24 @@ class Limits(object):
 
         totalColumns = len(bins)*len(processes)
         processesOrdered = signals + backgrounds
+        processIndex = dict([(process,i-len(signals)+1) for i,process in enumerate(processesOrdered)])
         binsForRates = ['bin','']+['']*totalColumns
         processNames = ['process','']+['']*totalColumns
         processNumbers = ['process','']+['']*totalColumns
         rates = ['rate','']+['']*totalColumns
         norms = []
         colpos = 2
-        toSkip = []
+        columns = [] # (bin,process) of every column that is not skipped
         for bin in bins:
             for process in processesOrdered:
                 exp = self.getExpected(process,bin)
                 if not exp: 
-                    toSkip += [(bin,process)]
                     logging.warning('Skipping {} {}'.format(process,bin))
                     continue
+                columns += [(bin,process)]
                 binsForRates[colpos] = binName.format(bin=bin)
                 processNames[colpos] = process
-                processNumbers[colpos] = '{0:<10}'.format(processesOrdered.index(process)-len(signals)+1)
+                processNumbers[colpos] = '{0:<10}'.format(processIndex[process])
                 label = '{0}_{1}'.format(processNames[colpos],binsForRates[colpos])
                 if isinstance(exp,ROOT.TH1): # it is a histogram (for shape analysis)
                     logging.debug('{0}: {1}'.format(label,exp.Integral()))
@@ -471,68 +489,40 @@ class Limits(object):
 
         combinedSysts = self.__combineSystematics(*[systs[key] for key in systs])
         logging.debug('Systs to add: {0}'.format([str(x) for x in sorted(combinedSysts.keys())]))
+
+        # the rows are aligned, so the column widths are found before anything is written
+        headerRows = [binRows,observations,binsForRates,processNames,processNumbers,rates]
+        firstWidth = max([len(x[0]) for x in headerRows])
+        restWidth = max([max([len(y) for y in x[1:]]) for x in headerRows])
+
+        # first pass over the systematics: collect the shapes and widths,
+        # the rows themselves are only built when they are written
         systRows = []
         for syst in sorted(combinedSysts.keys()):
-            thisRow = [syst,combinedSysts[syst]['mode']]
+            mode = combinedSysts[syst]['mode']
+            values = combinedSysts[syst]['systs']
             keep = False
-            for bin in bins:
-                for process in processesOrdered:
-                    key = (bin,process)
-                    if key in toSkip: continue
-                    s = '-'
-                    if key in combinedSysts[syst]['systs']:
-                        s = combinedSysts[syst]['systs'][key]
-                        if s==1:
-                            s = '-'
-                        elif isinstance(s,ROOT.TH1):
-                            label = '{0}_{1}_{2}'.format(process,binName.format(bin=bin),syst)
-                            s.SetName(label)
-                            s.SetTitle(label)
-                            shapes += [s]
-                            if saveWorkspace:
-                                datahist = ROOT.RooDataHist(label, label, ROOT.RooArgList(self.workspace.var("x")), s)
-                                logging.debug('Importing {}'.format(label))
-                                self.wsimport(datahist)
-                            s = '1'
-                            keep = True
-                        elif isinstance(s,basestring):
-                            label = '{0}_{1}_{2}'.format(process,binName.format(bin=bin),syst)
-                            s = '1'
-                            keep = True
-                        elif (isinstance(s,tuple) or isinstance(s,list)) and len(s)==2:
-                            if isinstance(s[0],ROOT.TH1):
-                                label_up = '{0}_{1}_{2}Up'.format(process,binName.format(bin=bin),syst)
-                                label_down = '{0}_{1}_{2}Down'.format(process,binName.format(bin=bin),syst)
-                                s[0].SetName(label_up)
-                                s[0].SetTitle(label_up)
-                                s[1].SetName(label_down)
-                                s[1].SetTitle(label_down)
-                                shapes += s
-                                if saveWorkspace:
-                                    datahist_up = ROOT.RooDataHist(label_up, label_up, ROOT.RooArgList(self.workspace.var("x")), s[0])
-                                    datahist_down = ROOT.RooDataHist(label_down, label_down, ROOT.RooArgList(self.workspace.var("x")), s[1])
-                                    logging.debug('Importing {}'.format(label_up))
-                                    self.wsimport(datahist_up)
-                                    logging.debug('Importing {}'.format(label_down))
-                                    self.wsimport(datahist_down)
-                                s = '1'
-                                keep = True
-                            elif isinstance(s[0],basestring):
-                                label_up = '{0}_{1}_{2}Up'.format(process,binName.format(bin=bin),syst)
-                                label_down = '{0}_{1}_{2}Down'.format(process,binName.format(bin=bin),syst)
-                                s = '1'
-                                keep = True
-                            elif isinstance(s[0],numbers.Number):
-                                s = '{0:>4.4g}/{1:<4.4g}'.format(*s)
-                                keep = True
-                            else:
-                                logging.error('Do not know how to handle {0}'.format(s))
-                                raise
-                        elif isinstance(s,numbers.Number):
-                            s = '{0:<10.4g}'.format(s)
-                            keep = True
-                    thisRow += [s]
-            if keep: systRows += [thisRow]
+            width = len(mode)
+            for bin, process in columns:
+                key = (bin,process)
+                if key not in values:
+                    width = max(width,len('-'))
+                    continue
+                label = '{0}_{1}_{2}'.format(process,binName.format(bin=bin),syst)
+                shapes += self.__addSystematicShapes(values[key],label,saveWorkspace)
+                s, isSyst = self.__formatSystematic(values[key])
+                keep = keep or isSyst
+                width = max(width,len(s))
+            if keep:
+                systRows += [syst]
+                firstWidth = max(firstWidth,len(syst))
+                restWidth = max(restWidth,width)
+        firstWidth += 1
+        restWidth += 1
+
+        def getSystRow(syst):
+            values = combinedSysts[syst]['systs']
+            return [syst,combinedSysts[syst]['mode']]+[self.__formatSystematic(values[key])[0] if key in values else '-' for key in columns]
 
         logging.debug('Params systs to add: {0}'.format([str(x) for x in sorted(self.param_systematics.keys())]))
         paramRows = []
@@ -550,10 +540,7 @@ class Limits(object):
         logging.info('Writing {0}{1}.txt'.format(filename,suffix))
         python_mkdir(os.path.dirname(filename))
         with open(filename+suffix+'.txt','w') as f:
-            allRows = [binRows,observations,binsForRates,processNames,processNumbers,rates]+systRows
             lineWidth = 80
-            firstWidth = max([len(x[0]) for x in allRows])+1
-            restWidth = max([max([len(y) for y in x[1:]]) for x in allRows])+1
             def getline(row):
                 try:
                     return '{0} {1}\n'.format(row[0][:firstWidth]+' '*max(0,firstWidth-len(row[0])), ''.join([r[:restWidth]+' '*max(0,restWidth-len(r)) for r in row[1:]]))
@@ -611,8 +598,9 @@ class Limits(object):
             f.write(getline(rates))
             f.write('-'*lineWidth+'\n')
 
-            # nuissances
-            for systRow in systRows:
+            # nuissances, second pass: one row at a time
+            for syst in systRows:
+                systRow = getSystRow(syst)
                 logging.debug('Systematic row: {0}'.format([str(x) for x in systRow]))
                 f.write(getline(systRow))
             f.write('-'*lineWidth+'\n')
@@ -632,3 +620,38 @@ class Limits(object):
                 f.write('{0} group = {1}'.format(group,' '.join(self.groups[group])))
 
         return shapes
+
+    def __formatSystematic(self,s):
+        '''Return the datacard entry for a systematic value, and whether it is an uncertainty at all.'''
+        if s==1:
+            return '-', False
+        elif isinstance(s,ROOT.TH1) or isinstance(s,basestring):
+            return '1', True
+        elif (isinstance(s,tuple) or isinstance(s,list)) and len(s)==2:
+            if isinstance(s[0],ROOT.TH1) or isinstance(s[0],basestring):
+                return '1', True
+            elif isinstance(s[0],numbers.Number):
+                return '{0:>4.4g}/{1:<4.4g}'.format(*s), True
+            else:
+                logging.error('Do not know how to handle {0}'.format(s))
+                raise
+        elif isinstance(s,numbers.Number):
+            return '{0:<10.4g}'.format(s), True
+        return s, False
+
+    def __addSystematicShapes(self,s,label,saveWorkspace):
+        '''Name the histograms of a shape systematic after label and return them.'''
+        if isinstance(s,ROOT.TH1):
+            hists = [(label,s)]
+        elif (isinstance(s,tuple) or isinstance(s,list)) and len(s)==2 and isinstance(s[0],ROOT.TH1):
+            hists = [(label+'Up',s[0]),(label+'Down',s[1])]
+        else:
+            return []
+        for l, h in hists:
+            h.SetName(l)
+            h.SetTitle(l)
+            if saveWorkspace:
+                datahist = ROOT.RooDataHist(l, l, ROOT.RooArgList(self.workspace.var("x")), h)
+                logging.debug('Importing {}'.format(l))
+                self.wsimport(datahist)
+        return [h for l, h in hists]
@@ -1,12 +1,135 @@
+import time
 import logging
 
 from array import array
 
 import ROOT
 from CombineLimits.Limits.utilities import *
+from CombineLimits.Limits.FitConfig import FitConfig
+from CombineLimits.Limits.PlotQueue import printCanvas
+
+IMPORTSTATS = {} # workspace imports per stage: requested, imported, nodes cloned, time
+_importBatches = [] # open ImportBatches, innermost last
+
+MORPHING = True # shifted parameters as one PiecewiseInterpolation node (False: a formula string per parameter)
+
+def _importStage():
+    return _importBatches[-1].stage if _importBatches else ''
+
+def _countImports(stage,**kwargs):
+    stats = IMPORTSTATS.setdefault(stage,{'requested':0,'imported':0,'cloned':0,'time':0.})
+    for key, value in kwargs.iteritems():
+        stats[key] += value
+
+def _import(ws,*args):
+    # getattr since import is special in python
+    # NB RooWorkspace clones object
+    if len(args) < 2 :
+        # Useless RooCmdArg: https://sft.its.cern.ch/jira/browse/ROOT-6785
+        args += (ROOT.RooCmdArg(),)
+    nodes = ws.components().getSize()
+    start = time.time()
+    result = getattr(ws, 'import')(*args)
+    _countImports(_importStage(),imported=1,cloned=ws.components().getSize()-nodes,time=time.time()-start)
+    return result
+
+def wsimport(ws,*args,**kwargs):
+    '''
+    Import into a workspace.
+    With defer=True and inside an ImportBatch, the import of a RooAbsArg
+    waits until the batch is closed.
+    '''
+    _countImports(_importStage(),requested=1)
+    if kwargs.get('defer',False) and _importBatches and isinstance(args[0],ROOT.RooAbsArg):
+        _importBatches[-1].add(ws,args[0])
+        return False
+    return _import(ws,*args)
+
+def logImportStats(*stages):
+    '''Log the workspace imports of the given stages (all if none are given).'''
+    for stage in stages or sorted(IMPORTSTATS):
+        stats = IMPORTSTATS.get(stage,{'requested':0,'imported':0,'cloned':0,'time':0.})
+        logging.info('Workspace imports for {}: {} requested, {} done, {} nodes cloned in {:.2f} s'.format(stage or 'unbatched',stats['requested'],stats['imported'],stats['cloned'],stats['time']))
+
+def pendingArg(ws,name):
+    '''Return an object whose import into ws is deferred by an open ImportBatch, None if there is none.'''
+    for batch in reversed(_importBatches):
+        arg = batch.get(ws,name)
+        if arg: return arg
+    return None
+
+class ImportBatch(object):
+    '''
+    ImportBatch
+
+    Every RooWorkspace import clones and walks the full server graph of
+    the object, so importing splines that share servers (central splines,
+    shift variables, MH, MA) one at a time walks the same nodes over and over.
+    Inside a batch the deferred imports (wsimport with defer=True) are
+    collected, and when the batch closes only those that are not servers
+    of another collected object are imported, with RecycleConflictNodes.
+    The rest come in with them.
+
+    Deferred objects are not in the workspace until the batch closes
+    (pendingArg finds them), so nothing inside the batch should look
+    them up by name, e.g. through ws.factory.
+
+        with ImportBatch('signal splines'):
+            spline.build(ws,name)
+    '''
+
+    def __init__(self,stage=''):
+        self.stage = stage
+        self.pending = [] # (workspace, object)
+        self.names = {}
+
+    def __enter__(self):
+        _importBatches.append(self)
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        try:
+            if excType is None: self.flush()
+        finally:
+            _importBatches.remove(self)
+        logImportStats(self.stage)
+        return False
+
+    def add(self,ws,arg):
+        self.pending += [(ws,arg)]
+        self.names.setdefault(arg.GetName(),[]).append((ws,arg))
+
+    def get(self,ws,name):
+        for w, arg in self.names.get(name,[]):
+            if w==ws: return arg
+        return None
+
+    def flush(self):
+        '''Import the pending objects that no other pending object depends on.'''
+        while self.pending:
+            ws = self.pending[0][0]
+            args = [arg for w, arg in self.pending if w==ws]
+            self.pending = [(w,arg) for w, arg in self.pending if not w==ws]
+            servers = set()
+            for arg in args:
+                components = arg.getComponents()
+                ROOT.SetOwnership(components,True)
+                it = components.createIterator()
+                component = it.Next()
+                while component:
+                    if component.GetName()!=arg.GetName(): servers.add(component.GetName())
+                    component = it.Next()
+            imported = set()
+            for arg in args:
+                if arg.GetName() in servers or arg.GetName() in imported: continue
+                imported.add(arg.GetName())
+                _import(ws, arg, ROOT.RooFit.RecycleConflictNodes())
+        self.names = {}
 
 class Model(object):
 
+    FITCONFIG = FitConfig() # fit settings shared by all models (and HaaLimits)
+
     def __init__(self,name,**kwargs):
         self.name = name
         self.x = kwargs.pop('x','x')
@@ -15,12 +138,7 @@ class Model(object):
         self.kwargs = kwargs
 
     def wsimport(self, ws, *args) :
-        # getattr since import is special in python
-        # NB RooWorkspace clones object
-        if len(args) < 2 :
-            # Useless RooCmdArg: https://sft.its.cern.ch/jira/browse/ROOT-6785
-            args += (ROOT.RooCmdArg(),)
-        return getattr(ws, 'import')(*args)
+        return wsimport(ws, *args)
 
     def update(self,**kwargs):
         '''Update the floating parameters'''
@@ -40,7 +158,7 @@ class Model(object):
         model = ws.pdf(name)
        
         #ws.var('x').setRange('xRange', xFitRange[0], xFitRange[1])
-        fr = model.fitTo(hist,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True),ROOT.RooFit.PrintLevel(-1))
+        fr = self.FITCONFIG.fitTo(model,hist,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True),ROOT.RooFit.PrintLevel(-1))
         #fr = model.fitTo(hist,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True),ROOT.RooFit.Minos(True))
         pars = fr.floatParsFinal()
         vals = {}
@@ -124,7 +242,7 @@ class Model(object):
                     continue
             canvas.cd()
 
-            canvas.Print('{0}.png'.format(savename))
+            printCanvas(canvas,'{0}.png'.format(savename))
 
         if doErrors:
             return vals, errs
@@ -141,7 +259,7 @@ class Model(object):
         #ws.var('x').setRange('xRange', xFitRange[0], xFitRange[1])
         #ws.var('y').setRange('yRange', yFitRange[0], yFitRange[1])
         #print ("X_FIT_RANGE=", xFitRange, "\tY_FIT_RANGE=", yFitRange)
-        fr = model.fitTo(hist,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True),ROOT.RooFit.PrintLevel(-1))
+        fr = self.FITCONFIG.fitTo(model,hist,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True),ROOT.RooFit.PrintLevel(-1))
         #fr = model.fitTo(hist,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True),ROOT.RooFit.Minos(True))
         pars = fr.floatParsFinal()
         vals = {}
@@ -226,7 +344,7 @@ class Model(object):
                     continue
             canvas.cd()
 
-            canvas.Print('{0}_xproj.png'.format(savename))
+            printCanvas(canvas,'{0}_xproj.png'.format(savename))
 
             y = ws.var(self.y)
             if yRange:
@@ -299,18 +417,18 @@ class Model(object):
                     continue
             canvas.cd()
 
-            canvas.Print('{0}_yproj.png'.format(savename))
+            printCanvas(canvas,'{0}_yproj.png'.format(savename))
 
             histM = model.createHistogram('{},{}'.format(self.x,self.y),100,100)
             histM.SetLineColor(ROOT.kBlue)
             histM.Draw('surf3')
-            canvas.Print('{0}_model.png'.format(savename))
+            printCanvas(canvas,'{0}_model.png'.format(savename))
 
             if isinstance(hist,ROOT.RooDataSet):
                 histD = hist.createHistogram(x,y,20,20,'1','{}_hist'.format(savename))
                 histD.SetLineColor(ROOT.kBlack)
                 histD.Draw('surf3')
-                canvas.Print('{0}_dataset.png'.format(savename))
+                printCanvas(canvas,'{0}_dataset.png'.format(savename))
 
 
         if doErrors:
@@ -328,6 +446,39 @@ class Model(object):
         if hasattr(self,'params'): return self.params
         return []
 
+def _own(arg,servers):
+    '''
+    Let arg own servers created here, so that they live as long as arg
+    does, in particular until a deferred import of arg.
+    '''
+    owned = ROOT.RooArgSet()
+    for server in servers:
+        ROOT.SetOwnership(server,False)
+        owned.add(server)
+    arg.addOwnedComponents(owned)
+
+def _const(name,value):
+    return ROOT.RooConstVar(name,name,value)
+
+def buildMorphing(label,nominal,shifts):
+    '''
+    Vertical morphing of nominal in a set of nuisances:
+        nominal + sum_s max(0,s)*(up_s-nominal) + min(0,s)*(nominal-down_s)
+    where shifts = [(s, up_s, down_s)] and up_s/down_s are the shifted values.
+    This is one compiled PiecewiseInterpolation (piecewise linear, code 0)
+    instead of a formula string, and it owns nominal and the shifted values.
+    '''
+    params = ROOT.RooArgList()
+    highs = ROOT.RooArgList()
+    lows = ROOT.RooArgList()
+    for shift, up, down in shifts:
+        params.add(shift)
+        highs.add(up)
+        lows.add(down)
+    morph = ROOT.PiecewiseInterpolation(label,label,nominal,lows,highs,params)
+    _own(morph,[nominal]+[up for shift,up,down in shifts]+[down for shift,up,down in shifts])
+    return morph
+
 def buildSpline(ws,label,MH,masses,values):
     if isinstance(values, list):
         if isinstance(MH, list):
@@ -377,6 +528,52 @@ def buildSpline(ws,label,MH,masses,values):
 
     return spline
 
+def cacheNormalization(ws,label,bins,observables=[]):
+    '''
+    Tabulate the normalization integrals of the pdf label (and of its component pdfs)
+    over the observables on a grid of the variables in bins ({name: number of grid points}),
+    for example {'MA': 100, 'MH': 40}. RooFit fills the table the first time the
+    normalization is needed and then interpolates in it (2nd order) instead of integrating
+    again each time a cached variable moves. The settings are stored in the workspace (the
+    CACHEPARAMINT attribute and the "cache" binning of the variables) so combine uses them as well.
+    The table is refilled whenever a parameter that is not cached changes, which is much
+    slower than integrating directly, so only the pdfs whose floating parameters are all
+    in bins are cached. To cache a pdf whose shape moves with nuisance parameters, add
+    them to bins. Variables the pdf does not depend on are ignored.
+    Returns the names of the cached pdfs.
+    '''
+    params = ROOT.RooArgSet()
+    for name in sorted(bins):
+        var = ws.var(name)
+        if not var:
+            logging.warning('No variable {} to cache the normalization of {} on'.format(name,label))
+            continue
+        var.setBins(bins[name],'cache')
+        params.add(var)
+    cached = []
+    pdf = ws.pdf(label)
+    it = pdf.getComponents().createIterator()
+    comp = it.Next()
+    while comp:
+        # products and sums are normalized through their components
+        if comp.InheritsFrom('RooAbsPdf') and not comp.InheritsFrom('RooProdPdf') and not comp.InheritsFrom('RooAddPdf'):
+            variables = comp.getVariables()
+            vit = variables.createIterator()
+            var = vit.Next()
+            uncached = []
+            while var:
+                if var.InheritsFrom('RooRealVar') and not var.isConstant() and var.GetName() not in observables and not params.find(var.GetName()):
+                    uncached += [var.GetName()]
+                var = vit.Next()
+            if uncached:
+                logging.warning('Not caching the normalization of {}, it depends on {} which are not in the cache'.format(comp.GetName(),', '.join(sorted(uncached))))
+            else:
+                logging.debug('Caching the normalization of {} on {}'.format(comp.GetName(),', '.join(sorted(bins))))
+                comp.setParameterizeIntegral(params)
+                cached += [comp.GetName()]
+        comp = it.Next()
+    return cached
+
 class ModelSpline(Model):
 
     def __init__(self,name,**kwargs):
@@ -395,7 +592,7 @@ class ModelSpline(Model):
         if not hasattr(self,'integrals'): return 
         spline = buildSpline(ws,label,self.mh,self.masses,self.integrals)
         # import to workspace
-        getattr(ws, "import")(spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, spline, ROOT.RooFit.RecycleConflictNodes(), defer=True)
 
 class Param(object):
 
@@ -417,19 +614,35 @@ class Param(object):
                 av = ws.var(a)
                 if not av:
                     av = ws.function(a)
+                if not av:
+                    av = pendingArg(ws,a)
                 args.Add(av)
         else:
             shiftFormula = '{}'.format(value)
+        usedShifts = []
         for shift in shifts:
             up = shifts[shift]['up']
             down = shifts[shift]['down']
             if isinstance(value,basestring) or  abs(up/value)>uncertainty or abs(down/value)>uncertainty:
                 ws.factory('{}[0,-10,10]'.format(shift))
-                shiftFormula += ' + TMath::Max(0,@{shift})*({up}) + TMath::Min(0,@{shift})*({down})'.format(shift=len(args),up=up,down=down)
+                usedShifts += [shift]
+        if MORPHING and isinstance(value,basestring):
+            # morph the shifts around 0 and add them to the central formula
+            central = ROOT.RooFormulaVar('{}_central'.format(paramName), '{}_central'.format(paramName), shiftFormula, ROOT.RooArgList(args))
+            zero = _const('{}_nominal'.format(paramName),0.)
+            morph = buildMorphing('{}_shifts'.format(paramName), zero, [(ws.var(shift), _const('{}_{}Up'.format(paramName,shift),shifts[shift]['up']), _const('{}_{}Down'.format(paramName,shift),-shifts[shift]['down'])) for shift in usedShifts])
+            param = ROOT.RooAddition(paramName, paramName, ROOT.RooArgList(central,morph))
+            _own(param,[central,morph])
+        elif MORPHING:
+            nominal = _const('{}_nominal'.format(paramName),value)
+            param = buildMorphing(paramName, nominal, [(ws.var(shift), _const('{}_{}Up'.format(paramName,shift),value+shifts[shift]['up']), _const('{}_{}Down'.format(paramName,shift),value-shifts[shift]['down'])) for shift in usedShifts])
+        else:
+            for shift in usedShifts:
+                shiftFormula += ' + TMath::Max(0,@{shift})*({up}) + TMath::Min(0,@{shift})*({down})'.format(shift=len(args),up=shifts[shift]['up'],down=shifts[shift]['down'])
                 args.Add(ws.var(shift))
-        arglist = ROOT.RooArgList(args)
-        param = ROOT.RooFormulaVar(paramName, paramName, shiftFormula, arglist)
-        getattr(ws, "import")(param, ROOT.RooFit.RecycleConflictNodes())
+            arglist = ROOT.RooArgList(args)
+            param = ROOT.RooFormulaVar(paramName, paramName, shiftFormula, arglist)
+        wsimport(ws, param, ROOT.RooFit.RecycleConflictNodes(), defer=True)
 
 class Spline(object):
 
@@ -452,6 +665,8 @@ class Spline(object):
                 splineCentral = buildSpline(ws,centralName,self.mh,masses,values)
                 shiftFormula = '@0'
                 args.Add(splineCentral)
+                owned = [splineCentral]
+                morphShifts = []
                 for shift in shifts:
                     up = [u-c for u,c in zip(shifts[shift]['up'],values)]
                     down = [c-d for d,c in zip(shifts[shift]['down'],values)]
@@ -461,14 +676,25 @@ class Spline(object):
                         logging.warning('Zero value for {}: {}'.format(splineName, ' '.join(['{}'.format(v) for v in values])))
                     if any([abs(u/v)>uncertainty if v else u for u,v in zip(up,values)]) or any([abs(d/v)>uncertainty if v else d for d,v in zip(down,values)]):
                         ws.factory('{}[0,-10,10]'.format(shift))
+                        if MORPHING:
+                            # the shifted values themselves, the spline is linear in the values
+                            splineUp   = buildSpline(ws,upName,  self.mh,masses,shifts[shift]['up'])
+                            splineDown = buildSpline(ws,downName,self.mh,masses,shifts[shift]['down'])
+                            morphShifts += [(ws.var(shift),splineUp,splineDown)]
+                            continue
                         splineUp   = buildSpline(ws,upName,  self.mh,masses,up)
                         splineDown = buildSpline(ws,downName,self.mh,masses,down)
                         shiftFormula += ' + TMath::Max(0,@{shift})*@{up} + TMath::Min(0,@{shift})*@{down}'.format(shift=len(args),up=len(args)+1,down=len(args)+2)
                         args.Add(ws.var(shift))
                         args.Add(splineUp)
                         args.Add(splineDown)
-                arglist = ROOT.RooArgList(args)
-                spline = ROOT.RooFormulaVar(splineName, splineName, shiftFormula, arglist)
+                        owned += [splineUp,splineDown]
+                if MORPHING:
+                    spline = buildMorphing(splineName, splineCentral, morphShifts)
+                else:
+                    arglist = ROOT.RooArgList(args)
+                    spline = ROOT.RooFormulaVar(splineName, splineName, shiftFormula, arglist)
+                    _own(spline,owned)
             else:
                 MH = self.mh
                 if not isinstance(MH, list): MH = [MH]
@@ -484,6 +710,8 @@ class Spline(object):
                     pargs = ROOT.RooArgList()
                     c = values.GetParameter(p)
                     shiftFormula = '({:g})'.format(c)
+                    pname = 'p{}_{}'.format(p,splineName)
+                    morphShifts = []
                     for shift in shifts:
                         u = shifts[shift]['up'].GetParameter(p)
                         d = shifts[shift]['down'].GetParameter(p)
@@ -491,10 +719,15 @@ class Spline(object):
                         down = c-d
                         if c and (abs(up/c)<uncertainty and abs(down/c)<uncertainty): continue
                         ws.factory('{}[0,-10,10]'.format(shift))
+                        if MORPHING:
+                            morphShifts += [(ws.var(shift),_const('{}_{}Up'.format(pname,shift),u),_const('{}_{}Down'.format(pname,shift),d))]
+                            continue
                         shiftFormula += ' + TMath::Max(0,@{shift})*({up:g}) + TMath::Min(0,@{shift})*({down:g})'.format(shift=len(pargs),up=up,down=down)
                         pargs.add(ws.var(shift))
-                    pname = 'p{}_{}'.format(p,splineName)
-                    pform = ROOT.RooFormulaVar(pname,pname,shiftFormula,pargs)
+                    if MORPHING:
+                        pform = buildMorphing(pname,_const('{}_nominal'.format(pname),c),morphShifts)
+                    else:
+                        pform = ROOT.RooFormulaVar(pname,pname,shiftFormula,pargs)
                     params += [pform]
                     #args.add(pform)
                     #expr = expr.replace('[p{}]'.format(p),'@{}'.format(len(MH)+p))
@@ -505,6 +738,7 @@ class Spline(object):
                 values.SetName(splineName)
                 values.SetTitle(splineName)
                 spline = ROOT.RooTFnBinding(splineName,splineName,values,args,pargs)
+                _own(spline,params)
 
 
                 #up = shifts[shift]['up']
@@ -520,7 +754,7 @@ class Spline(object):
                 #args.Add(splineDown)
         else:
             spline = buildSpline(ws,splineName,self.mh,masses,values)
-        getattr(ws, "import")(spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, spline, ROOT.RooFit.RecycleConflictNodes(), defer=True)
 
 class Polynomial(Model):
 
@@ -554,7 +788,7 @@ class PolynomialSpline(ModelSpline):
             ps = self.kwargs.get('p{}'.format(o), [])
             paramName = 'p{}_{}'.format(o,label)
             paramsSplines[o] = buildSpline(ws,paramName,self.mh,masses,ps)
-            getattr(ws, "import")(paramSplines[o], ROOT.RooFit.RecycleConflictNodes())
+            wsimport(ws, paramSplines[o], ROOT.RooFit.RecycleConflictNodes())
             params += [paramName]
         ws.factory('Polynomial::{}({}, {{ {} }})'.format(label, self.x, ', '.join(['{}[0, -10, 10]'.format(p) for p in params])))
         self.params = params
@@ -590,7 +824,7 @@ class ChebychevSpline(ModelSpline):
             ps = self.kwargs.get('p{}'.format(o), [])
             paramName = 'p{}_{}'.format(o,label)
             paramsSplines[o] = buildSpline(ws,paramName,self.mh,masses,ps)
-            getattr(ws, "import")(paramSplines[o], ROOT.RooFit.RecycleConflictNodes())
+            wsimport(ws, paramSplines[o], ROOT.RooFit.RecycleConflictNodes())
             params += [paramName]
         ws.factory('Chebychev::{}({}, {{ {} }})'.format(label, self.x, ', '.join(['{}[0, -10, 10]'.format(p) for p in params])))
         self.params = params
@@ -629,8 +863,8 @@ class GaussianSpline(ModelSpline):
         meanSpline = buildSpline(ws,meanName,self.mh,masses,means)
         sigmaSpline = buildSpline(ws,sigmaName,self.mh,masses,sigmas)
         # import
-        getattr(ws, "import")(meanSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, meanSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("Gaussian::{0}({1}, {2}, {3})".format(label,self.x,meanName,sigmaName))
         self.params = [meanName,sigmaName]
@@ -669,8 +903,8 @@ class BreitWignerSpline(ModelSpline):
         meanSpline = buildSpline(ws,meanName,self.mh,masses,means)
         widthSpline = buildSpline(ws,sigmaName,self.mh,masses,widths)
         # import
-        getattr(ws, "import")(meanSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(widthSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, meanSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, widthSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("BreitWigner::{0}({1}, {2}, {3})".format(label,self.x,meanName,widthName))
         self.params = [meanName,widthName]
@@ -715,9 +949,9 @@ class VoigtianSpline(ModelSpline):
         widthSpline = buildSpline(ws,sigmaName,self.mh,masses,widths)
         sigmaSpline = buildSpline(ws,sigmaName,self.mh,masses,sigmas)
         # import
-        getattr(ws, "import")(meanSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(widthSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, meanSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, widthSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("Voigtian::{0}({1}, {2}, {3}, {4})".format(label,self.x,meanName,widthName,sigmaName))
         self.params = [meanName,widthName,sigmaName]
@@ -769,10 +1003,10 @@ class CrystalBallSpline(ModelSpline):
         aSpline     = buildSpline(ws,aName,self.mh,masses,a_s)
         nSpline     = buildSpline(ws,nName,self.mh,masses,n_s)
         # import
-        getattr(ws, "import")(meanSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(aSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(nSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, meanSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, aSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, nSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("RooCBShape::{0}({1}, {2}, {3}, {4}, {5})".format(label,self.x,meanName,sigmaName,aName,nName))
         self.params = [meanName,sigmaName,aName,nName]
@@ -840,12 +1074,12 @@ class DoubleCrystalBallSpline(ModelSpline):
         a2Spline    = buildSpline(ws,a2Name,self.mh,masses,a2s)
         n2Spline    = buildSpline(ws,n2Name,self.mh,masses,n2s)
         # import
-        getattr(ws, "import")(meanSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(a1Spline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(n1Spline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(a2Spline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(n2Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, meanSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, a1Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, n1Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, a2Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, n2Spline, ROOT.RooFit.RecycleConflictNodes())
 
         # build model
         doubleCB = ROOT.DoubleCrystalBall(label, label, ws.arg(self.x), ws.arg(meanName), ws.arg(sigmaName), 
@@ -900,9 +1134,9 @@ class DoubleSidedGaussianSpline(ModelSpline):
         sigma1Spline = buildSpline(ws,sigma1Name,self.mh,masses,sigma1s)
         sigma2Spline = buildSpline(ws,sigma2Name,self.mh,masses,sigma2s)
         # import
-        getattr(ws, "import")(meanSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigma1Spline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigma2Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, meanSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigma1Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigma2Spline, ROOT.RooFit.RecycleConflictNodes())
 
         # build model
         doubleG = ROOT.DoubleSidedGaussian(label, label, ws.arg(self.x), ws.arg(meanName), ws.arg(sigma1Name), ws.arg(sigma2Name), yMax )
@@ -968,11 +1202,11 @@ class DoubleSidedVoigtianSpline(ModelSpline):
         width1Spline = buildSpline(ws,width1Name,self.mh,masses,width1s)
         width2Spline = buildSpline(ws,width2Name,self.mh,masses,width2s)
         # import
-        getattr(ws, "import")(meanSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigma1Spline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigma2Spline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(width1Spline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(width2Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, meanSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigma1Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigma2Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, width1Spline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, width2Spline, ROOT.RooFit.RecycleConflictNodes())
 
         # build model
         doubleV = ROOT.DoubleSidedVoigtian(label, label, ws.arg(self.x), ws.arg(meanName), ws.arg(sigma1Name), ws.arg(sigma2Name), ws.arg(width1Name), ws.arg(width2Name), yMax )
@@ -1104,8 +1338,8 @@ class ErfSpline(ModelSpline):
         erfScaleSpline = buildSpline(ws,erfScaleName,self.mh,masses,erfScales)
         erfShiftSpline = buildSpline(ws,erfShiftName,self.mh,masses,erfShifts)
         # import
-        getattr(ws, "import")(erfScaleSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(erfShiftSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, erfScaleSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, erfShiftSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("EXPR::{0}('0.5*(TMath::Erf({2}*({1}-{3}))+1)', {1}, {2}, {3})".format(
                    label,self.x,erfScaleName,erfShiftName)
@@ -1142,7 +1376,7 @@ class MaxwellBoltzmannSpline(ModelSpline):
         # splines  
         scaleSpline = buildSpline(ws,scaleName,self.mh,masses,scales)
         # import
-        getattr(ws, "import")(scaleSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, scaleSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("EXPR::{0}('{1}^2/{2}^3*exp(-{1}^2/(2*{2}^2))', {1}, {2})".format(
                    label,self.x,scaleName)
@@ -1206,7 +1440,7 @@ class BetaConv(Model):
         g.build(ws,'{}_gaus'.format(label))
         f = ROOT.RooFFTConvPdf(label,label,ws.var(self.x),ws.pdf('{}_beta'.format(label)),ws.pdf('{}_gaus'.format(label))) 
         #f = ROOT.RooNumConvPdf(label,label,ws.var(self.x),ws.pdf('{}_beta'.format(label)),ws.pdf('{}_gaus'.format(label))) 
-        getattr(ws,'import')(f)
+        wsimport(ws, f)
         self.params = [betaScaleName,betaAName,betaBName,meanName,sigmaName]
 
 class BetaSpline(ModelSpline):
@@ -1228,9 +1462,9 @@ class BetaSpline(ModelSpline):
         betaASpline = buildSpline(ws,betaAName,self.mh,masses,betaAs)
         betaBSpline = buildSpline(ws,betaBName,self.mh,masses,betaBs)
         # import
-        getattr(ws, "import")(betaScaleSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(betaASpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(betaBSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, betaScaleSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, betaASpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, betaBSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("EXPR::{0}('TMath::BetaDist({1}*{2},{3},{4})', {1}, {2}, {3}, {4})".format(
                    label,self.x,betaScaleName,betaAName,betaBName)
@@ -1273,8 +1507,8 @@ class LandauSpline(ModelSpline):
         muSpline    = buildSpline(ws,muName,self.mh,masses,mus)
         sigmaSpline = buildSpline(ws,sigmaName,self.mh,masses,sigmas)
         # import
-        getattr(ws, "import")(muSpline, ROOT.RooFit.RecycleConflictNodes())
-        getattr(ws, "import")(sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, muSpline, ROOT.RooFit.RecycleConflictNodes())
+        wsimport(ws, sigmaSpline, ROOT.RooFit.RecycleConflictNodes())
         # build model
         ws.factory("RooLandau::{0}({1}, {2}, {3})".format(
                    label,self.x,muName,sigmaName)
@@ -0,0 +1,125 @@
+import os
+import time
+import glob
+import hashlib
+import atexit
+import logging
+import functools
+import multiprocessing
+
+import ROOT
+
+from CombineLimits.Limits.utilities import python_mkdir, runTasks
+
+class PlotQueue(object):
+    '''
+    PlotQueue
+
+    Record canvases instead of printing them, so that the fits never wait
+    on the rendering. Each canvas is written with everything drawn on it
+    (frames, curves, pulls, graphs) to its own ROOT file in directory,
+    named by a hash of the output file name, so a later plot of the same
+    name replaces an earlier one. render prints the queued canvases and
+    removes them, optionally spread over a process pool.
+    '''
+
+    def __init__(self,directory):
+        self.directory = directory
+
+    def _path(self,key):
+        return os.path.join(self.directory,'{}.root'.format(hashlib.sha1(key).hexdigest()))
+
+    def add(self,canvas,filename,key=None):
+        '''
+        Queue canvas to be printed to filename, or to each of a list of filenames.
+        The entry replaces an earlier one with the same key, by default the file names.
+        Returns the path of the entry.
+        '''
+        filenames = [filename] if isinstance(filename,basestring) else list(filename)
+        python_mkdir(self.directory)
+        path = self._path(key or '\n'.join(filenames))
+        # write to a temporary file and rename so that render never reads a partial entry
+        tmp = '{}.{}.tmp'.format(path,os.getpid())
+        tfile = ROOT.TFile.Open(tmp,'RECREATE')
+        tfile.WriteObject(canvas,'canvas')
+        tfile.WriteObject(ROOT.TNamed('filename','\n'.join(filenames)),'filename')
+        tfile.Close()
+        os.rename(tmp,path)
+        return path
+
+    def pending(self):
+        '''The queued entries.'''
+        return sorted(glob.glob(os.path.join(self.directory,'*.root')))
+
+    def render(self,nworkers=1):
+        '''Print all queued canvases and return the number printed.'''
+        entries = self.pending()
+        results = runTasks([functools.partial(renderEntry,path) for path in entries],nworkers)
+        return sum(results)
+
+def renderEntry(path):
+    '''Print the canvas queued in path to its files and remove the entry, return 1 if it was printed.'''
+    tfile = ROOT.TFile.Open(path)
+    if not tfile or tfile.IsZombie():
+        logging.error('Failed to open queued plot {}'.format(path))
+        return 0
+    canvas = tfile.Get('canvas')
+    canvas.Draw()
+    for filename in tfile.Get('filename').GetTitle().split('\n'):
+        if os.path.dirname(filename): python_mkdir(os.path.dirname(filename))
+        canvas.Print(filename)
+    tfile.Close()
+    os.remove(path)
+    return 1
+
+class RenderPool(object):
+    '''
+    RenderPool
+
+    Print canvases in a pool of background processes. add writes the
+    canvas once to a PlotQueue entry in directory and returns at once,
+    the workers print it to all its files. wait blocks until all the
+    queued canvases are printed, it is also called at exit.
+    '''
+
+    def __init__(self,directory,nworkers=2):
+        self.queue = PlotQueue(directory)
+        # fork the workers now, before the plotting builds up ROOT state
+        self.pool = multiprocessing.Pool(nworkers)
+        self.results = []
+        atexit.register(self.wait)
+
+    def add(self,canvas,filenames):
+        '''Queue canvas to be printed to filenames.'''
+        path = self.queue.add(canvas,filenames,key='{}_{}'.format(os.getpid(),len(self.results)))
+        self.results += [self.pool.apply_async(renderEntry,(path,))]
+
+    def wait(self):
+        '''Wait for all the queued canvases to be printed, return the number printed.'''
+        if self.pool is None: return 0
+        start = time.time()
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+        n = 0
+        for result in self.results:
+            try:
+                n += result.get()
+            except Exception as e:
+                logging.error('Failed to render a plot: {}'.format(e))
+        logging.info('Rendered {} of {} plots, waited {:.1f} s'.format(n,len(self.results),time.time()-start))
+        return n
+
+PLOTQUEUE = None
+
+def deferPlots(directory):
+    '''Queue the plots printed with printCanvas in directory, None to print them immediately.'''
+    global PLOTQUEUE
+    PLOTQUEUE = PlotQueue(directory) if directory else None
+
+def printCanvas(canvas,filename):
+    '''canvas.Print(filename), or queue it if plots are deferred (see deferPlots).'''
+    if PLOTQUEUE is None:
+        canvas.Print(filename)
+    else:
+        PLOTQUEUE.add(canvas,filename)
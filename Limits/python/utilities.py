@@ -8,11 +8,15 @@ import math
 import json
 import pickle
 import glob
+import collections
+import multiprocessing
 
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 ROOT.gROOT.SetBatch()
 
+import CombineLimits.Limits.HistArrays as HistArrays
+
 # common definitions
 ZMASS = 91.1876
 
@@ -47,6 +51,81 @@ def runCommand(command):
     return subprocess.Popen(command,shell=True,stdout=subprocess.PIPE,stderr=subprocess.STDOUT).communicate()[0]
 
 
+def runTasks(tasks,nworkers=1):
+    '''
+    Run a list of callables and return their results in order.
+    With nworkers>1 the tasks are spread over a forked process pool.
+    The tasks are registered before the fork, so each worker gets its own copy
+    of the ROOT state and the callables (bound methods holding ROOT objects, etc)
+    are never pickled. Only the return values are sent back and must be picklable.
+    '''
+    global _poolTasks
+    if nworkers<=1 or len(tasks)<2:
+        return [task() for task in tasks]
+    _poolTasks = tasks
+    pool = multiprocessing.Pool(min(nworkers,len(tasks)))
+    try:
+        results = pool.map(_runPoolTask, range(len(tasks)), 1)
+    finally:
+        pool.close()
+        pool.join()
+        _poolTasks = []
+    return results
+
+_poolTasks = []
+
+def _runPoolTask(i):
+    return _poolTasks[i]()
+
+class LazyDict(collections.MutableMapping):
+    '''
+    A dict where a value can be given as a loader with setLoader.
+    The loader is only called the first time the key is accessed
+    and its result is kept. Keys keep the order they were added in.
+    '''
+
+    def __init__(self,*args,**kwargs):
+        self._values = dict(*args,**kwargs)
+        self._loaders = {}
+        self._keys = self._values.keys()
+
+    def setLoader(self,key,loader):
+        '''Set a callable returning the value of key.'''
+        if key not in self: self._keys += [key]
+        self._values.pop(key,None)
+        self._loaders[key] = loader
+
+    def isLoaded(self,key):
+        return key in self._values
+
+    def __getitem__(self,key):
+        if key not in self._values:
+            if key not in self._loaders: raise KeyError(key)
+            value = self._loaders[key]()
+            self._loaders.pop(key,None) # the loader may have set it already
+            self._values[key] = value
+        return self._values[key]
+
+    def __setitem__(self,key,value):
+        if key not in self: self._keys += [key]
+        self._loaders.pop(key,None)
+        self._values[key] = value
+
+    def __delitem__(self,key):
+        if key not in self: raise KeyError(key)
+        self._keys.remove(key)
+        self._loaders.pop(key,None)
+        self._values.pop(key,None)
+
+    def __contains__(self,key):
+        return key in self._values or key in self._loaders
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
 def getCMSSWMajorVersion():
     return os.environ['CMSSW_VERSION'].split('_')[1]
 
@@ -85,14 +164,7 @@ def getDatasetIntegralError(dataset, cutSpec=''):
 
 
 def getHistogramIntegralError(hist,binlow=1,binhigh=-1):
-    if binhigh<0: binhigh = hist.GetNbinsX()
-    integralerr = ROOT.Double(0)
-    hist.IntegralAndError(binlow,binhigh,integralerr,"")
-    return float(integralerr)
+    return HistArrays.integralAndError(hist,binlow,binhigh)[1]
 
 def getHistogram2DIntegralError(hist,binxlow=1,binxhigh=-1,binylow=1,binyhigh=-1):
-    if binxhigh<0: binxhigh = hist.GetNbinsX()
-    if binyhigh<0: binyhigh = hist.GetNbinsY()
-    integralerr = ROOT.Double(0)
-    hist.IntegralAndError(binxlow,binxhigh,binylow,binyhigh,integralerr,"")
-    return float(integralerr)
+    return HistArrays.integralAndError(hist,binxlow,binxhigh,binylow,binyhigh)[1]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+'''
+Benchmark the datacard writer.
+Builds a Limits object with a given number of bins, processes and
+systematics (rate and shape) and times printCard for each combination.
+'''
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import resource
+import itertools
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+from CombineLimits.Limits.Limits import Limits
+
+logging.basicConfig(level=logging.ERROR, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def buildLimits(nbins,nprocesses,nsysts,nhistbins=10):
+    random.seed(1)
+    limits = Limits()
+    bins = ['bin{}'.format(b) for b in range(nbins)]
+    processes = ['sig']+['bg{}'.format(p) for p in range(nprocesses-1)]
+    for b in bins:
+        limits.addBin(b)
+    for p in processes:
+        limits.addProcess(p,signal=p=='sig')
+
+    def hist(name):
+        h = ROOT.TH1F(name,name,nhistbins,0,nhistbins)
+        for i in range(nhistbins):
+            h.SetBinContent(i+1,random.random())
+        return h
+
+    for b in bins:
+        limits.setObserved(b,hist('data_obs_{}'.format(b)))
+        for p in processes:
+            limits.setExpected(p,b,hist('{}_{}'.format(p,b)))
+
+    for s in range(nsysts):
+        if s%3==0:
+            limits.addSystematic('lnN_{}'.format(s),'lnN',systematics={(tuple(processes),tuple(bins)):1+0.1*random.random()})
+        elif s%3==1:
+            limits.addSystematic('lnN_{{process}}_{}'.format(s),'lnN',systematics=dict([(((p,),(b,)),(1.1,0.9)) for p in processes for b in bins]))
+        else:
+            limits.addSystematic('shape_{}'.format(s),'shape',systematics=dict([(((p,),(b,)),(hist('up'),hist('down'))) for p in processes for b in bins]))
+    return limits
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the datacard writer')
+    parser.add_argument('--bins', type=int, nargs='*', default=[1,4,16])
+    parser.add_argument('--processes', type=int, nargs='*', default=[2,8])
+    parser.add_argument('--systematics', type=int, nargs='*', default=[10,100,400])
+    parser.add_argument('--outDir', type=str, default='benchmark')
+    args = parser.parse_args(argv)
+
+    print '{:>6} {:>10} {:>12} {:>10} {:>12}'.format('bins','processes','systematics','time [s]','maxrss [MB]')
+    for nbins, nprocesses, nsysts in itertools.product(args.bins,args.processes,args.systematics):
+        limits = buildLimits(nbins,nprocesses,nsysts)
+        name = '{}/datacard_{}_{}_{}'.format(args.outDir,nbins,nprocesses,nsysts)
+        start = time.time()
+        limits.printCard(name,blind=False)
+        elapsed = time.time()-start
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+        print '{:>6} {:>10} {:>12} {:>10.3f} {:>12.1f}'.format(nbins,nprocesses,nsysts,elapsed,maxrss)
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+'''
+Benchmark the NLL evaluation with the shifted signal parameters built as
+formula strings (Models.MORPHING = False) and as PiecewiseInterpolation
+nodes (Models.MORPHING = True).
+The workspace mimics the mmmt_mm_parametric one: a Voigtian signal in
+CMS_haa_x per Higgs mass whose mean, width, sigma and integral are
+splines in MA with a number of signal shifts, on an exponential
+background whose integral has background shifts.
+'''
+import sys
+import time
+import random
+import logging
+import argparse
+import resource
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+import CombineLimits.Limits.Models as Models
+
+logging.basicConfig(level=logging.ERROR, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def buildWorkspace(nhiggs,nshifts,nevents):
+    random.seed(1)
+    ws = ROOT.RooWorkspace('w')
+    ws.factory('CMS_haa_x[2.5,25]')
+    ws.factory('MA[7,4,21]')
+    amasses = [4,5,7,9,11,13,15,17,19,21]
+    shifts = ['CMS_shift{}'.format(s) for s in range(nshifts)]
+    bgShifts = ['CMS_bgshift{}'.format(s) for s in range(nshifts)]
+
+    def shifted(values,size):
+        return {'up': [v*(1+size*random.random()) for v in values], 'down': [v*(1-size*random.random()) for v in values]}
+
+    pdfs = ROOT.RooArgList()
+    yields = ROOT.RooArgList()
+    for h in range(nhiggs):
+        label = 'ggH_haa_{}'.format(h)
+        values = {
+            'mean'    : [a*(1+0.001*h) for a in amasses],
+            'width'   : [0.01*a for a in amasses],
+            'sigma'   : [0.02*a for a in amasses],
+            'integral': [10.*(1+0.1*h) for a in amasses],
+        }
+        with Models.ImportBatch('benchmark'):
+            for param in sorted(values):
+                spline = Models.Spline(param,
+                    MH = 'MA',
+                    masses = amasses,
+                    values = values[param],
+                    shifts = dict([(shift,shifted(values[param],0.05)) for shift in shifts]),
+                )
+                spline.build(ws,'{}_{}'.format(param,label))
+        model = Models.Voigtian(label, x='CMS_haa_x', **dict([(param,'{}_{}'.format(param,label)) for param in ['mean','width','sigma']]))
+        model.build(ws,label)
+        pdfs.add(ws.pdf(label))
+        yields.add(ws.function('integral_{}'.format(label)))
+
+    bg = Models.Exponential('bg', x='CMS_haa_x', lamb=[-0.1,-1,0])
+    bg.build(ws,'bg')
+    param = Models.Param('integral_bg',
+        value = float(nevents),
+        shifts = dict([(shift,{'up': 0.05*nevents*random.random(), 'down': 0.05*nevents*random.random()}) for shift in bgShifts]),
+    )
+    param.build(ws,'integral_bg')
+    pdfs.add(ws.pdf('bg'))
+    yields.add(ws.function('integral_bg'))
+    model = ROOT.RooAddPdf('model','model',pdfs,yields)
+    Models.wsimport(ws,model,ROOT.RooFit.RecycleConflictNodes())
+
+    x = ws.var('CMS_haa_x')
+    ROOT.RooRandom.randomGenerator().SetSeed(1)
+    data = ws.pdf('model').generate(ROOT.RooArgSet(x),nevents)
+    data.SetName('data')
+    return ws, data, shifts+bgShifts
+
+def benchmark(morphing,nhiggs,nshifts,nevents,nevals):
+    Models.MORPHING = morphing
+    start = time.time()
+    ws, data, shifts = buildWorkspace(nhiggs,nshifts,nevents)
+    buildTime = time.time()-start
+    nformulas = len([f for f in iterate(ws.allFunctions()) if f.InheritsFrom('RooFormulaVar')])
+    nll = ws.pdf('model').createNLL(data,ROOT.RooFit.Extended(True))
+    vars = [ws.var(shift) for shift in shifts]+[ws.var('MA')]
+    random.seed(2)
+    points = [[random.gauss(0,1) for shift in shifts]+[random.uniform(4,21)] for i in range(nevals)]
+    values = []
+    start = time.time()
+    for point in points:
+        for var, val in zip(vars,point):
+            var.setVal(val)
+        values += [nll.getVal()]
+    evalTime = time.time()-start
+    return buildTime, evalTime/nevals, nformulas, values
+
+def iterate(argset):
+    it = argset.createIterator()
+    arg = it.Next()
+    while arg:
+        yield arg
+        arg = it.Next()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the NLL with formula and morphing shifts')
+    parser.add_argument('--higgs', type=int, default=8, help='Number of signal models')
+    parser.add_argument('--shifts', type=int, nargs='*', default=[2,8,16], help='Number of shifts')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--evaluations', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    print '{:>7} {:>10} {:>9} {:>10} {:>14} {:>12} {:>12}'.format('shifts','mode','formulas','build [s]','NLL eval [ms]','max |dNLL|','maxrss [MB]')
+    for nshifts in args.shifts:
+        results = {}
+        for morphing in [False,True]:
+            results[morphing] = benchmark(morphing,args.higgs,nshifts,args.events,args.evaluations)
+        diff = max([abs(a-b) for a,b in zip(results[False][3],results[True][3])])
+        for morphing in [False,True]:
+            buildTime, evalTime, nformulas, values = results[morphing]
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+            print '{:>7} {:>10} {:>9} {:>10.2f} {:>14.3f} {:>12.2e} {:>12.1f}'.format(nshifts,'morphing' if morphing else 'formula',nformulas,buildTime,evalTime*1e3,diff,maxrss)
+    Models.MORPHING = True
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+'''
+Collect the limits of the combine outputs in one or more directories into
+one table (limits.npz and limits.csv, see LimitTable). Rerunning only
+reads the files that are new or changed. The files that could not be
+read or miss some of the quantiles are listed in badFiles.txt.
+'''
+import os
+import sys
+import logging
+import argparse
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+from CombineLimits.Limits.LimitTable import LimitTable, FILEPATTERN
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Collect combine limits into one table')
+    parser.add_argument('directories', type=str, nargs='+', help='Directories with the combine outputs (searched recursively)')
+    parser.add_argument('--output', type=str, default='limitTable', help='Directory of the table')
+    parser.add_argument('--pattern', type=str, default=FILEPATTERN, help='Regular expression for the file names, with groups h, a and optionally mode and method')
+    parser.add_argument('--mode', type=str, default='', help='Mode of the files whose name has none')
+    parser.add_argument('--nworkers', type=int, default=1, help='Number of processes reading the files')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_command_line(argv)
+
+    table = LimitTable(args.output)
+    nread = table.update(args.directories,pattern=args.pattern,mode=args.mode,nworkers=args.nworkers)
+    table.save()
+
+    bad = table.bad()
+    with open(os.path.join(args.output,'badFiles.txt'),'w') as f:
+        for path in bad:
+            f.write('{}\n'.format(path))
+
+    points = table.points()
+    logging.info('Read {} files, {} points, {} bad files'.format(nread,len(points),len(bad)))
+    for mode, h in sorted(set([(m,hm) for m, hm, a in points])):
+        logging.info('{} {:g}: {} a masses'.format(mode,h,len([1 for m, hm, a in points if (m,hm)==(mode,h)])))
+
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+'''
+Print the plots queued by a run with deferred plotting (see PlotQueue).
+'''
+import sys
+import time
+import logging
+import argparse
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+from CombineLimits.Limits.PlotQueue import PlotQueue
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the queued plots')
+    parser.add_argument('directory', type=str, help='Plot queue directory')
+    parser.add_argument('--nworkers', type=int, default=1, help='Number of processes to render with')
+    args = parser.parse_args(argv)
+
+    queue = PlotQueue(args.directory)
+    start = time.time()
+    n = queue.render(args.nworkers)
+    logging.info('Rendered {} plots in {:.1f} s'.format(n,time.time()-start))
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
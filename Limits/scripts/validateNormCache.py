@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+'''
+Validate the tabulated pdf normalizations (see Models.cacheNormalization).
+For each pdf the normalization over the observable is evaluated at random
+points, once from the table and once with RooFit's integral, and the largest
+relative difference and the time per evaluation are printed, along with the
+time per NLL evaluation on a generated dataset. The points move the cached
+variables and all other floating parameters (the shape nuisances), since the
+table is refilled whenever one of those changes. Pdfs without a table can be
+given one with --cache.
+'''
+import sys
+import time
+import random
+import logging
+import argparse
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+import CombineLimits.Limits.Models as Models
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def iterate(argset):
+    it = argset.createIterator()
+    arg = it.Next()
+    while arg:
+        yield arg
+        arg = it.Next()
+
+def cachedPdfs(ws,pdfs):
+    '''The pdfs (and pdf components) with a tabulated normalization'''
+    result = []
+    for name in pdfs:
+        pdf = ws.pdf(name)
+        if not pdf:
+            logging.error('No pdf {} in the workspace'.format(name))
+            continue
+        for comp in iterate(pdf.getComponents()):
+            if comp.getStringAttribute('CACHEPARAMINT') and comp.GetName() not in [r.GetName() for r in result]:
+                result += [comp]
+    return result
+
+def floatingParameters(pdf,x):
+    '''The floating parameters of pdf, all but the observable'''
+    return [p for p in iterate(pdf.getVariables()) if p.InheritsFrom('RooRealVar') and not p.isConstant() and p.GetName()!=x.GetName()]
+
+def randomPoints(params,cachedNames,npoints):
+    '''
+    Random values of params: uniform in the range for the cached variables,
+    gaussian around the current value (by the error, or 1) for the others
+    (the nuisances moving in a scan), inside the range.
+    '''
+    random.seed(1)
+    points = []
+    for i in range(npoints):
+        point = []
+        for p in params:
+            if p.GetName() in cachedNames:
+                v = random.uniform(p.getMin(),p.getMax())
+            else:
+                v = random.gauss(p.getVal(),p.getError() or 1.)
+                v = min(max(v,p.getMin()),p.getMax())
+            point += [v]
+        points += [point]
+    return points
+
+def timeEvaluations(func,params,points):
+    '''Evaluate func at each of points, return the values and the time per evaluation'''
+    values = []
+    start = time.time()
+    for point in points:
+        for p, v in zip(params,point):
+            p.setVal(v)
+        values += [func.getVal()]
+    return values, (time.time()-start)/max(len(points),1)
+
+def validate(ws,pdf,x,npoints,nevents):
+    '''
+    Compare the cached and direct normalization and NLL of pdf at random points, moving
+    the cached variables and every other floating parameter (the shape nuisances).
+    Returns the largest relative differences of the normalization and of the NLL, the time
+    per cached and per direct normalization and NLL evaluation, and the table fill time.
+    '''
+    attribute = pdf.getStringAttribute('CACHEPARAMINT')
+    cachedNames = attribute.split(':')
+    params = floatingParameters(pdf,x)
+    obs = ROOT.RooArgSet(x)
+    initial = [p.getVal() for p in params]
+    data = pdf.generate(obs,nevents)
+
+    start = time.time()
+    cached = pdf.createIntegral(obs)
+    cached.getVal() # fills the table
+    fillTime = time.time()-start
+    cachedNLL = pdf.createNLL(data)
+
+    pdf.setStringAttribute('CACHEPARAMINT',None)
+    direct = pdf.createIntegral(obs)
+    directNLL = pdf.createNLL(data)
+    pdf.setStringAttribute('CACHEPARAMINT',attribute)
+
+    points = randomPoints(params,cachedNames,npoints)
+    results = {}
+    for name, func in [('cached',cached),('direct',direct),('cachedNLL',cachedNLL),('directNLL',directNLL)]:
+        results[name] = timeEvaluations(func,params,points)
+    for p, v in zip(params,initial):
+        p.setVal(v)
+
+    def maxDiff(a,b):
+        return max([abs(c-d)/abs(d) for c, d in zip(a,b) if d] or [0.])
+
+    normDiff = maxDiff(results['cached'][0],results['direct'][0])
+    nllDiff = max([abs(c-d) for c, d in zip(results['cachedNLL'][0],results['directNLL'][0])] or [0.])
+    return normDiff, nllDiff, results['cached'][1], results['direct'][1], results['cachedNLL'][1], results['directNLL'][1], fillTime
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate the tabulated pdf normalizations')
+    parser.add_argument('workspace', type=str, help='ROOT file with the workspace')
+    parser.add_argument('pdfs', type=str, nargs='+', help='Pdfs to check')
+    parser.add_argument('--wsname', type=str, default='w')
+    parser.add_argument('--x', type=str, default='CMS_haa_x', help='Observable')
+    parser.add_argument('--cache', type=str, nargs='*', default=[], help='Tabulate the pdfs first, VAR:POINTS (e.g. MA:100)')
+    parser.add_argument('--points', type=int, default=200, help='Number of random points to compare')
+    parser.add_argument('--events', type=int, default=1000, help='Number of events generated for the NLL')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='Largest accepted relative difference of the normalization')
+    args = parser.parse_args(argv)
+
+    tfile = ROOT.TFile.Open(args.workspace)
+    ws = tfile.Get(args.wsname)
+    if args.cache:
+        for pdf in args.pdfs:
+            Models.cacheNormalization(ws,pdf,dict([(v.split(':')[0],int(v.split(':')[1])) for v in args.cache]),[args.x])
+
+    x = ws.var(args.x)
+    failed = False
+    print '{:<40} {:>12} {:>10} {:>12} {:>12} {:>14} {:>14} {:>10}'.format('pdf','max rel diff','max dNLL','cached [us]','direct [us]','cached NLL [ms]','direct NLL [ms]','fill [s]')
+    for pdf in cachedPdfs(ws,args.pdfs):
+        normDiff, nllDiff, cachedTime, directTime, cachedNLLTime, directNLLTime, fillTime = validate(ws,pdf,x,args.points,args.events)
+        print '{:<40} {:>12.2e} {:>10.2e} {:>12.1f} {:>12.1f} {:>14.3f} {:>14.3f} {:>10.2f}'.format(pdf.GetName(),normDiff,nllDiff,cachedTime*1e6,directTime*1e6,cachedNLLTime*1e3,directNLLTime*1e3,fillTime)
+        if normDiff>args.tolerance: failed = True
+        if cachedNLLTime>directNLLTime: logging.warning('The cached NLL of {} is slower than the direct one'.format(pdf.GetName()))
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,129 @@
+'''
+Limits on a (x, y) mesh with NumPy.
+
+interpolate evaluates the limits between the points as TGraph::Eval does
+(linear, extrapolating from the two outermost points), for whole arrays of
+limits at once, and contourLines finds the lines at a level of such a grid
+with marching squares, without drawing anything.
+'''
+import numpy as np
+
+import ROOT
+
+def interpolate(xp,yp,xs,log=False):
+    '''
+    Linear interpolation of yp, with the points along the last axis at xp, to xs.
+    Outside of xp the two outermost points are extrapolated, as in TGraph::Eval.
+    With log the interpolation is linear in log(yp).
+    '''
+    xp = np.asarray(xp,dtype=np.float64)
+    yp = np.asarray(yp,dtype=np.float64)
+    xs = np.asarray(xs,dtype=np.float64)
+    if log: yp = np.log(yp)
+    if len(xp)==1:
+        result = np.repeat(yp[...,:1],len(xs),axis=-1)
+    else:
+        order = np.argsort(xp,kind='mergesort')
+        xp = xp[order]
+        yp = yp[...,order]
+        i = np.clip(np.searchsorted(xp,xs,side='right')-1,0,len(xp)-2)
+        dx = xp[i+1]-xp[i]
+        f = np.where(dx>0,(xs-xp[i])/np.where(dx>0,dx,1.),0.)
+        result = yp[...,i]*(1-f)+yp[...,i+1]*f
+    return np.exp(result) if log else result
+
+def evalGraph(graph,xs):
+    '''graph.Eval at each of xs, done with interpolate for a TGraph'''
+    xs = np.asarray(xs,dtype=np.float64)
+    if graph.InheritsFrom('TGraph') and graph.GetN()>0:
+        n = graph.GetN()
+        gx = graph.GetX()
+        gy = graph.GetY()
+        return interpolate([gx[i] for i in range(n)],[gy[i] for i in range(n)],xs)
+    return np.array([graph.Eval(x) for x in xs])
+
+def scaleGrid(scales,modelkey,xvals,ys):
+    '''The (len(ys) x len(xvals)) scales[x][modelkey] at each y, at least 1e-10'''
+    grid = np.array([evalGraph(scales[x][modelkey],ys) for x in xvals]).T
+    grid[grid<=0] = 1e-10
+    return grid
+
+def fillHist(hist,grid):
+    '''Set the contents of the TH2 hist (without under/overflow) to the (ny x nx) grid'''
+    from CombineLimits.Limits.HistArrays import contents
+    contents(hist)[1:-1,1:-1] = grid
+
+# the edges of a cell crossed by the contour for each of the 16 corner cases
+# corners: 0 (x0,y0), 1 (x1,y0), 2 (x1,y1), 3 (x0,y1), bit set if above the level
+# edges: 0 bottom, 1 right, 2 top, 3 left
+_segments = {
+    1: [(3,0)], 2: [(0,1)], 3: [(3,1)], 4: [(1,2)], 6: [(0,2)], 7: [(3,2)],
+    8: [(2,3)], 9: [(2,0)], 11: [(2,1)], 12: [(1,3)], 13: [(1,0)], 14: [(0,3)],
+}
+# the saddles, joining the corners above the level if the center is above it and splitting them otherwise
+_saddles = {
+    5:  ([(0,1),(2,3)], [(3,0),(1,2)]),
+    10: ([(3,0),(1,2)], [(0,1),(2,3)]),
+}
+
+def contourLines(grid,xs,ys,level=1.):
+    '''
+    The lines where the (ny x nx) grid, with the values at xs and ys, crosses level.
+    Returns a list of (x, y) arrays, the closed lines end at their first point.
+    '''
+    z = np.asarray(grid,dtype=np.float64)
+    xs = np.asarray(xs,dtype=np.float64)
+    ys = np.asarray(ys,dtype=np.float64)
+    above = z>level
+    cases = (above[:-1,:-1]*1 | above[:-1,1:]*2 | above[1:,1:]*4 | above[1:,:-1]*8)
+
+    def edgePoint(j,i,edge):
+        # an edge is named by the grid point it starts at and its direction
+        if edge==0: p, q = (j,i), (j,i+1)
+        elif edge==1: p, q = (j,i+1), (j+1,i+1)
+        elif edge==2: p, q = (j+1,i), (j+1,i+1)
+        else: p, q = (j,i), (j+1,i)
+        key = (p,q)
+        zp, zq = z[p], z[q]
+        f = (level-zp)/(zq-zp) if zq!=zp else 0.5
+        x = xs[p[1]]+f*(xs[q[1]]-xs[p[1]])
+        y = ys[p[0]]+f*(ys[q[0]]-ys[p[0]])
+        return key, (x,y)
+
+    # the segments of the crossed cells, each joining two edges
+    points = {}
+    neighbours = {}
+    for j, i in zip(*np.nonzero((cases>0) & (cases<15))):
+        case = cases[j,i]
+        if case in _saddles:
+            center = 0.25*(z[j,i]+z[j,i+1]+z[j+1,i+1]+z[j+1,i])
+            segments = _saddles[case][0 if center>level else 1]
+        else:
+            segments = _segments[case]
+        for a, b in segments:
+            ka, pa = edgePoint(j,i,a)
+            kb, pb = edgePoint(j,i,b)
+            points[ka] = pa
+            points[kb] = pb
+            neighbours.setdefault(ka,[]).append(kb)
+            neighbours.setdefault(kb,[]).append(ka)
+
+    # join the segments, starting with the lines that end on the border
+    lines = []
+    used = set()
+    starts = [k for k in sorted(neighbours) if len(neighbours[k])==1]+sorted(neighbours)
+    for start in starts:
+        if start in used: continue
+        line = [start]
+        used.add(start)
+        current = start
+        while True:
+            nexts = [k for k in neighbours[current] if k not in used]
+            if not nexts:
+                if len(line)>2 and start in neighbours[current]: line += [start]
+                break
+            current = nexts[0]
+            used.add(current)
+            line += [current]
+        lines += [(np.array([points[k][0] for k in line]),np.array([points[k][1] for k in line]))]
+    return lines
@@ -5,10 +5,15 @@ import math
 from array import array
 from collections import OrderedDict
 
+import numpy as np
+
 import ROOT
 
 from CombineLimits.Plotter.PlotterBase import PlotterBase
 from CombineLimits.Utilities.utilities import python_mkdir
+from CombineLimits.Limits.Models import Model
+from CombineLimits.Limits.LimitTable import LimitTable
+from CombineLimits.Plotter.LimitGrid import interpolate, scaleGrid, fillHist, contourLines
 import CombineLimits.Plotter.CMS_lumi as CMS_lumi
 import CombineLimits.Plotter.tdrstyle as tdrstyle
 
@@ -40,15 +45,129 @@ ROOT.gStyle.SetPalette(nb)
 
 ROOT.gStyle.SetNumberContours(255)
 
+def smoothKern(x,y,bandwidth,nout):
+    '''
+    Normal kernel smoothing as TGraphSmooth.SmoothKern(graph,'normal',bandwidth,nout),
+    of all the columns of y at once.
+    Returns the nout evenly spaced x from min(x) to max(x) and the smoothed y there.
+    '''
+    order = np.argsort(x,kind='mergesort')
+    x = np.asarray(x,dtype=np.float64)[order]
+    y = np.asarray(y,dtype=np.float64)[order]
+    xs = np.linspace(x[0],x[-1],nout)
+    # TGraphSmooth scales the bandwidth to the quartiles of the kernel and cuts it at 4 sigma
+    bw = 0.3706506*bandwidth
+    d = np.abs(x[np.newaxis,:]-xs[:,np.newaxis])
+    w = np.where(d<=4*bw,np.exp(-0.5*(d/bw)**2),0.)
+    den = w.sum(axis=1)
+    num = w.dot(y)
+    if y.ndim>1: den = den[:,np.newaxis]
+    return xs, np.where(den>0,num/np.where(den>0,den,1.),0.)
+
+def makeGraph(x,y):
+    '''A TGraph of the arrays x and y'''
+    if not len(x): return ROOT.TGraph()
+    return ROOT.TGraph(len(x),np.ascontiguousarray(x,dtype=np.float64),np.ascontiguousarray(y,dtype=np.float64))
+
 class LimitPlotter(PlotterBase):
     '''Basic limit plotter utilities'''
 
+    FITCONFIG = Model.FITCONFIG # settings of the smoothing fits
+
     def __init__(self,**kwargs):
         '''Initialize the plotter'''
         super(LimitPlotter, self).__init__('Limits',**kwargs)
         # initialize stuff
 
+    def _limitArray(self,xvals,limits):
+        '''
+        The limits as a (points x 6) array, in the order of the quantiles
+        (0.025, 0.16, 0.5, 0.84, 0.975, observed), and the mask of the complete points.
+        limits is either such an array or a dict of the limits by x.
+        '''
+        if isinstance(limits,np.ndarray):
+            values = np.asarray(limits,dtype=np.float64)
+        else:
+            values = np.array([[float(l) if l else 0. for l in (list(limits[x])+[0.]*6)[:6]] for x in xvals],dtype=np.float64)
+        valid = np.all(np.isfinite(values) & (values!=0),axis=1)
+        for i in np.nonzero(~valid)[0]:
+            logging.warning('Incomplete limits at {}: {}'.format(xvals[i],values[i]))
+        return values, valid
+
+    def _getBands(self,xvals,limits,**kwargs):
+        '''
+        The arrays of the limit bands.
+        Returns the x of the expected bands (moved to the smoothing grid where smoothed),
+        the x of the observed limit, the (points x 6) limits and the (points) scales,
+        for the complete points only.
+        '''
+        smooth = kwargs.pop('smooth',False)
+        scales = kwargs.pop('scales',None)
+        modelkey = kwargs.pop('modelkey',None)
+        y = kwargs.pop('y',None)
+
+        values, valid = self._limitArray(xvals,limits)
+        x = np.asarray(xvals,dtype=np.float64)[valid]
+        values = values[valid]
+        n = len(x)
+        xExp = x.copy()
+
+        smoothlog = False
+        if smooth and n>2: # smooth out the expected bands
+            expectedBands = values[:,:5]
+            # interior points only, the ends stay at the unsmoothed limits
+            replace = np.zeros(n,dtype=bool)
+            replace[1:-1] = True
+            # smooth log, good for exponentially changing
+            if smoothlog:
+                xs, smoothed = smoothKern(x,np.log(expectedBands),0.5,n)
+                smoothed = np.exp(smoothed)
+            # smooth linear
+            else:
+                xs, smoothed = smoothKern(x,expectedBands,1.3,n) # originally 0.3, increased to smooth out highmass
+                replace &= ~((xs>3) & (xs<4)) # jpsi
+                replace &= ~((xs>8.5) & (xs<11.5)) # upsilon
+            xExp[replace] = xs[replace]
+            values[replace,:5] = smoothed[replace]
+
+        scale = np.ones(n)
+        if scales is not None and modelkey:
+            scale = np.array([scales[xv][modelkey].Eval(y) for xv in x])
+            scale[scale<=0] = 1e-10
+        elif isinstance(scales,np.ndarray):
+            scale = scales[valid]
+
+        return xExp, x, values, scale
+
+    def _limitGrid(self,xvals,limits,xs,ys,**kwargs):
+        '''
+        The limits on the mesh of xs and ys, a (6 x len(ys) x len(xs)) array of the quantiles
+        (see _limitArray), each scaled by scales[x][modelkey] at y.
+        With loginterp the interpolation in x is linear in log(limit).
+        '''
+        smooth = kwargs.pop('smooth',False)
+        scales = kwargs.pop('scales',None)
+        modelkey = kwargs.pop('modelkey',None)
+        loginterp = kwargs.pop('loginterp',False)
+
+        xExp, x, values, scale = self._getBands(xvals,limits,smooth=smooth)
+        if scales and modelkey:
+            pointScales = scaleGrid(scales,modelkey,x,ys)
+        else:
+            pointScales = np.ones((len(ys),len(x)))
+        grid = np.empty((6,len(ys),len(xs)))
+        for q in range(6):
+            grid[q] = interpolate(x if q==5 else xExp,values[:,q][np.newaxis,:]*pointScales,xs,log=loginterp)
+        return grid
+
     def _getGraphs(self,xvals,limits,**kwargs):
+        '''
+        The expected, one and two sigma band and observed graphs of the limits.
+        limits is a dict of the limits by x or a (points x 6) array (see _limitArray).
+        scales either maps x to the {modelkey: graph} scale as a function of y, or
+        is an array of the scale at each point. Incomplete points are left out.
+        With detailed, the unscaled band edges are also returned.
+        '''
         xVar = kwargs.pop('xVar',None)
         smooth = kwargs.pop('smooth',False)
         model = kwargs.pop('model',None)
@@ -57,151 +176,35 @@ class LimitPlotter(PlotterBase):
         y = kwargs.pop('y',None)
         detailed = kwargs.pop('detailed',False)
 
-        n = len(xvals)
-        twoSigma = ROOT.TGraph(2*n)
-        oneSigma = ROOT.TGraph(2*n)
-        expected = ROOT.TGraph(n)
-        observed = ROOT.TGraph(n)
-        twoSigma_low = ROOT.TGraph(n)
-        twoSigma_high = ROOT.TGraph(n)
-        oneSigma_low = ROOT.TGraph(n)
-        oneSigma_high = ROOT.TGraph(n)
-        twoSigmaForSmoothing_low = ROOT.TGraph(n)
-        twoSigmaForSmoothing_high = ROOT.TGraph(n)
-        oneSigmaForSmoothing_low = ROOT.TGraph(n)
-        oneSigmaForSmoothing_high = ROOT.TGraph(n)
-        expectedForSmoothing = ROOT.TGraph(n)
-
-        if xVar:
-            w = ROOT.RooRealVar('w','w',0,10000)
-            twoSigmaDS_low  = ROOT.RooDataSet('twoSigmaLow', 'twoSigmaLow', ROOT.RooArgSet(xVar,w),w.GetName())
-            twoSigmaDS_high = ROOT.RooDataSet('twoSigmaHigh','twoSigmaHigh',ROOT.RooArgSet(xVar,w),w.GetName())
-            oneSigmaDS_low  = ROOT.RooDataSet('oneSigmaLow', 'oneSigmaLow', ROOT.RooArgSet(xVar,w),w.GetName())
-            oneSigmaDS_high = ROOT.RooDataSet('oneSigmaHigh','oneSigmaHigh',ROOT.RooArgSet(xVar,w),w.GetName())
-            expectedDS      = ROOT.RooDataSet('expected',    'expected',    ROOT.RooArgSet(xVar,w),w.GetName())
-
-        for i in range(len(xvals)):
-            if not all(limits[xvals[i]]):
-                print i, xvals[i], limits[xvals[i]]
-                continue
-            twoSigma.SetPoint(     i,   xvals[i],     limits[xvals[i]][0]) # 0.025
-            oneSigma.SetPoint(     i,   xvals[i],     limits[xvals[i]][1]) # 0.16
-            expected.SetPoint(     i,   xvals[i],     limits[xvals[i]][2]) # 0.5
-            oneSigma.SetPoint(2*n-i-1,  xvals[i],     limits[xvals[i]][3]) # 0.84
-            twoSigma.SetPoint(2*n-i-1,  xvals[i],     limits[xvals[i]][4]) # 0.975
-            observed.SetPoint(     i,   xvals[i],     limits[xvals[i]][5]) # obs
-            twoSigma_high.SetPoint(i,   xvals[i],     limits[xvals[i]][0]) # 0.025
-            oneSigma_high.SetPoint(i,   xvals[i],     limits[xvals[i]][1]) # 0.16
-            oneSigma_low.SetPoint(n-i-1,xvals[i],     limits[xvals[i]][3]) # 0.84
-            twoSigma_low.SetPoint(n-i-1,xvals[i],     limits[xvals[i]][4]) # 0.975
-            twoSigmaForSmoothing_high.SetPoint(i, xvals[i],     math.log(limits[xvals[i]][0])) # 0.025
-            oneSigmaForSmoothing_high.SetPoint(i, xvals[i],     math.log(limits[xvals[i]][1])) # 0.16
-            oneSigmaForSmoothing_low.SetPoint(n-i-1, xvals[i],  math.log(limits[xvals[i]][3])) # 0.84
-            twoSigmaForSmoothing_low.SetPoint(n-i-1, xvals[i],  math.log(limits[xvals[i]][4])) # 0.975
-            expectedForSmoothing.SetPoint(     i, xvals[i],     math.log(limits[xvals[i]][2])) # 0.5
-            if xVar:
-                xVar.setVal(xvals[i])
-                w.setVal(limits[xvals[i]][0])
-                twoSigmaDS_high.add(ROOT.RooArgSet(xVar,w))
-                w.setVal(limits[xvals[i]][1])
-                oneSigmaDS_high.add(ROOT.RooArgSet(xVar,w))
-                w.setVal(limits[xvals[i]][2])
-                expectedDS.add(ROOT.RooArgSet(xVar,w))
-                w.setVal(limits[xvals[i]][3])
-                oneSigmaDS_low.add(ROOT.RooArgSet(xVar,w))
-                w.setVal(limits[xvals[i]][4])
-                twoSigmaDS_low.add(ROOT.RooArgSet(xVar,w))
-
-        
-        def fit(savename,ds):
-            model.fitTo(ds,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True))
-            xFrame = xVar.frame()
-            ds.plotOn(xFrame)
-            model.plotOn(xFrame)
-            canvas = ROOT.TCanvas(savename,savename,800,800)
-            xFrame.Draw()
-            canvas.Print('{0}.png'.format(savename))
-            
         if model and xVar:
             # smooth to a pdf
-            fit('twoSigma_low', twoSigmaDS_low)
-            fit('oneSigma_low', oneSigmaDS_low)
-            fit('expected',     expectedDS)
-            fit('oneSigma_high',oneSigmaDS_high)
-            fit('twoSigma_high',twoSigmaDS_high)
-
+            values, valid = self._limitArray(xvals,limits)
+            w = ROOT.RooRealVar('w','w',0,10000)
+            datasets = []
+            for name in ['twoSigma_high','oneSigma_high','expected','oneSigma_low','twoSigma_low']:
+                datasets += [ROOT.RooDataSet(name,name,ROOT.RooArgSet(xVar,w),w.GetName())]
+            for xv, vals in zip(np.asarray(xvals)[valid],values[valid]):
+                xVar.setVal(xv)
+                for ds, val in zip(datasets,vals):
+                    w.setVal(val)
+                    ds.add(ROOT.RooArgSet(xVar,w))
+            for ds in datasets:
+                self.FITCONFIG.fitTo(model,ds,ROOT.RooFit.Save(),ROOT.RooFit.SumW2Error(True))
+                xFrame = xVar.frame()
+                ds.plotOn(xFrame)
+                model.plotOn(xFrame)
+                canvas = ROOT.TCanvas(ds.GetName(),ds.GetName(),800,800)
+                xFrame.Draw()
+                canvas.Print('{0}.png'.format(ds.GetName()))
+
+        xExp, x, values, scale = self._getBands(xvals,limits,smooth=smooth,scales=scales,modelkey=modelkey,y=y)
+        scaled = values*scale[:,np.newaxis]
+
+        twoSigma = makeGraph(np.concatenate([xExp,xExp[::-1]]),np.concatenate([scaled[:,0],scaled[::-1,4]])) # 0.025, 0.975
+        oneSigma = makeGraph(np.concatenate([xExp,xExp[::-1]]),np.concatenate([scaled[:,1],scaled[::-1,3]])) # 0.16, 0.84
+        expected = makeGraph(xExp,scaled[:,2]) # 0.5
+        observed = makeGraph(x,scaled[:,5]) # obs
 
-        smoothlog = False
-        if smooth: # smooth out the expected bands
-
-            # smooth via function
-            twoSigmaSmoother_low  = ROOT.TGraphSmooth()
-            twoSigmaSmoother_high = ROOT.TGraphSmooth()
-            oneSigmaSmoother_low  = ROOT.TGraphSmooth()
-            oneSigmaSmoother_high = ROOT.TGraphSmooth()
-            expectedSmoother      = ROOT.TGraphSmooth()
-            # smooth log, good for exponentially changing
-            if smoothlog:
-                twoSigmaSmooth_low    = twoSigmaSmoother_low.SmoothKern( twoSigmaForSmoothing_low, 'normal',0.5,n)
-                twoSigmaSmooth_high   = twoSigmaSmoother_high.SmoothKern(twoSigmaForSmoothing_high,'normal',0.5,n)
-                oneSigmaSmooth_low    = oneSigmaSmoother_low.SmoothKern( oneSigmaForSmoothing_low, 'normal',0.5,n)
-                oneSigmaSmooth_high   = oneSigmaSmoother_high.SmoothKern(oneSigmaForSmoothing_high,'normal',0.5,n)
-                expectedSmooth        = expectedSmoother.SmoothKern(     expectedForSmoothing,     'normal',0.5,n)
-                for i in range(n-2):
-                    twoSigma_high.SetPoint(i+1,   twoSigmaSmooth_high.GetX()[i+1],    math.exp(twoSigmaSmooth_high.GetY()[i+1]))
-                    twoSigma_low.SetPoint( i+1,   twoSigmaSmooth_low.GetX()[i+1],     math.exp(twoSigmaSmooth_low.GetY()[i+1]))
-                    oneSigma_high.SetPoint(i+1,   oneSigmaSmooth_high.GetX()[i+1],    math.exp(oneSigmaSmooth_high.GetY()[i+1]))
-                    oneSigma_low.SetPoint( i+1,   oneSigmaSmooth_low.GetX()[i+1],     math.exp(oneSigmaSmooth_low.GetY()[i+1]))
-                    expected.SetPoint(     i+1,   expectedSmooth.GetX()[i+1],         math.exp(expectedSmooth.GetY()[i+1]))
-            # smooth linear
-            else:
-                twoSigmaSmooth_low    = twoSigmaSmoother_low.SmoothKern( twoSigma_low, 'normal',1.3,n) # originally 0.3, increased to smooth out highmass
-                twoSigmaSmooth_high   = twoSigmaSmoother_high.SmoothKern(twoSigma_high,'normal',1.3,n)
-                oneSigmaSmooth_low    = oneSigmaSmoother_low.SmoothKern( oneSigma_low, 'normal',1.3,n)
-                oneSigmaSmooth_high   = oneSigmaSmoother_high.SmoothKern(oneSigma_high,'normal',1.3,n)
-                expectedSmooth        = expectedSmoother.SmoothKern(     expected,     'normal',1.3,n)
-                #twoSigmaSmooth_low    = twoSigmaSmoother_low.SmoothLowess(twoSigma_low,  '',0.1)
-                #twoSigmaSmooth_high   = twoSigmaSmoother_high.SmoothLowess(twoSigma_high,'',0.1)
-                #oneSigmaSmooth_low    = oneSigmaSmoother_low.SmoothLowess(oneSigma_low,  '',0.1)
-                #oneSigmaSmooth_high   = oneSigmaSmoother_high.SmoothLowess(oneSigma_high,'',0.1)
-                #expectedSmooth        = expectedSmoother.SmoothLowess(expected,          '',0.1)
-                #twoSigmaSmooth_low    = twoSigmaSmoother_low.SmoothSuper(twoSigma_low,  '',0,0)
-                #twoSigmaSmooth_high   = twoSigmaSmoother_high.SmoothSuper(twoSigma_high,'',0,0)
-                #oneSigmaSmooth_low    = oneSigmaSmoother_low.SmoothSuper(oneSigma_low,  '',0,0)
-                #oneSigmaSmooth_high   = oneSigmaSmoother_high.SmoothSuper(oneSigma_high,'',0,0)
-                #expectedSmooth        = expectedSmoother.SmoothSuper(expected,          '',0,0)
-                for i in range(n-2):
-                    x = twoSigmaSmooth_high.GetX()[i+1]
-                    if x>3 and x<4: continue # jpsi
-                    if x>8.5 and x<11.5: continue # upsilon
-                    twoSigma_high.SetPoint(i+1,   twoSigmaSmooth_high.GetX()[i+1],    twoSigmaSmooth_high.GetY()[i+1])
-                    twoSigma_low.SetPoint( i+1,   twoSigmaSmooth_low.GetX()[i+1],     twoSigmaSmooth_low.GetY()[i+1])
-                    oneSigma_high.SetPoint(i+1,   oneSigmaSmooth_high.GetX()[i+1],    oneSigmaSmooth_high.GetY()[i+1])
-                    oneSigma_low.SetPoint( i+1,   oneSigmaSmooth_low.GetX()[i+1],     oneSigmaSmooth_low.GetY()[i+1])
-                    expected.SetPoint(     i+1,   expectedSmooth.GetX()[i+1],         expectedSmooth.GetY()[i+1])
-
-            for i in range(n-2):
-                twoSigma.SetPoint(     i+1,   twoSigma_high.GetX()[i+1],    twoSigma_high.GetY()[i+1])
-                twoSigma.SetPoint(     n+i+1, twoSigma_low.GetX()[n-1-i-1], twoSigma_low.GetY()[n-1-i-1])
-                oneSigma.SetPoint(     i+1,   oneSigma_high.GetX()[i+1],    oneSigma_high.GetY()[i+1])
-                oneSigma.SetPoint(     n+i+1, oneSigma_low.GetX()[n-1-i-1], oneSigma_low.GetY()[n-1-i-1])
-
-        # now scale
-        for i in range(len(xvals)):
-            if not all(limits[xvals[i]]):
-                print i, xvals[i], limits[xvals[i]]
-                continue
-            scale = 1
-            if scales and modelkey:
-                scale = scales[xvals[i]][modelkey].Eval(y)
-                if scale<=0: scale = 1e-10
-            twoSigma.SetPoint(     i,   twoSigma.GetX()[i],    twoSigma.GetY()[i]*scale) # 0.025
-            oneSigma.SetPoint(     i,   oneSigma.GetX()[i],    oneSigma.GetY()[i]*scale) # 0.16
-            expected.SetPoint(     i,   expected.GetX()[i],    expected.GetY()[i]*scale) # 0.5
-            oneSigma.SetPoint(2*n-i-1,  oneSigma.GetX()[2*n-i-1],    oneSigma.GetY()[2*n-i-1]*scale) # 0.84
-            twoSigma.SetPoint(2*n-i-1,  twoSigma.GetX()[2*n-i-1],    twoSigma.GetY()[2*n-i-1]*scale) # 0.975
-            observed.SetPoint(     i,   observed.GetX()[i],    observed.GetY()[i]*scale) # obs
-        
         twoSigma.SetFillColor(ROOT.kOrange)
         twoSigma.SetLineColor(ROOT.kOrange)
         twoSigma.SetMarkerStyle(0)
@@ -216,6 +219,10 @@ class LimitPlotter(PlotterBase):
         observed.SetFillStyle(0)
 
         if detailed:
+            twoSigma_high = makeGraph(xExp,values[:,0])            # 0.025
+            oneSigma_high = makeGraph(xExp,values[:,1])            # 0.16
+            oneSigma_low  = makeGraph(xExp[::-1],values[::-1,3])   # 0.84
+            twoSigma_low  = makeGraph(xExp[::-1],values[::-1,4])   # 0.975
             return expected, oneSigma, twoSigma, observed, oneSigma_low, oneSigma_high, twoSigma_low, twoSigma_high
         return expected, oneSigma, twoSigma, observed
 
@@ -318,6 +325,11 @@ class LimitPlotter(PlotterBase):
 
         self._save(canvas,savename)
 
+    def plotLimitFromTable(self,table,mode,h,savename,**kwargs):
+        '''Plot the limits of (mode, h) from a LimitTable directory (see collectLimits.py)'''
+        xvals, quartiles = LimitTable(table).quartiles(mode,h)
+        self.plotLimit(xvals,quartiles,savename,**kwargs)
+
     def plotLimit2DProjection(self,xvals,yval,quartiles,scales,savename,**kwargs):
         '''Plot limits'''
         xaxis = kwargs.pop('xaxis','x')
@@ -857,6 +869,7 @@ class LimitPlotter(PlotterBase):
         plotcolz = kwargs.pop('plotcolz',True)
         plotfill = kwargs.pop('plotfill',False)
         additionaltext = kwargs.pop('additionaltext','')
+        loginterp = kwargs.pop('loginterp',False)
 
         logging.info('Plotting {0}'.format(savename))
 
@@ -889,68 +902,20 @@ class LimitPlotter(PlotterBase):
         limits = quartiles
 
 
-        expected_vals = []
-        oneSigma_low_vals = []
-        oneSigma_high_vals = []
-        twoSigma_low_vals = []
-        twoSigma_high_vals = []
-
-
-        for yi in range(ny+1):
-            y = ymin + yi*dy
-            expected, oneSigma, twoSigma, observed, oneSigma_low, oneSigma_high, twoSigma_low, twoSigma_high = self._getGraphs(xvals,limits,xVar=xVar,smooth=smooth,model=model,scales=scales,modelkey=modelkey,y=y,detailed=True)
-
-
-            def cross(val,prev,curr):
-                if prev>=val and curr<=val: return True
-                if prev<=val and curr>=val: return True
-                return False
-
-            #expected_prev = 0
-            #oneSigma_low_prev = 0
-            #oneSigma_high_prev = 0
-            #twoSigma_low_prev = 0
-            #twoSigma_high_prev = 0
-            for xi in range(nx+1):
-                x = xmin + xi*dx
-                val = expected.Eval(x)
-                if val<zmin: val = zmin
-                eb = expectedHist.GetBin(xi+1,yi+1)
-                #eb = expectedHist.FindBin(x,y)
-                expectedHist.SetBinContent(eb,val)
-
-                oneSigmaLowHist.SetBinContent( eb, oneSigma_low.Eval(x))
-                oneSigmaHighHist.SetBinContent(eb, oneSigma_high.Eval(x))
-                twoSigmaLowHist.SetBinContent( eb, twoSigma_low.Eval(x))
-                twoSigmaHighHist.SetBinContent(eb, twoSigma_high.Eval(x))
-
-                oval = observed.Eval(x)
-                # TODO: try
-                if oval<zmin: oval = 0
-                if oval>zmax: oval = 999*zmax
-                observedHist.SetBinContent(eb, oval)
-
-                #expected_curr      = expected.Eval(x)
-                #oneSigma_low_curr  = oneSigma_low.Eval(x)
-                #oneSigma_high_curr = oneSigma_high.Eval(x)
-                #twoSigma_low_curr  = twoSigma_low.Eval(x)
-                #twoSigma_high_curr = twoSigma_high.Eval(x)
-
-                #if xi:
-                #    if cross(1,expected_prev,     expected_curr)     : expected_vals      += [(x,y)]
-                #    if cross(1,oneSigma_low_prev, oneSigma_low_curr) : oneSigma_low_vals  += [(x,y)]
-                #    if cross(1,oneSigma_high_prev,oneSigma_high_curr): oneSigma_high_vals += [(x,y)]
-                #    if cross(1,twoSigma_low_prev, twoSigma_low_curr) : twoSigma_low_vals  += [(x,y)]
-                #    if cross(1,twoSigma_high_prev,twoSigma_high_curr): twoSigma_high_vals += [(x,y)]
-
-                #expected_prev      = expected_curr
-                #oneSigma_low_prev  = oneSigma_low_curr
-                #oneSigma_high_prev = oneSigma_high_curr
-                #twoSigma_low_prev  = twoSigma_low_curr
-                #twoSigma_high_prev = twoSigma_high_curr
+        xs = xmin + dx*np.arange(nx+1)
+        ys = ymin + dy*np.arange(ny+1)
+        if model and xVar: self._getGraphs(xvals,limits,xVar=xVar,model=model) # the smoothing model fits
+        grid = self._limitGrid(xvals,limits,xs,ys,smooth=smooth,scales=scales,modelkey=modelkey,loginterp=loginterp)
 
-        expectedHistCont = expectedHist.Clone()
-        observedHistCont = observedHist.Clone()
+        expectedGrid = np.maximum(grid[2],zmin)
+        # TODO: try
+        observedGrid = np.where(grid[5]<zmin,0.,np.where(grid[5]>zmax,999*zmax,grid[5]))
+        fillHist(expectedHist,expectedGrid)
+        fillHist(oneSigmaLowHist,grid[3])  # 0.84
+        fillHist(oneSigmaHighHist,grid[1]) # 0.16
+        fillHist(twoSigmaLowHist,grid[4])  # 0.975
+        fillHist(twoSigmaHighHist,grid[0]) # 0.025
+        fillHist(observedHist,observedGrid)
 
 
         def setHistStyle(hist):
@@ -967,32 +932,20 @@ class LimitPlotter(PlotterBase):
         setHistStyle(observedHist)
         setHistStyle(emptyHist)
 
-        def get_contours(hist,val=1.0):
-            contours = array('d',[val])
-            hist.SetContour(1,contours)
-            hist.Draw('cont z list')
-            canvas.Update()
-            graphs = []
-            conts = ROOT.gROOT.GetListOfSpecials().FindObject('contours')
-            i = 0 # why is this needed?!?!?
-            if i in range(conts.GetSize()):
-                contLevel = conts.At(i)
-                for j in range(contLevel.GetSize()):
-                    graphs += [contLevel.At(j).Clone()]
-                    
-            return graphs
+        def get_contours(grid,val=1.0):
+            return [makeGraph(lx,ly) for lx, ly in contourLines(grid,xs,ys,val)]
 
         expected_graphs = {}
         oneSigma_graphs = {}
         twoSigma_graphs = {}
         observed_graphs = {}
         for eb in expectedBands:
-            expected_graphs[eb] =  get_contours(expectedHistCont,eb)
-            observed_graphs[eb] =  get_contours(observedHistCont,eb)
-            oneSigma_graphs[eb] =  get_contours(oneSigmaLowHist, eb)
-            oneSigma_graphs[eb] += get_contours(oneSigmaHighHist,eb)
-            twoSigma_graphs[eb] =  get_contours(twoSigmaLowHist, eb)
-            twoSigma_graphs[eb] += get_contours(twoSigmaHighHist,eb)
+            expected_graphs[eb] =  get_contours(expectedGrid,eb)
+            observed_graphs[eb] =  get_contours(observedGrid,eb)
+            oneSigma_graphs[eb] =  get_contours(grid[3],eb)
+            oneSigma_graphs[eb] += get_contours(grid[1],eb)
+            twoSigma_graphs[eb] =  get_contours(grid[4],eb)
+            twoSigma_graphs[eb] += get_contours(grid[0],eb)
 
         #print len(expected_graphs), len(oneSigma_graphs), len(twoSigma_graphs)
 
@@ -1244,6 +1197,7 @@ class LimitPlotter(PlotterBase):
         plotcolz = kwargs.pop('plotcolz',True)
         plotfill = kwargs.pop('plotfill',False)
         additionaltext = kwargs.pop('additionaltext','')
+        loginterp = kwargs.pop('loginterp',False)
 
         logging.info('Plotting {0}'.format(savename))
 
@@ -1273,60 +1227,28 @@ class LimitPlotter(PlotterBase):
         twoSigmaLowHist  = ROOT.TH2D('twol','twol',nx+1,xmin-0.5*dx,xmax+0.5*dx,ny+1,ymin-0.5*dy,ymax+0.5*dy)
         twoSigmaHighHist = ROOT.TH2D('twoh','twoh',nx+1,xmin-0.5*dx,xmax+0.5*dx,ny+1,ymin-0.5*dy,ymax+0.5*dy)
 
-        expected_vals = []
-        oneSigma_low_vals = []
-        oneSigma_high_vals = []
-        twoSigma_low_vals = []
-        twoSigma_high_vals = []
-
-        expected = {}
-        oneSigma = {}
-        twoSigma = {}
-        observed = {}
-        oneSigma_low = {}
-        oneSigma_high = {}
-        twoSigma_low = {}
-        twoSigma_high = {}
-
-
-        for yi in range(ny+1):
-            y = ymin + yi*dy
-
-            for ilim, (xvals, quartiles, scales) in enumerate(zip(xvalsMulti, quartilesMulti, scalesMulti)):
-
-                limits = quartiles
-                expected[ilim], oneSigma[ilim], twoSigma[ilim], observed[ilim], oneSigma_low[ilim], oneSigma_high[ilim], twoSigma_low[ilim], twoSigma_high[ilim] = self._getGraphs(xvals,limits,xVar=xVar,smooth=smooth,model=model,scales=scales,modelkey=modelkey,y=y,detailed=True)
-
-
-                def cross(val,prev,curr):
-                    if prev>=val and curr<=val: return True
-                    if prev<=val and curr>=val: return True
-                    return False
-
-            for xi in range(nx+1):
-                x = xmin + xi*dx
-                for ilim, xvals in enumerate(xvalsMulti):
-                    if x>=xvals[0] and x<=xvals[-1]: break
-                val = expected[ilim].Eval(x)
-                if val<zmin: val = zmin
-                eb = expectedHist.GetBin(xi+1,yi+1)
-                #eb = expectedHist.FindBin(x,y)
-                expectedHist.SetBinContent(eb,val)
-
-                oneSigmaLowHist.SetBinContent( eb, oneSigma_low[ilim].Eval(x))
-                oneSigmaHighHist.SetBinContent(eb, oneSigma_high[ilim].Eval(x))
-                twoSigmaLowHist.SetBinContent( eb, twoSigma_low[ilim].Eval(x))
-                twoSigmaHighHist.SetBinContent(eb, twoSigma_high[ilim].Eval(x))
-
-                oval = observed[ilim].Eval(x)
-                # TODO: try
-                if oval<zmin: oval = 0
-                if oval>zmax: oval = 999*zmax
-                observedHist.SetBinContent(eb, oval)
-
-
-        expectedHistCont = expectedHist.Clone()
-        observedHistCont = observedHist.Clone()
+        xs = xmin + dx*np.arange(nx+1)
+        ys = ymin + dy*np.arange(ny+1)
+        # each x is taken from the first set of limits covering it, the last if none does
+        owner = np.full(len(xs),len(xvalsMulti)-1,dtype=int)
+        for ilim in reversed(range(len(xvalsMulti))):
+            owner[(xs>=xvalsMulti[ilim][0]) & (xs<=xvalsMulti[ilim][-1])] = ilim
+        grid = np.zeros((6,len(ys),len(xs)))
+        for ilim, (xvals, quartiles, scales) in enumerate(zip(xvalsMulti, quartilesMulti, scalesMulti)):
+            if not np.any(owner==ilim): continue
+            if model and xVar: self._getGraphs(xvals,quartiles,xVar=xVar,model=model) # the smoothing model fits
+            thisGrid = self._limitGrid(xvals,quartiles,xs[owner==ilim],ys,smooth=smooth,scales=scales,modelkey=modelkey,loginterp=loginterp)
+            grid[:,:,owner==ilim] = thisGrid
+
+        expectedGrid = np.maximum(grid[2],zmin)
+        # TODO: try
+        observedGrid = np.where(grid[5]<zmin,0.,np.where(grid[5]>zmax,999*zmax,grid[5]))
+        fillHist(expectedHist,expectedGrid)
+        fillHist(oneSigmaLowHist,grid[3])  # 0.84
+        fillHist(oneSigmaHighHist,grid[1]) # 0.16
+        fillHist(twoSigmaLowHist,grid[4])  # 0.975
+        fillHist(twoSigmaHighHist,grid[0]) # 0.025
+        fillHist(observedHist,observedGrid)
 
 
         def setHistStyle(hist):
@@ -1343,32 +1265,20 @@ class LimitPlotter(PlotterBase):
         setHistStyle(observedHist)
         setHistStyle(emptyHist)
 
-        def get_contours(hist,val=1.0):
-            contours = array('d',[val])
-            hist.SetContour(1,contours)
-            hist.Draw('cont z list')
-            canvas.Update()
-            graphs = []
-            conts = ROOT.gROOT.GetListOfSpecials().FindObject('contours')
-            i = 0 # why is this needed?!?!?
-            if i in range(conts.GetSize()):
-                contLevel = conts.At(i)
-                for j in range(contLevel.GetSize()):
-                    graphs += [contLevel.At(j).Clone()]
-                    
-            return graphs
+        def get_contours(grid,val=1.0):
+            return [makeGraph(lx,ly) for lx, ly in contourLines(grid,xs,ys,val)]
 
         expected_graphs = {}
         oneSigma_graphs = {}
         twoSigma_graphs = {}
         observed_graphs = {}
         for eb in expectedBands:
-            expected_graphs[eb] =  get_contours(expectedHistCont,eb)
-            observed_graphs[eb] =  get_contours(observedHistCont,eb)
-            oneSigma_graphs[eb] =  get_contours(oneSigmaLowHist, eb)
-            oneSigma_graphs[eb] += get_contours(oneSigmaHighHist,eb)
-            twoSigma_graphs[eb] =  get_contours(twoSigmaLowHist, eb)
-            twoSigma_graphs[eb] += get_contours(twoSigmaHighHist,eb)
+            expected_graphs[eb] =  get_contours(expectedGrid,eb)
+            observed_graphs[eb] =  get_contours(observedGrid,eb)
+            oneSigma_graphs[eb] =  get_contours(grid[3],eb)
+            oneSigma_graphs[eb] += get_contours(grid[1],eb)
+            twoSigma_graphs[eb] =  get_contours(grid[4],eb)
+            twoSigma_graphs[eb] += get_contours(grid[0],eb)
 
         #print len(expected_graphs), len(oneSigma_graphs), len(twoSigma_graphs)
 
@@ -9,6 +9,7 @@ import tempfile
 import ROOT
 
 from CombineLimits.Utilities.utilities import python_mkdir, getLumi
+from CombineLimits.Limits.PlotQueue import RenderPool
 import CombineLimits.Plotter.CMS_lumi as CMS_lumi
 import CombineLimits.Plotter.tdrstyle as tdrstyle
 
@@ -17,9 +18,51 @@ ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 tdrstyle.setTDRStyle()
 ROOT.gStyle.SetPalette(1)
 
+def renderInBackground(directory,nworkers=2,formats=None):
+    '''
+    Print the canvases saved by all plotters in nworkers background processes,
+    with the canvases queued in directory, and optionally change the formats.
+    Call waitForRendering (or let the program exit) to wait for them.
+    '''
+    if formats is not None: PlotterBase.FORMATS = formats
+    PlotterBase.RENDERPOOL = RenderPool(directory,nworkers)
+
+def waitForRendering():
+    '''Wait for the background printing to finish, see renderInBackground.'''
+    if PlotterBase.RENDERPOOL is None: return
+    PlotterBase.RENDERPOOL.wait()
+    PlotterBase.RENDERPOOL = None
+
+def printCanvas(canvas,savename,formats=None):
+    '''
+    Print canvas to savename.<format> for each of formats (by default PlotterBase.FORMATS),
+    in the background if renderInBackground was called.
+    '''
+    names = ['{}.{}'.format(savename,ext) for ext in formats or PlotterBase.FORMATS]
+    if PlotterBase.RENDERPOOL is not None:
+        PlotterBase.RENDERPOOL.add(canvas,names)
+        return
+    for name in names:
+        if os.path.dirname(name): python_mkdir(os.path.dirname(name))
+        canvas.Print(name)
+
+def addRenderArguments(parser,formats=None):
+    '''Add the --formats, --renderWorkers and --renderDirectory options, see startRendering.'''
+    parser.add_argument('--formats', type=str, nargs='+', default=formats, help='Formats to print the plots in')
+    parser.add_argument('--renderWorkers', type=int, default=2, help='Number of background processes printing the plots, 0 to print them directly')
+    parser.add_argument('--renderDirectory', type=str, default='renderQueue', help='Directory of the canvases waiting to be printed')
+
+def startRendering(args):
+    '''Set the formats and start the background printing with the options of addRenderArguments.'''
+    if args.formats: PlotterBase.FORMATS = args.formats
+    if args.renderWorkers>0: renderInBackground(args.renderDirectory,args.renderWorkers)
+
 class PlotterBase(object):
     '''Basic plotter utilities'''
 
+    FORMATS = ['pdf','root','png'] # formats _save prints the canvases in
+    RENDERPOOL = None # RenderPool printing the canvases in the background, see renderInBackground
+
     def __init__(self,analysis,**kwargs):
         '''Initialize the plotter'''
         # plot directory
@@ -27,6 +70,7 @@ class PlotterBase(object):
         self.outputDirectory = kwargs.pop('outputDirectory','plots/{0}'.format(self.analysis))
         self.outputDirectoryCSV = kwargs.pop('outputDirectoryCSV','csvFiles/{0}'.format(self.analysis))
         self.intLumi = kwargs.get('intLumi',float(getLumi()))
+        self.formats = kwargs.pop('formats',None) # None for FORMATS
         # initialize stuff
 
     def _getLegend(self,**kwargs):
@@ -105,9 +149,15 @@ class PlotterBase(object):
         '''Save the canvas in multiple formats.'''
         logging.debug('Saving {0}'.format(savename))
         canvas.SetName(savename)
-        for type in ['pdf','root','png']:
+        names = []
+        for type in self.formats or self.FORMATS:
             name = '{0}/{1}/{2}.{1}'.format(self.outputDirectory, type, savename)
             python_mkdir(os.path.dirname(name))
+            names += [name]
+        if self.RENDERPOOL is not None:
+            self.RENDERPOOL.add(canvas,names)
+            return
+        for name in names:
             logging.debug('Writing {0}'.format(name))
             canvas.Print(name)
 
@@ -15,8 +15,14 @@ import CombineLimits.Limits.Models as Models
 from CombineLimits.Limits.Limits import Limits
 from CombineLimits.Limits.utilities import *
 from CombineLimits.Plotter.LimitPlotter import *
+from CombineLimits.Plotter.PlotterBase import addRenderArguments, startRendering, waitForRendering
 from HaaLimits import HaaLimits
 
+parser = argparse.ArgumentParser(description='Plot the limits')
+addRenderArguments(parser)
+args = parser.parse_args()
+startRendering(args)
+
 Ma_list = []
 quantiles = {}
 for filename in os.listdir('/afs/cern.ch/work/k/ktos/public/Plotting/CMSSW_8_1_0/src/CombineLimits/HaaLimits/python/rValueFiles/'):
@@ -42,3 +48,4 @@ Ma_list = sorted(Ma_list)
 #  print k, v
 myplot = LimitPlotter()
 myplot.plotLimit(xvals=Ma_list, quartiles=quantiles, savename="H125_MeanSigFracConst_BTag_50MeV_Overlap6p5to14_Calc7p8to12p3", xaxis="M(mu mu)")
+waitForRendering()
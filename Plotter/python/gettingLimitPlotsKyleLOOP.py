@@ -15,8 +15,14 @@ import CombineLimits.Limits.Models as Models
 from CombineLimits.Limits.Limits import Limits
 from CombineLimits.Limits.utilities import *
 from CombineLimits.Plotter.LimitPlotter import *
+from CombineLimits.Plotter.PlotterBase import addRenderArguments, startRendering, waitForRendering
 from CombineLimits.HaaLimits.HaaLimits import HaaLimits
 
+parser = argparse.ArgumentParser(description='Plot the limits')
+addRenderArguments(parser)
+args = parser.parse_args()
+startRendering(args)
+
 Ma_list = []
 quantiles = {}
 filesToDelete = []
@@ -60,3 +66,4 @@ Ma_list = sorted(Ma_list)
 #  print k, v
 myplot = LimitPlotter()
 myplot.plotLimit(xvals=Ma_list, quartiles=quantiles, savename="h125_100MeV_DIRNAME", xaxis="M(mu mu)", smooth=True)
+waitForRendering()
@@ -1,15 +1,22 @@
 import ROOT
-
+ROOT.PyConfig.IgnoreCommandLineOptions = True
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
 
 
 import DevTools.Plotter.CMS_lumi as CMS_lumi
 import DevTools.Plotter.tdrstyle as tdrstyle
+import argparse
+from CombineLimits.Plotter.PlotterBase import addRenderArguments, startRendering, waitForRendering, printCanvas
 
 ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 tdrstyle.setTDRStyle()
 
 
+parser = argparse.ArgumentParser(description='Plot the fitDiagnostics postfit distributions')
+addRenderArguments(parser,formats=['png','pdf'])
+args = parser.parse_args()
+startRendering(args)
+
 isprelim = False
 br = 0.0005
 doUnc = False
@@ -395,8 +402,7 @@ def plot(h,a,multi=False):
 
             #canvas.Print('rooplot_haa_{}_{}_{}_{}.png'.format(ds.GetName(),x.GetName(),h,a))
             #canvas.Print('rooplot_haa_{}_{}_{}_{}.pdf'.format(ds.GetName(),x.GetName(),h,a))
-            canvas.Print('doubleExpo_rooplot_haa_{}_{}_{}_{}.png'.format(ds.GetName(),x.GetName(),h,a))
-            canvas.Print('doubleExpo_rooplot_haa_{}_{}_{}_{}.pdf'.format(ds.GetName(),x.GetName(),h,a))
+            printCanvas(canvas,'doubleExpo_rooplot_haa_{}_{}_{}_{}'.format(ds.GetName(),x.GetName(),h,a))
 
             x = obsiter.Next()
             
@@ -408,3 +414,5 @@ for h in [125,300,750]:
             plot(h,a,multi=True)
         except:
             print 'Error on MH={} MA={}'.format(h,a)
+
+waitForRendering()
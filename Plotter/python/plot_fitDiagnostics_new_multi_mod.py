@@ -1,15 +1,22 @@
 import ROOT
-
+ROOT.PyConfig.IgnoreCommandLineOptions = True
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
 
 
 import DevTools.Plotter.CMS_lumi as CMS_lumi
 import DevTools.Plotter.tdrstyle as tdrstyle
+import argparse
+from CombineLimits.Plotter.PlotterBase import addRenderArguments, startRendering, waitForRendering, printCanvas
 
 ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 tdrstyle.setTDRStyle()
 
 
+parser = argparse.ArgumentParser(description='Plot the fitDiagnostics postfit distributions')
+addRenderArguments(parser,formats=['png','pdf'])
+args = parser.parse_args()
+startRendering(args)
+
 isprelim = False
 br = 0.0005
 doUnc = False
@@ -446,11 +453,12 @@ def plot(h,a):
         legend.Draw()
 
 
-        canvas.Print('new_mod_rooplot_haa_{}_{}_{}_{}.png'.format(dsName,xName,h,a))
-        canvas.Print('new_mod_rooplot_haa_{}_{}_{}_{}.pdf'.format(dsName,xName,h,a))
+        printCanvas(canvas,'new_mod_rooplot_haa_{}_{}_{}_{}'.format(dsName,xName,h,a))
 
             
 
 for h in [125]:
     for a in [7]:
         plot(h,a)
+
+waitForRendering()
@@ -2,14 +2,22 @@ import os
 import json
 
 import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
 
 import DevTools.Plotter.CMS_lumi as CMS_lumi
 import DevTools.Plotter.tdrstyle as tdrstyle
+import argparse
+from CombineLimits.Plotter.PlotterBase import addRenderArguments, startRendering, waitForRendering, printCanvas
 
 ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 tdrstyle.setTDRStyle()
 
+parser = argparse.ArgumentParser(description='Plot the fitDiagnostics postfit distributions')
+addRenderArguments(parser,formats=['png','pdf'])
+args = parser.parse_args()
+startRendering(args)
+
 isprelim = False
 br = 0.0005
 
@@ -122,8 +130,7 @@ def plot(h,a,dim,region,mode,doUnc):
     
     legend.Draw()
     
-    canvas.Print('haa_mm_h_{}_{}_{}_{}_{}{}.png'.format(region,var,mode,h,a,'' if doUnc else '_noUnc'))
-    canvas.Print('haa_mm_h_{}_{}_{}_{}_{}{}.pdf'.format(region,var,mode,h,a,'' if doUnc else '_noUnc'))
+    printCanvas(canvas,'haa_mm_h_{}_{}_{}_{}_{}{}'.format(region,var,mode,h,a,'' if doUnc else '_noUnc'))
 
 for doUnc in [True,False]:
     for mode in ['fit_s','fit_b']:
@@ -133,3 +140,4 @@ for doUnc in [True,False]:
                     plot(h,a,'x',region,mode,doUnc)
                     if region!='control': plot(h,a,'y',region,mode,doUnc)
 
+waitForRendering()
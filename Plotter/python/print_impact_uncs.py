@@ -4,10 +4,13 @@ import numpy as np
 from array import array
 
 import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
 
 import DevTools.Plotter.CMS_lumi as CMS_lumi
 import DevTools.Plotter.tdrstyle as tdrstyle
+import argparse
+from CombineLimits.Plotter.PlotterBase import addRenderArguments, startRendering, waitForRendering, printCanvas
 
 ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 tdrstyle.setTDRStyle()
@@ -17,6 +20,11 @@ CMS_lumi.writeExtraText = True
 CMS_lumi.extraText = 'Preliminary'
 CMS_lumi.lumi_13TeV = "%0.1f fb^{-1}" % (35.9)
 
+parser = argparse.ArgumentParser(description='Plot the uncertainties on r from the impacts')
+addRenderArguments(parser,formats=['png','pdf'])
+args = parser.parse_args()
+startRendering(args)
+
 hmasses = [125,300,750]
 #amasses = [5,7,9,11,13,15,17]
 amasses = [3.6, 4, 4.5, 5, 5.5, 6, 6.5, 7, 7.5, 8, 8.5, 9, 9.5, 10, 10.5, 11, 11.5, 12, 13, 14, 15, 16, 17, 18, 19, 20]
@@ -139,9 +147,8 @@ for name in sorted(pdata):
     legend.AddEntry(graphs['med'][125],'Median (with low and high)','lep')
     legend.AddEntry(graphs['avg'][125],'Average','p')
     legend.Draw()
-    canvas.Print('impact_uncs/{}.png'.format(name))
-    canvas.Print('impact_uncs/{}.pdf'.format(name))
+    printCanvas(canvas,'impact_uncs/{}'.format(name))
 
     if doPrint: print ''
 
-
+waitForRendering()
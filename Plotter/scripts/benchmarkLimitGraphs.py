@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''
+Benchmark LimitPlotter._getGraphs on a 0.1 GeV a mass grid for a number
+of H masses, with and without smoothing, and with the scales evaluated
+per y row as plotLimit2D does. The graphs are compared to the ones
+filled point by point (as _getGraphs used to) with the smoothing of
+TGraphSmooth.
+'''
+import sys
+import time
+import random
+import logging
+import argparse
+
+import numpy as np
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch()
+
+from CombineLimits.Plotter.LimitPlotter import LimitPlotter
+
+logging.basicConfig(level=logging.ERROR, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def buildLimits(h,amasses):
+    '''Smoothly falling limits with 10% noise, {a: [0.025, 0.16, 0.5, 0.84, 0.975, obs]}'''
+    random.seed(h)
+    limits = {}
+    for a in amasses:
+        median = 0.01*h/125.*(1+a/10.)
+        limits[a] = [median*f*(1+0.1*random.gauss(0,1)) for f in [0.5,0.7,1.,1.4,2.]]+[median*(1+0.2*random.gauss(0,1))]
+    return limits
+
+def buildScales(amasses,yvals):
+    '''Scale graphs in y for each a, {a: {'model': TGraph}}'''
+    scales = {}
+    for a in amasses:
+        graph = ROOT.TGraph(len(yvals))
+        for i, y in enumerate(yvals):
+            graph.SetPoint(i,y,1.+0.1*y/yvals[-1]+0.01*a)
+        scales[a] = {'model': graph}
+    return scales
+
+def referenceGraphs(xvals,limits,smooth,scales=None,y=None):
+    '''The expected band graphs filled point by point, smoothed with TGraphSmooth'''
+    n = len(xvals)
+    graphs = [ROOT.TGraph(n) for q in range(5)]
+    for i, x in enumerate(xvals):
+        for q in range(5):
+            graphs[q].SetPoint(i,x,limits[x][q])
+    if smooth:
+        smoothers = [ROOT.TGraphSmooth() for q in range(5)]
+        smoothed = [smoother.SmoothKern(graph,'normal',1.3,n) for smoother, graph in zip(smoothers,graphs)]
+        for i in range(n-2):
+            x = smoothed[0].GetX()[i+1]
+            if x>3 and x<4: continue
+            if x>8.5 and x<11.5: continue
+            for q in range(5):
+                graphs[q].SetPoint(i+1,x,smoothed[q].GetY()[i+1])
+    if scales:
+        for i, x in enumerate(xvals):
+            scale = scales[x]['model'].Eval(y)
+            for q in range(5):
+                graphs[q].SetPoint(i,graphs[q].GetX()[i],graphs[q].GetY()[i]*scale)
+    return graphs
+
+def maxDifference(graph,reference,nrange):
+    return max([abs(graph.GetY()[i]-reference.GetY()[i])/abs(reference.GetY()[i]) for i in nrange])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the limit band graphs')
+    parser.add_argument('--higgs', type=int, nargs='+', default=[125,200,250,300,400,500,750,1000], help='H masses')
+    parser.add_argument('--yrows', type=int, default=50, help='y rows of the scaled (2D) benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    amasses = [round(0.1*a,1) for a in range(36,211)]
+    yvals = [float(y) for y in range(args.yrows)]
+    plotter = LimitPlotter()
+    scales = buildScales(amasses,yvals)
+
+    print '{:>6} {:>10} {:>14} {:>14} {:>12}'.format('H','mode','_getGraphs [ms]','reference [ms]','max rel diff')
+    totals = {}
+    for h in args.higgs:
+        limits = buildLimits(h,amasses)
+        for mode in ['plain','smooth','scaled']:
+            smooth = mode=='smooth'
+            kwargs = {'smooth': smooth}
+            rows = yvals if mode=='scaled' else [None]
+            start = time.time()
+            for r in range(args.repeat):
+                for y in rows:
+                    if mode=='scaled': kwargs.update(scales=scales,modelkey='model',y=y)
+                    graphs = plotter._getGraphs(amasses,limits,detailed=True,**kwargs)
+            newTime = (time.time()-start)/args.repeat
+            start = time.time()
+            for r in range(args.repeat):
+                for y in rows:
+                    reference = referenceGraphs(amasses,limits,smooth,scales if mode=='scaled' else None,y)
+            refTime = (time.time()-start)/args.repeat
+            # expected (0.5) and the lower band edges (0.025, 0.16) for the last row
+            expected, oneSigma, twoSigma = graphs[:3]
+            n = len(amasses)
+            diff = max(maxDifference(expected,reference[2],range(n)),maxDifference(oneSigma,reference[1],range(n)),maxDifference(twoSigma,reference[0],range(n)))
+            print '{:>6} {:>10} {:>14.2f} {:>14.2f} {:>12.2e}'.format(h,mode,newTime*1e3,refTime*1e3,diff)
+            totals[mode] = [t+s for t, s in zip(totals.get(mode,[0.,0.]),[newTime,refTime])]
+    for mode in ['plain','smooth','scaled']:
+        print '{:>6} {:>10} {:>14.2f} {:>14.2f}'.format('all',mode,totals[mode][0]*1e3,totals[mode][1]*1e3)
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)